@@ -0,0 +1,189 @@
+"""
+Controle de admissão e backpressure para os endpoints de geração.
+
+Limita o número de renders em andamento e o tamanho da fila de espera. Quando os
+dois limites estão cheios, a requisição é recusada na hora com 429 e um
+Retry-After calculado a partir da vazão observada, em vez de esperar até o N8N
+desistir e reenviar.
+
+Configuração por variáveis de ambiente:
+    ADMISSAO_MAX_RENDERS  renders simultâneos por worker (padrão: 4)
+    ADMISSAO_MAX_FILA     requisições aguardando vaga (padrão: 20)
+"""
+
+import asyncio
+import json
+import logging
+import math
+import os
+import time
+from collections import deque
+
+import metricas
+
+logger = logging.getLogger(__name__)
+
+# Endpoints sujeitos ao controle de admissão (/health fica sempre de fora)
+CAMINHOS_GERACAO = {
+    "/gerar-documento",
+    "/gerar-documento-base64",
+    "/gerar-documento-whatsapp",
+    "/gerar-documento-zapi",
+    "/jobs"
+}
+
+# Prefixos sujeitos ao controle (endpoint genérico /gerar-documento/{formato})
+PREFIXOS_GERACAO = ("/gerar-documento/",)
+
+
+class Recusado(Exception):
+    """Requisição recusada por excesso de carga"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Servidor sobrecarregado, tente novamente em {retry_after}s")
+        self.retry_after = retry_after
+
+
+class EstimadorVazao:
+    """Vazão recente (conclusões por segundo) e Retry-After derivado dela"""
+
+    def __init__(self, janela=60):
+        self.janela = janela
+        self._concluidas = deque(maxlen=10000)
+
+    def registrar(self):
+        self._concluidas.append(time.monotonic())
+
+    def vazao(self):
+        agora = time.monotonic()
+        while self._concluidas and agora - self._concluidas[0] > self.janela:
+            self._concluidas.popleft()
+        if not self._concluidas:
+            return 0.0
+        decorrido = max(1.0, min(self.janela, agora - self._concluidas[0]))
+        return len(self._concluidas) / decorrido
+
+    def retry_after(self, pendentes):
+        """Segundos estimados para escoar os pendentes com a vazão observada"""
+        vazao = self.vazao()
+        if vazao <= 0:
+            return 1
+        return max(1, min(120, math.ceil(pendentes / vazao)))
+
+
+class ControleAdmissao:
+    """Semáforo de renders com fila limitada e estimativa de vazão"""
+
+    def __init__(self, max_em_andamento=4, max_fila=20, janela=60):
+        self.max_em_andamento = max_em_andamento
+        self.max_fila = max_fila
+        self.em_andamento = 0
+        self.aguardando = 0
+        self.admitidas = 0
+        self.recusadas = 0
+        self._semaforo = None
+        self.estimador = EstimadorVazao(janela)
+
+    @classmethod
+    def do_ambiente(cls):
+        return cls(
+            max_em_andamento=int(os.environ.get("ADMISSAO_MAX_RENDERS", 4)),
+            max_fila=int(os.environ.get("ADMISSAO_MAX_FILA", 20))
+        )
+
+    @property
+    def semaforo(self):
+        # Criado sob demanda para ficar no loop do worker, não no do processo mestre
+        if self._semaforo is None:
+            self._semaforo = asyncio.Semaphore(self.max_em_andamento)
+        return self._semaforo
+
+    def calcular_retry_after(self):
+        return self.estimador.retry_after(self.aguardando + self.em_andamento + 1)
+
+    async def entrar(self):
+        if self.semaforo.locked() and self.aguardando >= self.max_fila:
+            self.recusadas += 1
+            metricas.incrementar("admissao_recusadas")
+            raise Recusado(self.calcular_retry_after())
+
+        self.aguardando += 1
+        inicio = time.perf_counter()
+        try:
+            await self.semaforo.acquire()
+        finally:
+            self.aguardando -= 1
+
+        metricas.registrar_tempo("admissao_espera", time.perf_counter() - inicio)
+        self.em_andamento += 1
+        self.admitidas += 1
+        metricas.incrementar("admissao_admitidas")
+
+    def sair(self):
+        self.em_andamento -= 1
+        self.estimador.registrar()
+        self.semaforo.release()
+
+    def exportar(self):
+        return {
+            "em_andamento": self.em_andamento,
+            "fila": self.aguardando,
+            "max_em_andamento": self.max_em_andamento,
+            "max_fila": self.max_fila,
+            "admitidas": self.admitidas,
+            "recusadas": self.recusadas,
+            "vazao_por_segundo": round(self.estimador.vazao(), 3)
+        }
+
+
+class MiddlewareAdmissao:
+    """Middleware ASGI que aplica o controle de admissão aos POSTs de geração"""
+
+    def __init__(self, app, controle, caminhos=None, prefixos=None):
+        self.app = app
+        self.controle = controle
+        self.caminhos = caminhos or CAMINHOS_GERACAO
+        self.prefixos = prefixos or PREFIXOS_GERACAO
+
+    def _controlado(self, caminho):
+        return caminho in self.caminhos or caminho.startswith(self.prefixos)
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope.get("method") != "POST"
+            or not self._controlado(scope.get("path", ""))
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await self.controle.entrar()
+        except Recusado as e:
+            logger.warning(f"🚦 Requisição recusada em {scope['path']}: retry em {e.retry_after}s")
+            await self._responder_429(send, e)
+            return
+
+        try:
+            with metricas.medir_etapa("requisicao_geracao", memoria=False):
+                await self.app(scope, receive, send)
+        finally:
+            self.controle.sair()
+
+    async def _responder_429(self, send, erro):
+        corpo = json.dumps({
+            "success": False,
+            "detail": str(erro),
+            "retry_after": erro.retry_after
+        }, ensure_ascii=False).encode("utf-8")
+
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(corpo)).encode("ascii")),
+                (b"retry-after", str(erro.retry_after).encode("ascii"))
+            ]
+        })
+        await send({"type": "http.response.body", "body": corpo})
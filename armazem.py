@@ -0,0 +1,147 @@
+"""
+Armazém local de documentos endereçado por conteúdo.
+
+Com o armazém ativo, os documentos renderizados são gravados uma vez em disco
+(nome = sha256 do conteúdo) e as respostas JSON levam só um download_url de
+vida curta em vez do base64 (que infla o documento em ~33%). O download é
+servido por GET /documentos/{hash} com ETag forte (o próprio hash), Range e
+envio sem cópia (resposta_arquivo.py). Downloads repetidos não renderizam nada.
+
+O download_url é assinado (HMAC) com o hash, o nome do arquivo e o instante de
+expiração; os arquivos ficam no disco pelo TTL, renovado a cada novo render
+do mesmo conteúdo.
+
+Configuração por variáveis de ambiente:
+    ARMAZEM_DIR          diretório do armazém (vazio = desativado, respostas com base64)
+    ARMAZEM_TTL_SEGUNDOS retenção dos arquivos (padrão: 3600)
+    ARMAZEM_URL_TTL      validade do download_url em segundos (padrão: 900)
+    ARMAZEM_URL_BASE     prefixo absoluto do link, ex.: https://api.exemplo.com (padrão: relativo)
+    ARMAZEM_SEGREDO      chave da assinatura (obrigatória com mais de um container)
+    ARMAZEM_X_ACCEL      prefixo interno do nginx para X-Accel-Redirect (ex.: /_armazem/)
+"""
+
+import asyncio
+import hashlib
+import hmac
+import logging
+import os
+import secrets
+import time
+from urllib.parse import quote
+
+import metricas
+
+logger = logging.getLogger(__name__)
+
+
+class ArmazemDocumentos:
+    """Arquivos por sha256 do conteúdo, com TTL e links assinados"""
+
+    def __init__(self, diretorio, ttl=3600, ttl_url=900, url_base="", segredo=None, x_accel=None):
+        self.diretorio = diretorio
+        self.ttl = ttl
+        self.ttl_url = ttl_url
+        self.url_base = url_base.rstrip("/")
+        self.segredo = (segredo or secrets.token_hex(32)).encode("utf-8")
+        self.x_accel = x_accel
+        os.makedirs(diretorio, exist_ok=True)
+
+    @classmethod
+    def do_ambiente(cls):
+        diretorio = os.environ.get("ARMAZEM_DIR")
+        if not diretorio:
+            return None
+        segredo = os.environ.get("ARMAZEM_SEGREDO")
+        if not segredo:
+            logger.warning("⚠️ ARMAZEM_SEGREDO não definido: links assinados valem só neste processo e nos workers dele")
+        return cls(
+            diretorio,
+            ttl=int(os.environ.get("ARMAZEM_TTL_SEGUNDOS", 3600)),
+            ttl_url=int(os.environ.get("ARMAZEM_URL_TTL", 900)),
+            url_base=os.environ.get("ARMAZEM_URL_BASE", ""),
+            segredo=segredo,
+            x_accel=os.environ.get("ARMAZEM_X_ACCEL")
+        )
+
+    def caminho(self, hash_documento):
+        """Caminho do arquivo do hash no armazém (pode não existir)"""
+        return os.path.join(self.diretorio, hash_documento[:2], hash_documento)
+
+    def guardar(self, conteudo):
+        """Grava o conteúdo (se ainda não existir) e devolve o hash"""
+        hash_documento = hashlib.sha256(conteudo).hexdigest()
+        caminho = self.caminho(hash_documento)
+        try:
+            # Já existe: só renova o TTL
+            os.utime(caminho)
+            metricas.incrementar("armazem_reaproveitados")
+            return hash_documento
+        except FileNotFoundError:
+            pass
+
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        temporario = f"{caminho}.{os.getpid()}.tmp"
+        with open(temporario, "wb") as f:
+            f.write(conteudo)
+        os.replace(temporario, caminho)
+        metricas.incrementar("armazem_gravados")
+        return hash_documento
+
+    def localizar(self, hash_documento):
+        """Caminho do arquivo ou None se ausente/expirado"""
+        if len(hash_documento) != 64 or not all(c in "0123456789abcdef" for c in hash_documento):
+            return None
+        caminho = self.caminho(hash_documento)
+        try:
+            if time.time() - os.path.getmtime(caminho) > self.ttl:
+                return None
+        except OSError:
+            return None
+        return caminho
+
+    def _assinatura(self, hash_documento, expira, nome):
+        mensagem = f"{hash_documento}:{expira}:{nome}".encode("utf-8")
+        return hmac.new(self.segredo, mensagem, hashlib.sha256).hexdigest()[:32]
+
+    def verificar(self, hash_documento, expira, nome, assinatura):
+        """True se o link é autêntico e ainda não expirou"""
+        if not hmac.compare_digest(self._assinatura(hash_documento, expira, nome), assinatura or ""):
+            return False
+        return expira >= int(time.time())
+
+    def publicar(self, conteudo, nome):
+        """Guarda o documento e devolve o download_url assinado"""
+        with metricas.medir_etapa("armazem_publicar"):
+            hash_documento = self.guardar(conteudo)
+        expira = int(time.time()) + self.ttl_url
+        assinatura = self._assinatura(hash_documento, expira, nome)
+        return (
+            f"{self.url_base}/documentos/{hash_documento}"
+            f"?nome={quote(nome)}&expira={expira}&assinatura={assinatura}"
+        )
+
+    def caminho_x_accel(self, hash_documento):
+        if not self.x_accel:
+            return None
+        return f"{self.x_accel.rstrip('/')}/{hash_documento[:2]}/{hash_documento}"
+
+    def limpar_expirados(self):
+        removidos = 0
+        limite = time.time() - self.ttl
+        for raiz, _, arquivos in os.walk(self.diretorio):
+            for nome in arquivos:
+                caminho = os.path.join(raiz, nome)
+                try:
+                    if os.path.getmtime(caminho) < limite:
+                        os.remove(caminho)
+                        removidos += 1
+                except OSError:
+                    continue
+        if removidos:
+            logger.info(f"🧹 {removidos} documento(s) expirado(s) removido(s) do armazém")
+        return removidos
+
+    async def limpar_periodicamente(self, intervalo=300):
+        while True:
+            await asyncio.sleep(intervalo)
+            await asyncio.to_thread(self.limpar_expirados)
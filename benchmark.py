@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Benchmark do backend de render, sem HTTP.
+
+Dispara renders concorrentes (threads, como os endpoints def síncronos) contra
+cada cenário e mede vazão e latência:
+
+    thread     motor chamado direto na thread da requisição
+    pool       pool de processos, um item por envio
+    microlote  pool de processos com micro-batching (janela e tamanho máximo)
+    nivel      motor direto na thread com cada nível de deflate (RENDER_NIVEL_DEFLATE)
+
+Uso:
+    python benchmark.py
+    python benchmark.py --requisicoes 400 --concorrencia 32 --workers 4 --motor zip
+    python benchmark.py --cenarios pool,microlote --janela-ms 2,5,10 --lote-max 8,16
+    python benchmark.py --cenarios nivel --niveis 0,1,6,9 --motor docx
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import modelo_compilado
+import motor_zip
+from microlote import MicroLote
+from pool_render import PoolRender
+
+DADOS_BASE = {
+    "NOME": "Cliente Benchmark",
+    "EMAIL": "benchmark@exemplo.com",
+    "CPF": "000.000.000-00",
+    "ENDERECO": "Rua Exemplo, 1",
+    "CEP": "00000-000",
+    "TELEFONE": "(00) 00000-0000",
+    "VALOR": "1.000,00",
+    "PARCELAS": "10",
+    "FORMA_PAGAMENTO": "PIX",
+    "DATA": "01/01/2026",
+    "HORA": "00:00:00"
+}
+
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+def medir(renderizar, caminho_modelo, requisicoes, concorrencia):
+    """Executa os renders concorrentes e devolve (docs/s, p50 ms, p95 ms, KB médio)"""
+    latencias = []
+    tamanhos = []
+
+    def uma(i):
+        dados = dict(DADOS_BASE, NOME=f"Cliente Benchmark {i}")
+        inicio = time.perf_counter()
+        conteudo = renderizar(caminho_modelo, dados)
+        latencias.append(time.perf_counter() - inicio)
+        tamanhos.append(len(conteudo))
+
+    # Uma rodada curta de aquecimento (processos do pool, modelo carregado)
+    with ThreadPoolExecutor(concorrencia) as executor:
+        list(executor.map(uma, range(min(concorrencia, requisicoes))))
+    latencias.clear()
+    tamanhos.clear()
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(concorrencia) as executor:
+        list(executor.map(uma, range(requisicoes)))
+    duracao = time.perf_counter() - inicio
+
+    return (
+        requisicoes / duracao,
+        percentil(latencias, 50) * 1000,
+        percentil(latencias, 95) * 1000,
+        sum(tamanhos) / len(tamanhos) / 1024
+    )
+
+
+def motor_direto(motor):
+    if motor == "zip":
+        return lambda caminho, dados: motor_zip.renderizar(modelo_compilado.obter_modelo(caminho), dados)
+    from render_docx import renderizar_com_python_docx
+    return renderizar_com_python_docx
+
+
+def executar(args):
+    caminho_modelo = args.modelo or modelo_compilado.encontrar_modelo()
+    if not caminho_modelo:
+        raise SystemExit("❌ Nenhum modelo encontrado (template.docx / modelo.docx)")
+    modelo_compilado.obter_modelo(caminho_modelo)
+
+    cenarios = args.cenarios.split(",")
+    janelas = [float(j) for j in args.janela_ms.split(",")]
+    tamanhos = [int(t) for t in args.lote_max.split(",")]
+    niveis = [int(n) for n in args.niveis.split(",")]
+
+    print(f"📊 {args.requisicoes} render(s), concorrência {args.concorrencia}, motor {args.motor}, "
+          f"{args.workers} processo(s) no pool, modelo {caminho_modelo}")
+    print(f"{'cenário':<28} {'docs/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'KB':>8}")
+
+    def linha(nome, resultado):
+        vazao, p50, p95, tamanho = resultado
+        print(f"{nome:<28} {vazao:>8.1f} {p50:>8.1f} {p95:>8.1f} {tamanho:>8.0f}")
+
+    if "thread" in cenarios:
+        linha("thread", medir(motor_direto(args.motor), caminho_modelo, args.requisicoes, args.concorrencia))
+
+    if "pool" in cenarios:
+        pool = PoolRender(args.workers, args.motor)
+        try:
+            linha("pool", medir(pool.renderizar, caminho_modelo, args.requisicoes, args.concorrencia))
+        finally:
+            pool.encerrar()
+
+    if "microlote" in cenarios:
+        for janela in janelas:
+            for tamanho in tamanhos:
+                pool = PoolRender(args.workers, args.motor)
+                pool.microlote = MicroLote(pool.enviar_lote, janela_ms=janela, tamanho_maximo=tamanho)
+                try:
+                    resultado = medir(pool.renderizar, caminho_modelo, args.requisicoes, args.concorrencia)
+                finally:
+                    pool.encerrar()
+                linha(f"microlote {janela:g}ms x{tamanho}", resultado)
+
+    if "nivel" in cenarios:
+        # Só as partes alteradas são recomprimidas: o nível troca CPU por bytes nelas
+        original = modelo_compilado.NIVEL_DEFLATE
+        try:
+            for nivel in niveis:
+                modelo_compilado.NIVEL_DEFLATE = nivel
+                resultado = medir(motor_direto(args.motor), caminho_modelo, args.requisicoes, args.concorrencia)
+                linha(f"nível deflate {nivel}", resultado)
+        finally:
+            modelo_compilado.NIVEL_DEFLATE = original
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark do backend de render")
+    parser.add_argument("--requisicoes", type=int, default=200)
+    parser.add_argument("--concorrencia", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="processos do pool")
+    parser.add_argument("--motor", choices=("zip", "docx"), default="zip")
+    parser.add_argument("--modelo", default=None)
+    parser.add_argument("--cenarios", default="thread,pool,microlote")
+    parser.add_argument("--janela-ms", default="5", help="janelas do micro-batcher, separadas por vírgula")
+    parser.add_argument("--lote-max", default="16", help="tamanhos máximos de lote, separados por vírgula")
+    parser.add_argument("--niveis", default="0,1,6,9", help="níveis de deflate do cenário nivel, separados por vírgula")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    logging.disable(logging.INFO)
+    executar(args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,214 @@
+"""
+Cache de documentos renderizados em disco, compartilhado entre processos.
+
+Os documentos ficam em um banco SQLite (modo WAL) dentro de um diretório local,
+indexados por uma chave de conteúdo: hash do modelo + campos do contrato que o
+modelo usa. Qualquer worker do container responde a uma retentativa do mesmo
+contrato sem renderizar de novo. Junto do documento pode ficar o trecho gzip
+do seu base64 (compressao.py), usado pelas respostas JSON comprimidas. Quando o
+tamanho total passa do limite, os documentos acessados há mais tempo são
+removidos.
+
+Configuração por variáveis de ambiente:
+    CACHE_RENDER_DIR     diretório do cache (vazio = cache desativado)
+    CACHE_RENDER_MAX_MB  tamanho máximo em MB (padrão: 256)
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import imagens
+from repeticao import preparar_listas
+
+logger = logging.getLogger(__name__)
+
+
+def chave_render(modelo, dados, variante=""):
+    """
+    Calcula a chave de conteúdo de um documento renderizado
+
+    Só entram na chave os campos que o modelo realmente usa: campos como HORA ou
+    TIMESTAMP não impedem o acerto quando o modelo não os referencia. Listas de
+    seções repetidas ({{PARCELA.VALOR}}) entram inteiras, já derivadas. Imagens
+    ({{IMG:NOME}}) entram pelo hash do conteúdo (recebido ou asset).
+    """
+    usados = modelo.todos_placeholders
+    listas = {placeholder.split(".", 1)[0] for placeholder in usados if "." in placeholder}
+    if listas:
+        dados = preparar_listas(dados)
+        usados = usados | listas
+    relevantes = {chave: valor for chave, valor in dados.items() if chave in usados}
+    for placeholder in usados:
+        if imagens.eh_chave_imagem(placeholder):
+            nome = placeholder.split(":")[1].strip().upper()
+            relevantes[f"{imagens.PREFIXO_CHAVE}{nome}"] = imagens.identificar(nome, dados)
+    canonico = json.dumps(relevantes, sort_keys=True, ensure_ascii=False, default=str)
+    h = hashlib.sha256()
+    h.update(modelo.hash.encode("ascii"))
+    h.update(b"\0")
+    h.update(variante.encode("utf-8"))
+    h.update(b"\0")
+    h.update(canonico.encode("utf-8"))
+    return h.hexdigest()
+
+
+class CacheRender:
+    """Cache SQLite seguro para leitores e escritores em processos diferentes"""
+
+    def __init__(self, diretorio, tamanho_maximo):
+        self.diretorio = diretorio
+        self.tamanho_maximo = tamanho_maximo
+        self.caminho = os.path.join(diretorio, "render_cache.sqlite3")
+        self._local = threading.local()
+        self.acertos = 0
+        self.falhas = 0
+
+        os.makedirs(diretorio, exist_ok=True)
+        conexao = self._conexao()
+        conexao.execute(
+            "CREATE TABLE IF NOT EXISTS documentos ("
+            " chave TEXT PRIMARY KEY,"
+            " conteudo BLOB NOT NULL,"
+            " tamanho INTEGER NOT NULL,"
+            " criado REAL NOT NULL,"
+            " acessado REAL NOT NULL)"
+        )
+        conexao.execute("CREATE INDEX IF NOT EXISTS idx_documentos_acessado ON documentos (acessado)")
+        colunas = {linha[1] for linha in conexao.execute("PRAGMA table_info(documentos)")}
+        if "base64_gzip" not in colunas:
+            # Bancos criados antes da compressão das respostas JSON
+            conexao.execute("ALTER TABLE documentos ADD COLUMN base64_gzip BLOB")
+
+    def _conexao(self):
+        """Uma conexão por thread e por processo (conexões não sobrevivem ao fork)"""
+        conexao = getattr(self._local, "conexao", None)
+        if conexao is None or self._local.pid != os.getpid():
+            conexao = sqlite3.connect(self.caminho, timeout=10, isolation_level=None)
+            conexao.execute("PRAGMA journal_mode=WAL")
+            conexao.execute("PRAGMA synchronous=NORMAL")
+            conexao.execute("PRAGMA mmap_size=268435456")
+            self._local.conexao = conexao
+            self._local.pid = os.getpid()
+        return conexao
+
+    def obter(self, chave):
+        """Retorna os bytes do documento ou None"""
+        try:
+            conexao = self._conexao()
+            linha = conexao.execute(
+                "SELECT conteudo FROM documentos WHERE chave = ?", (chave,)
+            ).fetchone()
+            if linha is None:
+                self.falhas += 1
+                return None
+
+            conexao.execute("UPDATE documentos SET acessado = ? WHERE chave = ?", (time.time(), chave))
+            self.acertos += 1
+            return bytes(linha[0])
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ Erro ao ler cache de render: {e}")
+            return None
+
+    def guardar(self, chave, conteudo):
+        """Grava o documento e remove os mais antigos se passar do limite"""
+        if len(conteudo) > self.tamanho_maximo:
+            return
+        try:
+            conexao = self._conexao()
+            agora = time.time()
+            conexao.execute("BEGIN IMMEDIATE")
+            try:
+                conexao.execute(
+                    "INSERT OR REPLACE INTO documentos (chave, conteudo, tamanho, criado, acessado)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    (chave, sqlite3.Binary(conteudo), len(conteudo), agora, agora)
+                )
+                self._remover_excedente(conexao)
+                conexao.execute("COMMIT")
+            except BaseException:
+                conexao.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ Erro ao gravar cache de render: {e}")
+
+    def obter_base64_gzip(self, chave):
+        """Trecho gzip do base64 do documento (compressao.TrechoGzip serializado) ou None"""
+        try:
+            linha = self._conexao().execute(
+                "SELECT base64_gzip FROM documentos WHERE chave = ?", (chave,)
+            ).fetchone()
+            return bytes(linha[0]) if linha and linha[0] is not None else None
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ Erro ao ler cache de render: {e}")
+            return None
+
+    def guardar_base64_gzip(self, chave, dados):
+        """Guarda o trecho gzip junto do documento já em cache; entra no tamanho da linha"""
+        try:
+            conexao = self._conexao()
+            conexao.execute("BEGIN IMMEDIATE")
+            try:
+                conexao.execute(
+                    "UPDATE documentos SET base64_gzip = ?, tamanho = LENGTH(conteudo) + ?"
+                    " WHERE chave = ?",
+                    (sqlite3.Binary(dados), len(dados), chave)
+                )
+                self._remover_excedente(conexao)
+                conexao.execute("COMMIT")
+            except BaseException:
+                conexao.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ Erro ao gravar cache de render: {e}")
+
+    def _remover_excedente(self, conexao):
+        total = conexao.execute("SELECT COALESCE(SUM(tamanho), 0) FROM documentos").fetchone()[0]
+        if total <= self.tamanho_maximo:
+            return
+
+        removidos = 0
+        for chave, tamanho in conexao.execute(
+            "SELECT chave, tamanho FROM documentos ORDER BY acessado ASC"
+        ).fetchall():
+            if total <= self.tamanho_maximo:
+                break
+            conexao.execute("DELETE FROM documentos WHERE chave = ?", (chave,))
+            total -= tamanho
+            removidos += 1
+
+        logger.info(f"🧹 Cache de render: {removidos} documento(s) removido(s) por tamanho")
+
+    def estatisticas(self):
+        conexao = self._conexao()
+        quantidade, total = conexao.execute(
+            "SELECT COUNT(*), COALESCE(SUM(tamanho), 0) FROM documentos"
+        ).fetchone()
+        return {
+            "documentos": quantidade,
+            "bytes": total,
+            "limite_bytes": self.tamanho_maximo,
+            "acertos": self.acertos,
+            "falhas": self.falhas
+        }
+
+
+_cache = None
+_cache_configurado = False
+
+
+def obter_cache():
+    """Retorna o cache configurado pelo ambiente ou None se desativado"""
+    global _cache, _cache_configurado
+    if not _cache_configurado:
+        _cache_configurado = True
+        diretorio = os.environ.get("CACHE_RENDER_DIR")
+        if diretorio:
+            tamanho_maximo = int(float(os.environ.get("CACHE_RENDER_MAX_MB", 256)) * 1024 * 1024)
+            _cache = CacheRender(diretorio, tamanho_maximo)
+            logger.info(f"🗄️ Cache de render em disco: {diretorio} (limite {tamanho_maximo} bytes)")
+    return _cache
@@ -0,0 +1,255 @@
+"""
+Codificadores de saída do pipeline de geração.
+
+Cada classe registrada aqui vira um formato aceito por PipelineRender.gerar()
+e pelo endpoint genérico POST /gerar-documento/{formato}. Os codificadores
+trabalham direto sobre os bytes renderizados, sem reler arquivo nem copiar o
+buffer. Com o armazém ativo (armazem.py), os formatos JSON levam download_url e
+omitem o base64. Os formatos JSON comprimem o corpo conforme o Accept-Encoding
+(compressao.py).
+"""
+
+import base64
+import io
+import logging
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+from datetime import datetime
+
+from fastapi import HTTPException
+
+import compressao
+import metricas
+from pipeline import Codificador, registrar_codificador
+from resposta_arquivo import RespostaArquivo, RespostaMemoria
+from resposta_json import RespostaJSONRapida
+
+logger = logging.getLogger(__name__)
+
+
+def codificar_base64(conteudo):
+    with metricas.medir_etapa("codificacao_base64"):
+        return base64.b64encode(conteudo).decode('ascii')
+
+
+@registrar_codificador
+class CodificadorBinario(Codificador):
+    """DOCX binário como anexo (POST /gerar-documento)"""
+
+    nome = "binario"
+    servir_do_disco = True
+    etag_forte = True
+
+    def codificar(self, documento, filename):
+        headers = {
+            "Content-Disposition": f"attachment; filename={filename}",
+            "Cache-Control": "no-cache",
+            "X-Filename": filename,
+            "X-File-Size": str(documento.tamanho)
+        }
+        if documento.caminho:
+            # Documento no armazém: sendfile/X-Accel, com ETag e Range
+            return RespostaArquivo(
+                documento.caminho,
+                media_type=self.media_type,
+                etag=documento.etag or f'"{documento.hash}"',
+                headers=headers,
+                x_accel=documento.x_accel
+            )
+        if documento.etag:
+            headers["ETag"] = documento.etag
+        return RespostaMemoria(documento.conteudo, self.media_type, headers)
+
+
+class CodificadorJSON(Codificador):
+    """Formato JSON com o base64 do documento, comprimido conforme o Accept-Encoding"""
+
+    entrega_por_url = True
+    comprimir = True
+
+    def base64(self, documento):
+        """Base64 do documento, ou o marcador que o compressao troca pelo trecho comprimido"""
+        if documento.codificacao:
+            return compressao.marcar_base64(documento)
+        return codificar_base64(documento.conteudo)
+
+    def responder(self, corpo, documento):
+        return compressao.resposta_json(corpo, documento, self.nome)
+
+
+@registrar_codificador
+class CodificadorBase64(CodificadorJSON):
+    """JSON no formato de DocumentoResponse (POST /gerar-documento-base64)"""
+
+    nome = "base64"
+
+    def codificar(self, documento, filename):
+        return self.responder({
+            "success": True,
+            "message": "Documento gerado com sucesso",
+            "filename": filename,
+            "file_size": documento.tamanho,
+            "mime_type": self.media_type,
+            "base64_content": None if documento.download_url else self.base64(documento),
+            "download_url": documento.download_url,
+            "dados_extraidos": documento.dados_extraidos,
+            "timestamp": datetime.now().isoformat()
+        }, documento)
+
+
+@registrar_codificador
+class CodificadorWhatsApp(CodificadorJSON):
+    """Envelope para envio via WhatsApp (POST /gerar-documento-whatsapp)"""
+
+    nome = "whatsapp"
+
+    def nome_arquivo(self, dados, agora):
+        # Nome mais curto para WhatsApp
+        nome_cliente = dados.get("NOME", "cliente").replace(" ", "_")
+        nome_cliente = re.sub(r'[^\w\-_.]', '', nome_cliente)[:15]
+        return f"doc_{nome_cliente}_{agora.strftime('%d%m%Y_%H%M')}.docx"
+
+    def codificar(self, documento, filename):
+        dados = documento.dados_extraidos
+
+        # Caption curta para WhatsApp
+        nome_curto = dados.get('NOME', 'Cliente')[:30]
+        caption = f"📄 {nome_curto}\n📅 {dados.get('DATA', 'N/A')} {dados.get('HORA', 'N/A')}"
+
+        arquivo = {
+            "filename": filename,
+            "mimetype": self.media_type,
+            "caption": caption
+        }
+        if documento.download_url:
+            arquivo["url"] = documento.download_url
+            tamanho_base64 = 0
+        else:
+            arquivo["base64"] = self.base64(documento)
+            tamanho_base64 = 4 * ((documento.tamanho + 2) // 3)
+            logger.info(f"Base64 gerado: {tamanho_base64} caracteres")
+
+        return self.responder({
+            "success": True,
+            "status": "document_ready",
+            "message": "Documento gerado com sucesso para WhatsApp",
+            "file": dict(arquivo, size=documento.tamanho),
+            # Formato alternativo para diferentes APIs
+            "whatsapp_data": arquivo,
+            "document_info": {
+                "filename": filename,
+                "file_size": documento.tamanho,
+                "mime_type": self.media_type,
+                "base64_length": tamanho_base64,
+                "download_url": documento.download_url
+            },
+            "dados_extraidos": dados,
+            "timestamp": datetime.now().isoformat(),
+            "environment": "production"
+        }, documento)
+
+    def erro(self, excecao):
+        return RespostaJSONRapida({
+            "success": False,
+            "status": "error",
+            "message": f"Erro na geração do documento: {str(excecao)}",
+            "timestamp": datetime.now().isoformat()
+        })
+
+
+@registrar_codificador
+class CodificadorZApi(CodificadorJSON):
+    """Formato exato esperado pela Z-API (POST /gerar-documento-zapi)"""
+
+    nome = "zapi"
+
+    def nome_arquivo(self, dados, agora):
+        nome_cliente = re.sub(r'[^\w]', '', dados.get("NOME", "cliente"))[:10]
+        return f"{nome_cliente}_{agora.strftime('%d%m_%H%M')}.docx"
+
+    def codificar(self, documento, filename):
+        resposta = {
+            "success": True,
+            "filename": filename,
+            "size": documento.tamanho,
+            "mimetype": self.media_type,
+            "dados": documento.dados_extraidos,
+            "timestamp": datetime.now().isoformat()
+        }
+        if documento.download_url:
+            # A Z-API aceita URL no campo document do send-document
+            resposta["download_url"] = documento.download_url
+        else:
+            resposta["base64"] = self.base64(documento)
+            logger.info(f"✅ Base64: {4 * ((documento.tamanho + 2) // 3)} caracteres")
+        logger.info(f"✅ Arquivo: {filename} ({documento.tamanho} bytes)")
+
+        return self.responder(resposta, documento)
+
+    def erro(self, excecao):
+        return RespostaJSONRapida({
+            "success": False,
+            "error": str(excecao),
+            "timestamp": datetime.now().isoformat()
+        })
+
+
+def docx_para_pdf(conteudo):
+    """
+    Converte o DOCX em PDF: LibreOffice quando instalado (fiel ao layout),
+    senão uma versão só com o texto dos parágrafos via reportlab
+    """
+    soffice = shutil.which("soffice") or shutil.which("libreoffice")
+    if soffice:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            origem = os.path.join(temp_dir, "documento.docx")
+            with open(origem, "wb") as f:
+                f.write(conteudo)
+            subprocess.run(
+                [soffice, "--headless", "--convert-to", "pdf", "--outdir", temp_dir, origem],
+                check=True, capture_output=True, timeout=120
+            )
+            with open(os.path.join(temp_dir, "documento.pdf"), "rb") as f:
+                return f.read()
+
+    try:
+        from reportlab.lib.pagesizes import A4
+        from reportlab.lib.styles import getSampleStyleSheet
+        from reportlab.platypus import Paragraph, SimpleDocTemplate
+    except ImportError:
+        raise HTTPException(status_code=501, detail="Conversão para PDF indisponível (instale LibreOffice ou reportlab)")
+
+    from docx import Document
+    from xml.sax.saxutils import escape
+
+    doc = Document(io.BytesIO(conteudo))
+    estilo = getSampleStyleSheet()["Normal"]
+    saida = io.BytesIO()
+    SimpleDocTemplate(saida, pagesize=A4).build([
+        Paragraph(escape(paragrafo.text), estilo) for paragrafo in doc.paragraphs if paragrafo.text.strip()
+    ])
+    return saida.getvalue()
+
+
+@registrar_codificador
+class CodificadorPdf(Codificador):
+    """Documento convertido para PDF (POST /gerar-documento/pdf)"""
+
+    nome = "pdf"
+    media_type = "application/pdf"
+
+    def nome_arquivo(self, dados, agora):
+        return super().nome_arquivo(dados, agora)[:-len(".docx")] + ".pdf"
+
+    def codificar(self, documento, filename):
+        with metricas.medir_etapa("conversao_pdf"):
+            pdf = docx_para_pdf(documento.conteudo)
+        return RespostaMemoria(pdf, self.media_type, {
+            "Content-Disposition": f"attachment; filename={filename}",
+            "Cache-Control": "no-cache",
+            "X-Filename": filename,
+            "X-File-Size": str(len(pdf))
+        })
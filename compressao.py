@@ -0,0 +1,230 @@
+"""
+Compressão negociada (Accept-Encoding) das respostas JSON de geração.
+
+O corpo dos formatos JSON (base64, whatsapp, zapi) é quase todo o base64 do
+DOCX. O DOCX já é um zip, mas o base64 usa só 64 símbolos por byte de texto e o
+Huffman do deflate recupera ~25% do tamanho. Só o que muda a cada requisição
+(timestamp, nome do arquivo, dados extraídos) é comprimido na hora: o base64
+entra como um trecho de deflate bruto terminado em Z_FULL_FLUSH (alinhado em
+byte e sem referências ao que vem antes), e trechos assim podem ser emendados
+num único stream gzip válido. O CRC32 do corpo inteiro sai da combinação dos
+CRCs das partes.
+
+Com o cache de render ativo (CACHE_RENDER_DIR), o trecho do base64 é guardado
+junto com o documento: a repetição de um contrato devolve o corpo gzip sem
+codificar o base64 nem comprimir de novo. Sem o cache, o trecho é feito a cada
+resposta só com Huffman (Z_HUFFMAN_ONLY), ~3x mais rápido e quase a mesma taxa.
+
+Brotli (se o pacote brotli estiver instalado) não permite emendar trechos: o
+corpo inteiro é comprimido a cada resposta. Com gzip e br aceitos no mesmo
+peso, o gzip é preferido por aproveitar o trecho em cache.
+
+A economia por formato aparece em /metrics (medidor "compressao").
+
+Configuração por variáveis de ambiente:
+    COMPRESSAO                   0 = respostas sempre sem compressão (padrão: ligada)
+    COMPRESSAO_NIVEL             nível do gzip (padrão: 6)
+    COMPRESSAO_BROTLI_QUALIDADE  qualidade do brotli (padrão: 5)
+    COMPRESSAO_MINIMO            corpos menores que isso (bytes) vão sem compressão (padrão: 1024)
+"""
+
+import base64
+import os
+import struct
+import threading
+import uuid
+import zlib
+
+from fastapi.responses import Response
+
+import metricas
+from cache_render import obter_cache
+from resposta_json import RespostaJSONRapida, serializar_json
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - depende do ambiente
+    brotli = None
+
+ATIVA = os.environ.get("COMPRESSAO", "1").lower() not in ("0", "false", "nao")
+NIVEL = int(os.environ.get("COMPRESSAO_NIVEL", 6))
+QUALIDADE_BROTLI = int(os.environ.get("COMPRESSAO_BROTLI_QUALIDADE", 5))
+MINIMO = int(os.environ.get("COMPRESSAO_MINIMO", 1024))
+
+# Cabeçalho gzip fixo: deflate, sem nome nem data, SO desconhecido
+CABECALHO_GZIP = b"\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff"
+# Bloco final vazio (BFINAL=1, Huffman fixo, só o fim de bloco)
+BLOCO_FINAL = b"\x03\x00"
+VARY = {"Vary": "Accept-Encoding"}
+
+_trava = threading.Lock()
+_economia = {}
+
+
+def negociar(accept_encoding):
+    """Codificação escolhida para o cabeçalho Accept-Encoding: "gzip", "br" ou None"""
+    if not ATIVA or not accept_encoding:
+        return None
+    pesos = {}
+    for item in accept_encoding.split(","):
+        nome, _, parametros = item.strip().partition(";")
+        peso = 1.0
+        parametro = parametros.strip()
+        if parametro.startswith("q="):
+            try:
+                peso = float(parametro[2:])
+            except ValueError:
+                peso = 0.0
+        pesos[nome.strip().lower()] = peso
+
+    padrao = pesos.get("*", 0.0)
+    candidatos = [("gzip", pesos.get("gzip", padrao))]
+    if brotli is not None:
+        candidatos.append(("br", pesos.get("br", padrao)))
+    # max mantém o primeiro em caso de empate: gzip
+    codificacao, peso = max(candidatos, key=lambda candidato: candidato[1])
+    return codificacao if peso > 0 else None
+
+
+def combinar_crc(crc1, crc2, tamanho2):
+    """CRC32 de A+B a partir de crc(A), crc(B) e len(B) (o CRC é afim nos dados)"""
+    zeros = bytes(tamanho2)
+    return zlib.crc32(zeros, crc1) ^ crc2 ^ zlib.crc32(zeros)
+
+
+class TrechoGzip:
+    """Texto comprimido como deflate bruto emendável, com o CRC32 e o tamanho do original"""
+
+    def __init__(self, dados, crc, tamanho):
+        self.dados = dados
+        self.crc = crc
+        self.tamanho = tamanho
+
+    @classmethod
+    def comprimir(cls, texto, estrategia=zlib.Z_DEFAULT_STRATEGY):
+        compressor = zlib.compressobj(NIVEL, zlib.DEFLATED, -15, 9, estrategia)
+        dados = compressor.compress(texto) + compressor.flush(zlib.Z_FULL_FLUSH)
+        return cls(dados, zlib.crc32(texto), len(texto))
+
+    def serializar(self):
+        return struct.pack("<IQ", self.crc, self.tamanho) + self.dados
+
+    @classmethod
+    def carregar(cls, blob):
+        crc, tamanho = struct.unpack_from("<IQ", blob)
+        return cls(bytes(blob[12:]), crc, tamanho)
+
+
+def gzip_emendado(partes):
+    """Stream gzip de uma sequência de bytes (comprimidos aqui) e TrechoGzip (já prontos)"""
+    saida = [CABECALHO_GZIP]
+    crc = 0
+    tamanho = 0
+    for parte in partes:
+        if not isinstance(parte, TrechoGzip):
+            parte = TrechoGzip.comprimir(parte)
+        saida.append(parte.dados)
+        crc = combinar_crc(crc, parte.crc, parte.tamanho)
+        tamanho += parte.tamanho
+    saida.append(BLOCO_FINAL)
+    saida.append(struct.pack("<II", crc, tamanho & 0xFFFFFFFF))
+    return b"".join(saida)
+
+
+def marcar_base64(documento):
+    """Marcador que ocupa o lugar do base64 no JSON até a montagem do corpo comprimido"""
+    if documento.marcador_base64 is None:
+        documento.marcador_base64 = f"__base64_{uuid.uuid4().hex}__"
+    return documento.marcador_base64
+
+
+def trecho_base64(documento):
+    """(TrechoGzip do base64 do documento, veio do cache?)"""
+    cache = obter_cache() if documento.chave else None
+    if cache is not None:
+        blob = cache.obter_base64_gzip(documento.chave)
+        if blob is not None:
+            return TrechoGzip.carregar(blob), True
+
+    texto = base64.b64encode(documento.conteudo)
+    with metricas.medir_etapa("compressao_base64"):
+        if cache is None:
+            return TrechoGzip.comprimir(texto, zlib.Z_HUFFMAN_ONLY), False
+        trecho = TrechoGzip.comprimir(texto)
+    cache.guardar_base64_gzip(documento.chave, trecho.serializar())
+    return trecho, False
+
+
+def registrar(formato, codificacao, original, enviado, do_cache=False):
+    with _trava:
+        economia = _economia.get(formato)
+        if economia is None:
+            economia = _economia[formato] = {
+                "respostas": 0, "comprimidas": 0, "trechos_do_cache": 0,
+                "bytes_originais": 0, "bytes_enviados": 0, "por_codificacao": {}
+            }
+        economia["respostas"] += 1
+        economia["bytes_originais"] += original
+        economia["bytes_enviados"] += enviado
+        if codificacao:
+            economia["comprimidas"] += 1
+            economia["por_codificacao"][codificacao] = economia["por_codificacao"].get(codificacao, 0) + 1
+        if do_cache:
+            economia["trechos_do_cache"] += 1
+
+
+def exportar():
+    with _trava:
+        return {
+            formato: dict(
+                economia,
+                por_codificacao=dict(economia["por_codificacao"]),
+                economia_pct=round(
+                    (1 - economia["bytes_enviados"] / economia["bytes_originais"]) * 100, 1
+                ) if economia["bytes_originais"] else 0.0
+            )
+            for formato, economia in _economia.items()
+        }
+
+
+def resposta_json(corpo, documento, formato):
+    """
+    Resposta JSON do formato, comprimida conforme documento.codificacao
+
+    O base64 do documento vem marcado no corpo (marcar_base64) e é emendado
+    aqui: trecho gzip pronto, ou o texto do base64 para o brotli.
+    """
+    codificacao = documento.codificacao
+    if codificacao is None:
+        resposta = RespostaJSONRapida(corpo, headers=dict(VARY))
+        registrar(formato, None, len(resposta.body), len(resposta.body))
+        return resposta
+
+    with metricas.medir_etapa("serializacao_json"):
+        serializado = serializar_json(corpo)
+    marcador = documento.marcador_base64
+    pedacos = serializado.split(marcador.encode("ascii")) if marcador else [serializado]
+    tamanho_base64 = 4 * ((documento.tamanho + 2) // 3)
+    original = len(serializado) + (len(pedacos) - 1) * (tamanho_base64 - len(marcador or ""))
+
+    if len(pedacos) == 1 and original < MINIMO:
+        # Sem base64 no corpo (download_url) e pequeno demais para compensar
+        registrar(formato, None, original, original)
+        return Response(serializado, media_type="application/json", headers=dict(VARY))
+
+    do_cache = False
+    with metricas.medir_etapa(f"compressao_{formato}"):
+        if codificacao == "gzip":
+            partes = [pedacos[0]]
+            if len(pedacos) > 1:
+                trecho, do_cache = trecho_base64(documento)
+                for pedaco in pedacos[1:]:
+                    partes.extend((trecho, pedaco))
+            conteudo = gzip_emendado(partes)
+        else:
+            texto = base64.b64encode(documento.conteudo) if len(pedacos) > 1 else b""
+            conteudo = brotli.compress(texto.join(pedacos), quality=QUALIDADE_BROTLI)
+
+    registrar(formato, codificacao, original, len(conteudo), do_cache)
+    metricas.incrementar(f"compressao_{codificacao}")
+    return Response(conteudo, media_type="application/json", headers=dict(VARY, **{"Content-Encoding": codificacao}))
@@ -0,0 +1,157 @@
+"""
+Entrega de resultados para fora da API (callbacks do N8N, envio direto à Z-API).
+
+Um único cliente httpx assíncrono por processo, com pool de conexões
+keep-alive, limite de envios simultâneos, limite de taxa por destino (token
+bucket, por host por padrão) e retentativas com backoff exponencial (com
+jitter) para erros de rede, 429 e 5xx. Um 429/503 com Retry-After é
+respeitado.
+
+Configuração por variáveis de ambiente:
+    ENTREGA_CONCORRENCIA   envios simultâneos (padrão: 8)
+    ENTREGA_TENTATIVAS     tentativas por envio (padrão: 4)
+    ENTREGA_TIMEOUT_S      timeout de cada tentativa (padrão: 15)
+    ENTREGA_BACKOFF_S      espera base entre tentativas (padrão: 0.5)
+    ENTREGA_TAXA_DESTINO   envios por segundo por destino (padrão: 0 = sem limite)
+    ENTREGA_RAJADA         envios seguidos permitidos por destino (padrão: a taxa, mínimo 1)
+"""
+
+import asyncio
+import logging
+import os
+import random
+import time
+from urllib.parse import urlsplit
+
+import httpx
+
+import metricas
+
+logger = logging.getLogger(__name__)
+
+STATUS_RETENTAVEIS = {408, 425, 429, 500, 502, 503, 504}
+
+
+class FalhaEntrega(Exception):
+    """O destino não aceitou o envio depois de todas as tentativas"""
+
+
+class LimitadorTaxa:
+    """Token bucket por chave (destino), usado dentro de um único loop asyncio"""
+
+    def __init__(self, taxa, rajada=None):
+        self.taxa = taxa
+        self.rajada = rajada or max(1.0, taxa)
+        self._baldes = {}
+
+    async def aguardar(self, chave):
+        while True:
+            agora = time.monotonic()
+            fichas, ultimo = self._baldes.get(chave, (self.rajada, agora))
+            fichas = min(self.rajada, fichas + (agora - ultimo) * self.taxa)
+            if fichas >= 1:
+                self._baldes[chave] = (fichas - 1, agora)
+                return
+            self._baldes[chave] = (fichas, agora)
+            metricas.incrementar("entregas_limitadas")
+            await asyncio.sleep((1 - fichas) / self.taxa)
+
+
+class ClienteEntrega:
+    """Cliente HTTP compartilhado com pool, limite de concorrência e retentativas"""
+
+    def __init__(self, concorrencia=8, tentativas=4, timeout=15.0, backoff=0.5, taxa_destino=0, rajada=None):
+        self.concorrencia = concorrencia
+        self.tentativas = tentativas
+        self.timeout = timeout
+        self.backoff = backoff
+        self.limitador = LimitadorTaxa(taxa_destino, rajada) if taxa_destino > 0 else None
+        self._cliente = None
+        self._semaforo = None
+        self._loop = None
+        self.em_andamento = 0
+
+    @classmethod
+    def do_ambiente(cls):
+        return cls(
+            concorrencia=int(os.environ.get("ENTREGA_CONCORRENCIA", 8)),
+            tentativas=int(os.environ.get("ENTREGA_TENTATIVAS", 4)),
+            timeout=float(os.environ.get("ENTREGA_TIMEOUT_S", 15)),
+            backoff=float(os.environ.get("ENTREGA_BACKOFF_S", 0.5)),
+            taxa_destino=float(os.environ.get("ENTREGA_TAXA_DESTINO", 0)),
+            rajada=float(os.environ.get("ENTREGA_RAJADA", 0)) or None
+        )
+
+    def _preparar(self):
+        # Cliente e semáforo pertencem ao loop em que foram criados
+        loop = asyncio.get_running_loop()
+        if self._cliente is None or self._loop is not loop:
+            self._cliente = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.concorrencia,
+                    max_keepalive_connections=self.concorrencia
+                )
+            )
+            self._semaforo = asyncio.Semaphore(self.concorrencia)
+            self._loop = loop
+        return self._cliente
+
+    def _espera(self, tentativa, resposta=None):
+        if resposta is not None:
+            retry_after = resposta.headers.get("retry-after", "")
+            if retry_after.isdigit():
+                return min(float(retry_after), 60.0)
+        # Backoff exponencial com jitter completo
+        return random.uniform(0, self.backoff * (2 ** tentativa))
+
+    async def enviar(self, url, conteudo, headers=None, destino=None):
+        """
+        POST com retentativas; devolve a resposta final ou levanta FalhaEntrega
+
+        destino é a chave do limite de taxa (padrão: host da URL).
+        """
+        cliente = self._preparar()
+        destino = destino or urlsplit(url).netloc
+        inicio = time.perf_counter()
+        ultimo_erro = None
+
+        for tentativa in range(self.tentativas):
+            if self.limitador is not None:
+                await self.limitador.aguardar(destino)
+
+            resposta = None
+            async with self._semaforo:
+                self.em_andamento += 1
+                try:
+                    resposta = await cliente.post(url, content=conteudo, headers=headers)
+                except httpx.HTTPError as e:
+                    ultimo_erro = f"{type(e).__name__}: {e}"
+                finally:
+                    self.em_andamento -= 1
+
+            if resposta is not None:
+                if resposta.status_code < 400:
+                    metricas.incrementar("entregas_ok")
+                    metricas.registrar_tempo("entrega", time.perf_counter() - inicio)
+                    return resposta
+                ultimo_erro = f"HTTP {resposta.status_code}"
+                if resposta.status_code not in STATUS_RETENTAVEIS:
+                    break
+
+            if tentativa + 1 < self.tentativas:
+                metricas.incrementar("entregas_retentativas")
+                espera = self._espera(tentativa, resposta)
+                logger.warning(f"🔁 Entrega para {destino} falhou ({ultimo_erro}), nova tentativa em {espera:.2f}s")
+                await asyncio.sleep(espera)
+
+        metricas.incrementar("entregas_falhas")
+        raise FalhaEntrega(f"Entrega para {destino} falhou: {ultimo_erro}")
+
+    async def fechar(self):
+        if self._cliente is not None:
+            await self._cliente.aclose()
+            self._cliente = None
+
+    def exportar(self):
+        return {"em_andamento": self.em_andamento, "concorrencia": self.concorrencia}
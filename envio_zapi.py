@@ -0,0 +1,75 @@
+"""
+Envio direto de documentos para uma API compatível com a Z-API.
+
+Sem isso, /gerar-documento-zapi devolve o base64 para o N8N, que faz um segundo
+salto só para repassar o mesmo blob à Z-API. Com ZAPI_URL configurada e
+"enviar_para" na requisição, o próprio serviço faz o POST de send-document
+pelo ClienteEntrega (pool keep-alive, concorrência limitada, retentativas com
+jitter e limite de taxa por destino).
+
+Configuração por variáveis de ambiente:
+    ZAPI_URL            base da instância, ex.: https://api.z-api.io/instances/ID/token/TOKEN
+    ZAPI_CLIENT_TOKEN   token de segurança da conta (cabeçalho Client-Token), opcional
+"""
+
+import base64
+import logging
+import os
+import re
+
+import metricas
+from resposta_json import serializar_json
+
+logger = logging.getLogger(__name__)
+
+
+def normalizar_telefone(telefone):
+    """Somente dígitos, com DDI 55 quando vier só DDD + número"""
+    digitos = re.sub(r'\D', '', str(telefone or ""))
+    if len(digitos) in (10, 11):
+        digitos = "55" + digitos
+    return digitos
+
+
+class EnvioZApi:
+    """Cliente do endpoint send-document de uma instância Z-API"""
+
+    def __init__(self, url_base, cliente, client_token=None):
+        self.url_base = url_base.rstrip("/")
+        self.cliente = cliente
+        self.client_token = client_token
+
+    @classmethod
+    def do_ambiente(cls, cliente):
+        url_base = os.environ.get("ZAPI_URL")
+        if not url_base:
+            return None
+        return cls(url_base, cliente, os.environ.get("ZAPI_CLIENT_TOKEN"))
+
+    def montar_payload(self, telefone, conteudo, filename, media_type, caption=None):
+        extensao = filename.rsplit(".", 1)[-1]
+        payload = {
+            "phone": telefone,
+            "document": f"data:{media_type};base64,{base64.b64encode(conteudo).decode('ascii')}",
+            "fileName": filename.rsplit(".", 1)[0],
+            "extension": extensao
+        }
+        if caption:
+            payload["caption"] = caption
+        return payload
+
+    async def enviar_documento(self, telefone, conteudo, filename, media_type, caption=None):
+        """Envia o documento e devolve o JSON de resposta da Z-API"""
+        extensao = filename.rsplit(".", 1)[-1]
+        headers = {"Content-Type": "application/json"}
+        if self.client_token:
+            headers["Client-Token"] = self.client_token
+
+        corpo = serializar_json(self.montar_payload(telefone, conteudo, filename, media_type, caption))
+        resposta = await self.cliente.enviar(f"{self.url_base}/send-document/{extensao}", corpo, headers)
+        metricas.incrementar("zapi_documentos_enviados")
+        logger.info(f"📲 Documento {filename} enviado para {telefone} ({len(corpo)} bytes)")
+        try:
+            return resposta.json()
+        except ValueError:
+            return {}
@@ -0,0 +1,133 @@
+"""
+Extração dos dados do contrato a partir da mensagem de texto.
+
+Usada pela API (main.py, pipeline), pelo lote (lote.py) e pelos scripts. Fica
+num módulo próprio para quem só precisa do parser não montar o app FastAPI.
+"""
+
+import logging
+import os
+import re
+from datetime import datetime
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Padrões de extração por campo
+PADROES_EXTRACAO = {
+    "NOME": [
+        r"Nome:\s*(.+?)(?=\n|$)", 
+        r"nome:\s*(.+?)(?=\n|$)",
+        r"NOME:\s*(.+?)(?=\n|$)"
+    ],
+    "EMAIL": [
+        r"Email:\s*(.+?)(?=\n|$)", 
+        r"email:\s*(.+?)(?=\n|$)", 
+        r"E-mail:\s*(.+?)(?=\n|$)",
+        r"EMAIL:\s*(.+?)(?=\n|$)"
+    ],
+    "CPF": [
+        r"CPF:\s*(.+?)(?=\n|$)", 
+        r"cpf:\s*(.+?)(?=\n|$)"
+    ],
+    "ENDERECO": [
+        r"Endereço:\s*(.+?)(?=\n|$)", 
+        r"endereco:\s*(.+?)(?=\n|$)", 
+        r"Endereco:\s*(.+?)(?=\n|$)",
+        r"ENDERECO:\s*(.+?)(?=\n|$)"
+    ],
+    "CEP": [
+        r"CEP:\s*(.+?)(?=\n|$)", 
+        r"cep:\s*(.+?)(?=\n|$)"
+    ],
+    "TELEFONE": [
+        r"Telefone:\s*(.+?)(?=\n|$)", 
+        r"telefone:\s*(.+?)(?=\n|$)", 
+        r"Fone:\s*(.+?)(?=\n|$)",
+        r"TELEFONE:\s*(.+?)(?=\n|$)"
+    ],
+    "VALOR": [
+        r"Valor:\s*(.+?)(?=\n|$)", 
+        r"valor:\s*(.+?)(?=\n|$)",
+        r"VALOR:\s*(.+?)(?=\n|$)"
+    ],
+    "PARCELAS": [
+        r"Quantidade de Parcelas:\s*(.+?)(?=\n|$)", 
+        r"quantidade de parcelas:\s*(.+?)(?=\n|$)",
+        r"Parcelas:\s*(.+?)(?=\n|$)",
+        r"parcelas:\s*(.+?)(?=\n|$)",
+        r"PARCELAS:\s*(.+?)(?=\n|$)"
+    ],
+    "FORMA_PAGAMENTO": [
+        r"Forma de pagamento:\s*(.+?)(?=\n|$)", 
+        r"forma de pagamento:\s*(.+?)(?=\n|$)",
+        r"Pagamento:\s*(.+?)(?=\n|$)",
+        r"pagamento:\s*(.+?)(?=\n|$)",
+        r"FORMA_PAGAMENTO:\s*(.+?)(?=\n|$)"
+    ]
+}
+
+# Compilados uma única vez na importação (compartilhados entre workers no modo pré-fork)
+PADROES_COMPILADOS = {
+    campo: [re.compile(padrao, re.IGNORECASE | re.MULTILINE) for padrao in padroes_campo]
+    for campo, padroes_campo in PADROES_EXTRACAO.items()
+}
+
+# Modo determinístico: sem data_referencia, os campos de data usam o dia atual à
+# meia-noite, e o mesmo contrato gera os mesmos bytes (e o mesmo ETag) o dia todo
+RENDER_DETERMINISTICO = os.environ.get("RENDER_DETERMINISTICO", "").lower() in ("1", "true", "sim")
+
+def instante_documento(data_referencia=None) -> datetime:
+    """Instante usado nos campos de data do documento"""
+    if data_referencia is not None:
+        return data_referencia
+    agora = datetime.now()
+    if RENDER_DETERMINISTICO:
+        return agora.replace(hour=0, minute=0, second=0, microsecond=0)
+    return agora
+
+def campos_de_data(agora: datetime) -> dict:
+    return {
+        "DATA": agora.strftime("%d/%m/%Y"),
+        "HORA": agora.strftime("%H:%M:%S"),
+        "DATA_HORA": agora.strftime("%d/%m/%Y %H:%M:%S"),
+        "DATA_PROCESSAMENTO": agora.strftime("%d/%m/%Y %H:%M:%S"),
+        "TIMESTAMP": agora.isoformat()
+    }
+
+def extrair_dados_da_mensagem(mensagem: str, data_referencia: Optional[datetime] = None) -> dict:
+    """Extrai os dados da mensagem com validação aprimorada"""
+    dados = {}
+    
+    # Log da mensagem recebida para debug
+    logger.info(f"📨 Mensagem recebida para extração:")
+    logger.info(f"   Tamanho: {len(mensagem)} caracteres")
+    logger.info(f"   Prévia: {mensagem[:200]}...")
+    
+    # Extrair dados usando os padrões pré-compilados
+    for campo, padroes_campo in PADROES_COMPILADOS.items():
+        valor_encontrado = None
+        for padrao in padroes_campo:
+            match = padrao.search(mensagem)
+            if match:
+                valor_encontrado = match.group(1).strip()
+                logger.info(f"✅ {campo}: {valor_encontrado}")
+                break
+        
+        dados[campo] = valor_encontrado if valor_encontrado else "Não informado"
+        
+        if not valor_encontrado:
+            logger.info(f"⚠️ {campo}: Não encontrado")
+    
+    # Adicionar campos de data/hora automaticamente
+    dados.update(campos_de_data(instante_documento(data_referencia)))
+    
+    # Campos derivados
+    dados["PACIENTE"] = dados["NOME"]
+    dados["ARQUIVO_FONTE"] = "API N8N Cloud"
+    
+    logger.info(f"📊 Resumo da extração:")
+    logger.info(f"   Total de campos extraídos: {len([v for v in dados.values() if v != 'Não informado'])}")
+    logger.info(f"   Campos sem valor: {len([v for v in dados.values() if v == 'Não informado'])}")
+    
+    return dados
@@ -0,0 +1,183 @@
+"""
+Modo assíncrono de geração: o cliente envia a mensagem, recebe um job id na hora
+e busca o documento depois.
+
+Os jobs entram em uma fila limitada em memória consumida por tarefas de render
+que rodam em threads. O estado e o resultado de cada job ficam em disco, em um
+diretório local com TTL, para que qualquer worker do container responda a
+consultas de status e downloads (modo pré-fork).
+
+Configuração por variáveis de ambiente:
+    JOBS_DIR             diretório dos jobs (padrão: <tmp>/jobs_documentos)
+    JOBS_FILA_MAX        capacidade da fila (padrão: 100)
+    JOBS_WORKERS         tarefas de render simultâneas (padrão: 2)
+    JOBS_TTL_SEGUNDOS    tempo de retenção dos resultados (padrão: 3600)
+"""
+
+import asyncio
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+import uuid
+
+from admissao import EstimadorVazao
+
+logger = logging.getLogger(__name__)
+
+STATUS_NA_FILA = "na_fila"
+STATUS_PROCESSANDO = "processando"
+STATUS_CONCLUIDO = "concluido"
+STATUS_ERRO = "erro"
+
+
+class FilaCheia(Exception):
+    """A fila de jobs atingiu a capacidade máxima"""
+
+    def __init__(self, mensagem, retry_after=1):
+        super().__init__(mensagem)
+        self.retry_after = retry_after
+
+
+class FilaJobs:
+    """Fila limitada de jobs de render com armazenamento local e TTL"""
+
+    def __init__(self, funcao_render, diretorio=None, tamanho_maximo=100, workers=2, ttl=3600):
+        self.funcao_render = funcao_render
+        self.diretorio = diretorio or os.path.join(tempfile.gettempdir(), "jobs_documentos")
+        self.tamanho_maximo = tamanho_maximo
+        self.workers = workers
+        self.ttl = ttl
+        self.fila = None
+        self.tarefas = []
+        self.recusados = 0
+        self.estimador = EstimadorVazao()
+
+    @classmethod
+    def do_ambiente(cls, funcao_render):
+        return cls(
+            funcao_render,
+            diretorio=os.environ.get("JOBS_DIR"),
+            tamanho_maximo=int(os.environ.get("JOBS_FILA_MAX", 100)),
+            workers=int(os.environ.get("JOBS_WORKERS", 2)),
+            ttl=int(os.environ.get("JOBS_TTL_SEGUNDOS", 3600))
+        )
+
+    async def iniciar(self):
+        """Cria a fila e as tarefas de render no loop atual"""
+        os.makedirs(self.diretorio, exist_ok=True)
+        self.fila = asyncio.Queue(maxsize=self.tamanho_maximo)
+        for i in range(self.workers):
+            self.tarefas.append(asyncio.create_task(self._consumir(i)))
+        self.tarefas.append(asyncio.create_task(self._limpar_periodicamente()))
+        logger.info(f"📬 Fila de jobs iniciada: {self.workers} worker(s), capacidade {self.tamanho_maximo}")
+
+    async def parar(self):
+        for tarefa in self.tarefas:
+            tarefa.cancel()
+        self.tarefas = []
+
+    @property
+    def profundidade(self):
+        return self.fila.qsize() if self.fila else 0
+
+    def _pasta_job(self, job_id):
+        return os.path.join(self.diretorio, job_id)
+
+    def _gravar_status(self, job_id, **campos):
+        pasta = self._pasta_job(job_id)
+        caminho = os.path.join(pasta, "status.json")
+        status = self.obter_status(job_id) or {}
+        status.update(campos)
+        status["job_id"] = job_id
+        status["atualizado_em"] = time.time()
+
+        # Escrita atômica: outro worker pode estar lendo o mesmo arquivo
+        temporario = caminho + f".{os.getpid()}.tmp"
+        with open(temporario, "w", encoding="utf-8") as f:
+            json.dump(status, f, ensure_ascii=False)
+        os.replace(temporario, caminho)
+        return status
+
+    def obter_status(self, job_id):
+        """Lê o status do job em disco; None se não existir ou tiver expirado"""
+        if not job_id.isalnum():
+            return None
+        try:
+            with open(os.path.join(self._pasta_job(job_id), "status.json"), encoding="utf-8") as f:
+                status = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if time.time() - status.get("criado_em", 0) > self.ttl:
+            return None
+        return status
+
+    def caminho_resultado(self, job_id):
+        """Caminho do documento de um job concluído ou None"""
+        status = self.obter_status(job_id)
+        if not status or status.get("status") != STATUS_CONCLUIDO:
+            return None
+        caminho = os.path.join(self._pasta_job(job_id), status["filename"])
+        return caminho if os.path.exists(caminho) else None
+
+    def enviar(self, request):
+        """Coloca o pedido na fila e retorna o status inicial do job"""
+        if self.fila is None:
+            raise RuntimeError("Fila de jobs não iniciada")
+        if self.fila.full():
+            self.recusados += 1
+            retry_after = self.estimador.retry_after(self.fila.qsize() + 1)
+            raise FilaCheia(f"Fila de jobs cheia ({self.tamanho_maximo})", retry_after)
+
+        job_id = uuid.uuid4().hex
+        os.makedirs(self._pasta_job(job_id))
+        status = self._gravar_status(job_id, status=STATUS_NA_FILA, criado_em=time.time())
+        self.fila.put_nowait((job_id, request))
+        logger.info(f"📬 Job {job_id} na fila (profundidade {self.fila.qsize()})")
+        return status
+
+    async def _consumir(self, indice):
+        while True:
+            job_id, request = await self.fila.get()
+            try:
+                self._gravar_status(job_id, status=STATUS_PROCESSANDO, iniciado_em=time.time())
+                pasta = self._pasta_job(job_id)
+                resultado = await asyncio.to_thread(self.funcao_render, request, pasta)
+                self._gravar_status(job_id, status=STATUS_CONCLUIDO, concluido_em=time.time(), **resultado)
+                logger.info(f"✅ Job {job_id} concluído pelo worker {indice}")
+            except Exception as e:
+                logger.error(f"❌ Job {job_id} falhou: {e}")
+                self._gravar_status(job_id, status=STATUS_ERRO, erro=str(e), concluido_em=time.time())
+            finally:
+                self.estimador.registrar()
+                self.fila.task_done()
+
+    def limpar_expirados(self):
+        """Remove do disco os jobs mais antigos que o TTL"""
+        agora = time.time()
+        removidos = 0
+        try:
+            nomes = os.listdir(self.diretorio)
+        except OSError:
+            return 0
+
+        for nome in nomes:
+            pasta = self._pasta_job(nome)
+            try:
+                if agora - os.path.getmtime(pasta) > self.ttl:
+                    shutil.rmtree(pasta, ignore_errors=True)
+                    removidos += 1
+            except OSError:
+                continue
+
+        if removidos:
+            logger.info(f"🧹 {removidos} job(s) expirado(s) removido(s)")
+        return removidos
+
+    async def _limpar_periodicamente(self):
+        while True:
+            await asyncio.sleep(min(self.ttl, 300))
+            await asyncio.to_thread(self.limpar_expirados)
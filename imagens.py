@@ -0,0 +1,489 @@
+"""
+Imagens nos modelos: placeholders {{IMG:NOME}}.
+
+Contratos levam o logo da clínica e a assinatura do paciente. No modelo, a
+imagem é marcada com {{IMG:NOME}} (ou {{IMG:NOME:4.5}} para fixar a largura em
+cm) dentro de um parágrafo; o placeholder vira um run com a imagem, na
+formatação do texto ao redor.
+
+Origem da imagem NOME, nesta ordem:
+    - campo "imagens" da requisição ({"ASSINATURA": "<base64 ou data URI>"}):
+      registrar() decodifica, reduz e grava a imagem uma vez, e os dados do
+      documento passam a levar só a referência "sha256:<hash>" em IMG:NOME
+      (o cache de render e o ETag mudam junto com a imagem);
+    - arquivo de IMAGENS_DIR com o nome do placeholder (logo.png, LOGO.jpg...)
+      ou com o nome informado em IMG:NOME.
+
+Imagens preparadas (decodificadas, com a orientação EXIF aplicada e reduzidas a
+IMAGENS_MAX_PX no maior lado) ficam num LRU por hash de conteúdo limitado a
+IMAGENS_CACHE_MB. A mesma imagem em vários placeholders ou partes vira uma
+única parte de mídia no pacote, e o membro do zip dela é montado uma vez e
+reaproveitado por todos os renders do motor zip: um logo repetido não custa
+decodificação, redução nem compressão por requisição. As imagens recebidas
+também vão para IMAGENS_CACHE_DIR (já reduzidas), de onde os outros workers e
+os processos do pool de render as leem pela referência.
+
+A redução usa o Pillow; sem ele, as imagens entram no tamanho original (só
+PNG, JPEG, GIF, BMP e TIFF, os formatos que o python-docx reconhece).
+
+Configuração por variáveis de ambiente:
+    IMAGENS_DIR             diretório dos arquivos estáticos (padrão: imagens)
+    IMAGENS_CACHE_DIR       imagens recebidas já preparadas (padrão: <tmp>/imagens)
+    IMAGENS_CACHE_MB        limite do LRU de imagens preparadas (padrão: 64)
+    IMAGENS_MAX_PX          maior lado depois da redução (padrão: 1600)
+    IMAGENS_MAX_MB          tamanho máximo de uma imagem recebida (padrão: 10)
+    IMAGENS_LARGURA_MAX_CM  largura máxima sem largura no placeholder (padrão: 16)
+"""
+
+import base64
+import binascii
+import copy
+import hashlib
+import io
+import itertools
+import logging
+import os
+import posixpath
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+
+import lxml.etree
+from docx.image.exceptions import UnrecognizedImageError
+from docx.image.image import Image as ImagemDocx
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.oxml.ns import qn
+from docx.oxml.parser import OxmlElement
+from docx.oxml.shape import CT_Inline
+from docx.parts.story import StoryPart
+from docx.shared import Cm, Emu
+
+import metricas
+from modelo_compilado import comprimir_membro
+
+try:
+    from PIL import Image as ImagemPil, ImageOps
+except ImportError:  # pragma: no cover - depende do ambiente
+    ImagemPil = None
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+PREFIXO_CHAVE = "IMG:"
+PREFIXO_REFERENCIA = "sha256:"
+# {{IMG:NOME}} ou {{IMG:NOME:LARGURA_CM}}
+PADRAO_IMAGEM = re.compile(r"\{\{IMG:([^}:]+)(?::(\d+(?:[.,]\d+)?))?\}\}")
+PADRAO_NOME = re.compile(r"^[\w\-. ]+$")
+EXTENSOES_ASSET = (".png", ".jpg", ".jpeg", ".gif", ".bmp")
+
+NS_RELACOES = "http://schemas.openxmlformats.org/package/2006/relationships"
+NS_CONTENT_TYPES = "http://schemas.openxmlformats.org/package/2006/content-types"
+CONTENT_TYPES = "[Content_Types].xml"
+# docPr/@id das imagens inseridas: acima dos ids que o Word costuma usar
+ID_INICIAL = 10000
+
+IMAGENS_DIR = os.environ.get("IMAGENS_DIR", "imagens")
+MAX_PX = int(os.environ.get("IMAGENS_MAX_PX", 1600))
+MAX_BYTES = int(float(os.environ.get("IMAGENS_MAX_MB", 10)) * MB)
+LARGURA_MAXIMA = Cm(float(os.environ.get("IMAGENS_LARGURA_MAX_CM", 16)))
+
+
+class ImagemInvalida(Exception):
+    """Imagem recebida que não pôde ser decodificada"""
+
+
+def diretorio_cache():
+    return os.environ.get("IMAGENS_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "imagens")
+
+
+def eh_chave_imagem(chave):
+    return isinstance(chave, str) and chave.startswith(PREFIXO_CHAVE)
+
+
+class ImagemPreparada:
+    """Imagem pronta para o pacote: bytes finais, tipo, tamanho natural e membro do zip"""
+
+    def __init__(self, hash_conteudo, dados):
+        info = ImagemDocx.from_blob(dados)
+        self.hash = hash_conteudo
+        self.dados = dados
+        self.ext = "jpeg" if info.ext == "jpg" else info.ext
+        self.content_type = info.content_type
+        self.largura = info.width
+        self.altura = info.height
+        self.nome_membro = f"word/media/img_{hash_conteudo[:16]}.{self.ext}"
+        self._membro = None
+
+    def dimensoes(self, largura_cm=None):
+        """(cx, cy) em EMU: largura pedida ou tamanho natural limitado a LARGURA_MAXIMA"""
+        largura = Cm(largura_cm) if largura_cm else min(self.largura, LARGURA_MAXIMA)
+        return Emu(int(largura)), Emu(int(self.altura * largura / max(1, self.largura)))
+
+    def membro(self):
+        """Membro do zip (PNG/JPEG vão sem deflate), montado uma vez por imagem"""
+        if self._membro is None:
+            self._membro = comprimir_membro(self.nome_membro, self.dados)
+        return self._membro
+
+
+class CacheImagens:
+    """LRU de imagens preparadas por hash de conteúdo, limitado em bytes"""
+
+    def __init__(self, limite):
+        self.limite = limite
+        self.tamanho = 0
+        self.acertos = 0
+        self.falhas = 0
+        self._itens = OrderedDict()
+        self._trava = threading.Lock()
+
+    def obter(self, chave):
+        with self._trava:
+            imagem = self._itens.get(chave)
+            if imagem is None:
+                self.falhas += 1
+                return None
+            self._itens.move_to_end(chave)
+            self.acertos += 1
+            return imagem
+
+    def guardar(self, chave, imagem):
+        with self._trava:
+            anterior = self._itens.pop(chave, None)
+            if anterior is not None:
+                self.tamanho -= len(anterior.dados)
+            self._itens[chave] = imagem
+            self.tamanho += len(imagem.dados)
+            while self.tamanho > self.limite and len(self._itens) > 1:
+                _, removida = self._itens.popitem(last=False)
+                self.tamanho -= len(removida.dados)
+
+    def exportar(self):
+        return {
+            "itens": len(self._itens),
+            "tamanho_mb": round(self.tamanho / MB, 2),
+            "limite_mb": round(self.limite / MB, 1),
+            "acertos": self.acertos,
+            "falhas": self.falhas
+        }
+
+
+_cache = CacheImagens(int(float(os.environ.get("IMAGENS_CACHE_MB", 64)) * MB))
+# Caminho do asset -> (mtime, hash do conteúdo)
+_assets = {}
+
+
+def exportar():
+    return _cache.exportar()
+
+
+def reduzir(bruto):
+    """Aplica a orientação EXIF e reduz ao limite de pixels; devolve os bytes (ou os originais)"""
+    if ImagemPil is None:
+        return bruto
+    try:
+        with ImagemPil.open(io.BytesIO(bruto)) as original:
+            formato = original.format
+            orientacao = original.getexif().get(0x0112, 1)
+            if max(original.size) <= MAX_PX and orientacao == 1 and formato in ("PNG", "JPEG"):
+                return bruto
+            imagem = ImageOps.exif_transpose(original)
+            imagem.thumbnail((MAX_PX, MAX_PX))
+            saida = io.BytesIO()
+            # Fotos seguem em JPEG; PNG (assinaturas, logos) e transparência, em PNG
+            if formato == "PNG" or imagem.mode in ("RGBA", "LA", "P"):
+                imagem.save(saida, "PNG", optimize=True)
+            else:
+                imagem.convert("RGB").save(saida, "JPEG", quality=85, optimize=True)
+    except Exception as e:
+        raise ImagemInvalida(f"Imagem ilegível: {e}")
+    metricas.incrementar("imagens_reduzidas")
+    return saida.getvalue()
+
+
+def preparar(hash_conteudo, bruto, ja_reduzida=False):
+    """Imagem preparada do LRU, ou decodificada, reduzida e guardada nele"""
+    imagem = _cache.obter(hash_conteudo)
+    if imagem is not None:
+        return imagem
+    with metricas.medir_etapa("imagem_preparar"):
+        try:
+            imagem = ImagemPreparada(hash_conteudo, bruto if ja_reduzida else reduzir(bruto))
+        except UnrecognizedImageError:
+            raise ImagemInvalida("Formato de imagem não reconhecido")
+    _cache.guardar(hash_conteudo, imagem)
+    return imagem
+
+
+def _gravar_no_cache_de_disco(hash_conteudo, dados):
+    diretorio = diretorio_cache()
+    destino = os.path.join(diretorio, hash_conteudo)
+    if os.path.exists(destino):
+        return
+    try:
+        os.makedirs(diretorio, exist_ok=True)
+        temporario = f"{destino}.{os.getpid()}.tmp"
+        with open(temporario, "wb") as f:
+            f.write(dados)
+        os.replace(temporario, destino)
+    except OSError as e:
+        logger.warning(f"⚠️ Não foi possível gravar a imagem {hash_conteudo[:12]} no cache: {e}")
+
+
+def registrar(imagens):
+    """
+    Prepara as imagens recebidas na requisição
+
+    Args:
+        imagens: {"NOME": "<base64 ou data URI>"}
+
+    Returns:
+        dict: {"IMG:NOME": "sha256:<hash>"} para juntar aos dados do documento
+    """
+    if imagens and not isinstance(imagens, dict):
+        raise ImagemInvalida("imagens deve ser um objeto {\"NOME\": \"<base64>\"}")
+    referencias = {}
+    for nome, texto in (imagens or {}).items():
+        if not texto:
+            continue
+        if not isinstance(texto, str):
+            raise ImagemInvalida(f"Imagem {nome} não é um base64 válido")
+        if "," in texto[:100] and texto.startswith("data:"):
+            texto = texto.split(",", 1)[1]
+        if len(texto) * 3 // 4 > MAX_BYTES:
+            raise ImagemInvalida(f"Imagem {nome} maior que {MAX_BYTES // MB} MB")
+        try:
+            bruto = base64.b64decode(texto, validate=True)
+        except (binascii.Error, ValueError):
+            raise ImagemInvalida(f"Imagem {nome} não é um base64 válido")
+
+        hash_conteudo = hashlib.sha256(bruto).hexdigest()
+        imagem = preparar(hash_conteudo, bruto)
+        _gravar_no_cache_de_disco(hash_conteudo, imagem.dados)
+        referencias[f"{PREFIXO_CHAVE}{nome.strip().upper()}"] = f"{PREFIXO_REFERENCIA}{hash_conteudo}"
+        metricas.incrementar("imagens_recebidas")
+    return referencias
+
+
+def _por_referencia(referencia):
+    hash_conteudo = referencia[len(PREFIXO_REFERENCIA):]
+    imagem = _cache.obter(hash_conteudo)
+    if imagem is not None or not re.fullmatch(r"[0-9a-f]{64}", hash_conteudo):
+        return imagem
+    try:
+        with open(os.path.join(diretorio_cache(), hash_conteudo), "rb") as f:
+            dados = f.read()
+    except OSError:
+        logger.warning(f"⚠️ Imagem {hash_conteudo[:12]} não encontrada no cache")
+        return None
+    return preparar(hash_conteudo, dados, ja_reduzida=True)
+
+
+def _caminho_asset(nome):
+    if not PADRAO_NOME.match(nome) or not os.path.isdir(IMAGENS_DIR):
+        return None
+    candidatos = {nome.lower()} if nome.lower().endswith(EXTENSOES_ASSET) else {
+        f"{nome.lower()}{extensao}" for extensao in EXTENSOES_ASSET
+    }
+    for arquivo in sorted(os.listdir(IMAGENS_DIR)):
+        if arquivo.lower() in candidatos:
+            return os.path.join(IMAGENS_DIR, arquivo)
+    return None
+
+
+def _hash_asset(caminho):
+    """Hash do conteúdo do asset, relido só quando o arquivo muda"""
+    mtime = os.path.getmtime(caminho)
+    conhecido = _assets.get(caminho)
+    if conhecido is not None and conhecido[0] == mtime:
+        return conhecido[1], None
+    with open(caminho, "rb") as f:
+        bruto = f.read()
+    hash_conteudo = hashlib.sha256(bruto).hexdigest()
+    _assets[caminho] = (mtime, hash_conteudo)
+    return hash_conteudo, bruto
+
+
+def _por_asset(nome):
+    caminho = _caminho_asset(nome)
+    if caminho is None:
+        return None
+    hash_conteudo, bruto = _hash_asset(caminho)
+    imagem = _cache.obter(hash_conteudo)
+    if imagem is None:
+        if bruto is None:
+            with open(caminho, "rb") as f:
+                bruto = f.read()
+        imagem = preparar(hash_conteudo, bruto)
+    return imagem
+
+
+def resolver(nome, dados):
+    """Imagem do placeholder {{IMG:NOME}} (referência recebida ou asset) ou None"""
+    valor = dados.get(f"{PREFIXO_CHAVE}{nome}")
+    try:
+        if isinstance(valor, str) and valor.startswith(PREFIXO_REFERENCIA):
+            return _por_referencia(valor)
+        return _por_asset(valor if isinstance(valor, str) and valor.strip() else nome)
+    except (OSError, ImagemInvalida) as e:
+        logger.warning(f"⚠️ Imagem {nome} indisponível: {e}")
+        return None
+
+
+def identificar(nome, dados):
+    """Identidade do conteúdo de {{IMG:NOME}} para a chave do cache de render"""
+    valor = dados.get(f"{PREFIXO_CHAVE}{nome}")
+    if isinstance(valor, str) and valor.startswith(PREFIXO_REFERENCIA):
+        return valor
+    caminho = _caminho_asset(valor if isinstance(valor, str) and valor.strip() else nome)
+    if caminho is None:
+        return None
+    try:
+        return f"asset:{_hash_asset(caminho)[0]}"
+    except OSError:
+        return None
+
+
+def _run_de_imagem(modelo_run, imagem, rid, id_forma, largura_cm):
+    cx, cy = imagem.dimensoes(largura_cm)
+    inline = CT_Inline.new_pic_inline(id_forma, rid, f"img_{imagem.hash[:16]}.{imagem.ext}", cx, cy)
+    desenho = OxmlElement("w:drawing")
+    desenho.append(inline)
+    run = OxmlElement("w:r")
+    if modelo_run.rPr is not None:
+        run.append(copy.deepcopy(modelo_run.rPr))
+    run.append(desenho)
+    return run
+
+
+def substituir_imagens(raiz, dados, relacionar, ids):
+    """
+    Troca os placeholders {{IMG:...}} dos parágrafos por runs com a imagem
+
+    Mesma consolidação de substituir_placeholders_robusto: o texto que sobra
+    fica no primeiro run com conteúdo e nos runs copiados dele entre as imagens.
+    relacionar(imagem) devolve o rId da imagem na parte; ids gera os docPr/@id.
+    """
+    inseridas = 0
+    for paragrafo in raiz.iter(qn("w:p")):
+        if "{{IMG:" not in "".join(t.text or "" for t in paragrafo.iter(qn("w:t"))):
+            continue
+        runs = paragrafo.r_lst
+        texto = "".join(run.text for run in runs)
+        pedacos = PADRAO_IMAGEM.split(texto)
+        if len(pedacos) == 1:
+            continue
+
+        destino = next((run for run in runs if run.text.strip() and "{{IMG:" not in run.text), None)
+        destino = destino or next((run for run in runs if run.text.strip()), runs[0])
+        for run in runs:
+            if run is not destino:
+                run.text = ""
+        destino.text = pedacos[0]
+        anterior = destino
+
+        for i in range(1, len(pedacos), 3):
+            nome, largura, depois = pedacos[i].strip().upper(), pedacos[i + 1], pedacos[i + 2]
+            imagem = resolver(nome, dados)
+            if imagem is None:
+                logger.warning(f"⚠️ Imagem {nome} sem origem (requisição ou {IMAGENS_DIR}), placeholder removido")
+                metricas.incrementar("imagens_ausentes")
+            else:
+                largura_cm = float(largura.replace(",", ".")) if largura else None
+                run = _run_de_imagem(destino, imagem, relacionar(imagem), next(ids), largura_cm)
+                anterior.addnext(run)
+                anterior = run
+                inseridas += 1
+            if depois:
+                run = copy.deepcopy(destino)
+                run.text = depois
+                anterior.addnext(run)
+                anterior = run
+    if inseridas:
+        metricas.incrementar("imagens_inseridas", inseridas)
+    return inseridas
+
+
+def inserir_no_documento(doc, dados):
+    """Placeholders de imagem de um Document do python-docx (corpo, cabeçalhos e rodapés)"""
+    ids = itertools.count(ID_INICIAL)
+    partes = [parte for parte in doc.part.package.iter_parts() if isinstance(parte, StoryPart)]
+    for parte in partes:
+        def relacionar(imagem, parte=parte):
+            rid, _ = parte.get_or_add_image(io.BytesIO(imagem.dados))
+            return rid
+        substituir_imagens(parte.element, dados, relacionar, ids)
+
+
+def _parte_de_rels(nome_parte):
+    diretorio, arquivo = posixpath.split(nome_parte)
+    return posixpath.join(diretorio, "_rels", f"{arquivo}.rels")
+
+
+class ImagensDoRender:
+    """Imagens de um render do motor zip: relações novas por parte, mídia e content types"""
+
+    def __init__(self, modelo, dados):
+        self.modelo = modelo
+        self.dados = dados
+        self.ids = itertools.count(ID_INICIAL)
+        self.relacoes = {}
+        self.imagens = {}
+
+    def substituir(self, raiz, nome_parte):
+        def relacionar(imagem):
+            rid = f"rIdImg{imagem.hash[:12]}"
+            self.relacoes.setdefault(nome_parte, {})[rid] = imagem
+            self.imagens[imagem.hash] = imagem
+            return rid
+        return substituir_imagens(raiz, self.dados, relacionar, self.ids)
+
+    def _relacoes_xml(self, nome_parte, relacoes):
+        nome_rels = _parte_de_rels(nome_parte)
+        xml = self.modelo.partes.get(nome_rels)
+        if xml is not None:
+            raiz = lxml.etree.fromstring(xml)
+        else:
+            raiz = lxml.etree.Element(f"{{{NS_RELACOES}}}Relationships", nsmap={None: NS_RELACOES})
+        diretorio = posixpath.dirname(nome_parte)
+        for rid, imagem in sorted(relacoes.items()):
+            lxml.etree.SubElement(raiz, f"{{{NS_RELACOES}}}Relationship", {
+                "Id": rid,
+                "Type": RT.IMAGE,
+                "Target": posixpath.relpath(imagem.nome_membro, diretorio)
+            })
+        return nome_rels, lxml.etree.tostring(raiz, xml_declaration=True, encoding="UTF-8", standalone=True)
+
+    def _content_types_xml(self):
+        raiz = lxml.etree.fromstring(self.modelo.partes[CONTENT_TYPES])
+        existentes = {
+            (elemento.get("Extension") or "").lower()
+            for elemento in raiz.iter(f"{{{NS_CONTENT_TYPES}}}Default")
+        }
+        for imagem in sorted(self.imagens.values(), key=lambda imagem: imagem.ext):
+            if imagem.ext not in existentes:
+                lxml.etree.SubElement(raiz, f"{{{NS_CONTENT_TYPES}}}Default", {
+                    "Extension": imagem.ext,
+                    "ContentType": imagem.content_type
+                })
+                existentes.add(imagem.ext)
+        return lxml.etree.tostring(raiz, xml_declaration=True, encoding="UTF-8", standalone=True)
+
+    def aplicar(self, membros):
+        """Membros do pacote com as relações, os content types e a mídia das imagens inseridas"""
+        if not self.imagens:
+            return membros
+        alterados = dict(self._relacoes_xml(nome, relacoes) for nome, relacoes in self.relacoes.items())
+        alterados[CONTENT_TYPES] = self._content_types_xml()
+
+        resultado = []
+        for membro in membros:
+            if membro.nome in alterados:
+                membro = comprimir_membro(membro.nome, alterados.pop(membro.nome))
+            resultado.append(membro)
+        # Partes sem relações no modelo ganham um .rels novo
+        resultado.extend(comprimir_membro(nome, xml) for nome, xml in sorted(alterados.items()))
+        resultado.extend(imagem.membro() for _, imagem in sorted(self.imagens.items()))
+        return resultado
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Renderização em lote, offline e em todos os núcleos, sem passar pelo HTTP.
+
+Lê registros de um arquivo JSONL ou CSV em streaming. Cada registro pode ser:
+    - uma mensagem bruta ("mensagem"), extraída com a mesma lógica da API;
+    - um objeto "dados" pronto;
+    - as próprias colunas/chaves do registro como dados (NOME, EMAIL, ...).
+Um campo "id" opcional identifica o registro; sem ele, vale o número da linha.
+
+A saída vai para um diretório ou, se o destino terminar em .zip, para um ZIP
+montado no final. Um manifesto (_manifesto.jsonl) registra o resultado de cada
+registro: ao rodar de novo com o mesmo destino, os já gerados são pulados. Com
+destino .zip o manifesto vai dentro do ZIP: a nova execução lê o manifesto de
+lá e copia os documentos já empacotados para o ZIP novo.
+
+Uso:
+    python lote.py contratos.jsonl --saida saida/
+    python lote.py contratos.csv --saida contratos.zip --workers 8 --motor docx
+"""
+
+import argparse
+import contextlib
+import csv
+import io
+import json
+import logging
+import multiprocessing
+import os
+import re
+import shutil
+import sys
+import time
+import zipfile
+
+import modelo_compilado
+import motor_zip
+from extracao import extrair_dados_da_mensagem
+
+NOME_MANIFESTO = "_manifesto.jsonl"
+
+# Estado dos processos do pool (preenchido antes do fork / no initializer)
+_modelo = None
+_motor = "zip"
+_pasta = None
+
+
+def ler_registros(caminho):
+    """Gera (numero, registro) em streaming a partir de JSONL ou CSV"""
+    if caminho.lower().endswith(".csv"):
+        with open(caminho, newline="", encoding="utf-8-sig") as f:
+            for numero, linha in enumerate(csv.DictReader(f), start=1):
+                yield numero, linha
+        return
+
+    with open(caminho, encoding="utf-8") as f:
+        for numero, linha in enumerate(f, start=1):
+            linha = linha.strip()
+            if not linha:
+                continue
+            try:
+                yield numero, json.loads(linha)
+            except ValueError as e:
+                yield numero, {"_erro_leitura": f"JSON inválido: {e}"}
+
+
+def identificador(numero, registro):
+    ident = registro.get("id") or registro.get("ID") or f"{numero:06d}"
+    return re.sub(r'[^\w\-.]', '_', str(ident))
+
+
+def normalizar_registro(registro):
+    """Converte o registro no dicionário de dados usado no preenchimento"""
+    if "_erro_leitura" in registro:
+        raise ValueError(registro["_erro_leitura"])
+
+    if registro.get("mensagem"):
+        return extrair_dados_da_mensagem(registro["mensagem"])
+
+    if isinstance(registro.get("dados"), dict):
+        return dict(registro["dados"])
+
+    return {
+        str(chave).upper(): valor
+        for chave, valor in registro.items()
+        if chave not in ("id", "ID")
+    }
+
+
+def nome_arquivo(ident, dados):
+    nome_cliente = str(dados.get("NOME") or "cliente").replace(" ", "_")
+    nome_cliente = re.sub(r'[^\w\-_.]', '', nome_cliente)[:40]
+    return f"{ident}_{nome_cliente}.docx"
+
+
+def _inicializar_worker(caminho_modelo, motor, pasta):
+    global _modelo, _motor, _pasta
+    logging.disable(logging.INFO)
+    _modelo = modelo_compilado.obter_modelo(caminho_modelo)
+    _motor = motor
+    _pasta = pasta
+
+
+def _renderizar_registro(item):
+    numero, registro = item
+    ident = identificador(numero, registro)
+    try:
+        dados = normalizar_registro(registro)
+        arquivo = nome_arquivo(ident, dados)
+        destino = os.path.join(_pasta, arquivo)
+        temporario = f"{destino}.{os.getpid()}.tmp"
+
+        if _motor == "zip":
+            with open(temporario, "wb") as f:
+                f.write(motor_zip.renderizar(_modelo, dados))
+        else:
+            import preencher
+            with contextlib.redirect_stdout(io.StringIO()):
+                preencher.preencher_modelo(io.BytesIO(_modelo.conteudo), temporario, dados)
+
+        os.replace(temporario, destino)
+        return {"id": ident, "linha": numero, "status": "ok", "arquivo": arquivo, "bytes": os.path.getsize(destino)}
+    except Exception as e:
+        return {"id": ident, "linha": numero, "status": "erro", "erro": str(e)}
+
+
+def restaurar_do_zip(destino, pasta):
+    """Arquivos de um ZIP de execução anterior; traz o manifesto dele se a pasta não tiver um"""
+    if not os.path.exists(destino):
+        return set()
+    with zipfile.ZipFile(destino) as pacote:
+        nomes = set(pacote.namelist())
+        manifesto = os.path.join(pasta, NOME_MANIFESTO)
+        if NOME_MANIFESTO in nomes and not os.path.exists(manifesto):
+            with open(manifesto, "wb") as f:
+                f.write(pacote.read(NOME_MANIFESTO))
+    return nomes
+
+
+def carregar_manifesto(pasta, arquivos_no_zip=()):
+    """IDs já gerados com sucesso em execuções anteriores (na pasta ou no ZIP anterior)"""
+    concluidos = set()
+    caminho = os.path.join(pasta, NOME_MANIFESTO)
+    if not os.path.exists(caminho):
+        return concluidos
+    with open(caminho, encoding="utf-8") as f:
+        for linha in f:
+            try:
+                entrada = json.loads(linha)
+            except ValueError:
+                continue
+            if entrada.get("status") != "ok":
+                continue
+            if entrada["arquivo"] in arquivos_no_zip or os.path.exists(os.path.join(pasta, entrada["arquivo"])):
+                concluidos.add(entrada["id"])
+    return concluidos
+
+
+def empacotar_zip(pasta, destino):
+    """
+    Monta o ZIP final (DOCX já é comprimido: membros gravados sem recompressão)
+
+    Documentos de um ZIP anterior no mesmo destino que não estão na pasta são
+    copiados dele (execução retomada depois de a pasta parcial ser removida).
+    """
+    temporario = destino + ".tmp"
+    locais = {nome for nome in os.listdir(pasta) if nome.endswith(".docx")}
+    with contextlib.ExitStack() as pilha:
+        anterior = pilha.enter_context(zipfile.ZipFile(destino)) if os.path.exists(destino) else None
+        herdados = {nome for nome in anterior.namelist() if nome.endswith(".docx")} - locais if anterior else set()
+        with zipfile.ZipFile(temporario, "w", compression=zipfile.ZIP_STORED) as pacote:
+            for nome in sorted(locais | herdados):
+                if nome in locais:
+                    pacote.write(os.path.join(pasta, nome), nome)
+                else:
+                    pacote.writestr(anterior.getinfo(nome), anterior.read(nome))
+            pacote.write(os.path.join(pasta, NOME_MANIFESTO), NOME_MANIFESTO)
+    os.replace(temporario, destino)
+
+
+def contar_registros(caminho):
+    if caminho.lower().endswith(".csv"):
+        with open(caminho, newline="", encoding="utf-8-sig") as f:
+            return sum(1 for _ in csv.DictReader(f))
+    with open(caminho, encoding="utf-8") as f:
+        return sum(1 for linha in f if linha.strip())
+
+
+def executar_lote(entrada, saida, workers=None, caminho_modelo=None, motor="zip"):
+    caminho_modelo = caminho_modelo or modelo_compilado.encontrar_modelo()
+    if not caminho_modelo:
+        raise SystemExit("❌ Nenhum modelo encontrado (template.docx / modelo.docx)")
+
+    saida_zip = saida.lower().endswith(".zip")
+    pasta = saida + ".parcial" if saida_zip else saida
+    os.makedirs(pasta, exist_ok=True)
+
+    arquivos_no_zip = restaurar_do_zip(saida, pasta) if saida_zip else set()
+    concluidos = carregar_manifesto(pasta, arquivos_no_zip)
+    total = contar_registros(entrada)
+    pendentes = (
+        (numero, registro)
+        for numero, registro in ler_registros(entrada)
+        if identificador(numero, registro) not in concluidos
+    )
+
+    # Compilado no processo pai: com fork, os workers herdam o modelo pronto
+    modelo_compilado.obter_modelo(caminho_modelo)
+    workers = workers or os.cpu_count() or 1
+    print(f"📦 {total} registro(s), {len(concluidos)} já gerado(s); {workers} worker(s), motor {motor}", file=sys.stderr)
+
+    inicio = time.perf_counter()
+    ultimo_progresso = 0.0
+    ok = len(concluidos)
+    erros = []
+
+    with open(os.path.join(pasta, NOME_MANIFESTO), "a", encoding="utf-8") as manifesto, \
+            multiprocessing.Pool(workers, _inicializar_worker, (caminho_modelo, motor, pasta)) as pool:
+        for resultado in pool.imap_unordered(_renderizar_registro, pendentes, chunksize=8):
+            manifesto.write(json.dumps(resultado, ensure_ascii=False) + "\n")
+            manifesto.flush()
+
+            if resultado["status"] == "ok":
+                ok += 1
+            else:
+                erros.append(resultado)
+                print(f"❌ Registro {resultado['id']} (linha {resultado['linha']}): {resultado['erro']}", file=sys.stderr)
+
+            agora = time.perf_counter()
+            if agora - ultimo_progresso >= 1:
+                ultimo_progresso = agora
+                feitos = ok + len(erros)
+                print(f"⏳ {feitos}/{total} ({(feitos - len(concluidos)) / (agora - inicio):.1f} doc/s)", file=sys.stderr)
+
+    if saida_zip:
+        empacotar_zip(pasta, saida)
+        if not erros:
+            shutil.rmtree(pasta)
+
+    duracao = time.perf_counter() - inicio
+    print(f"✅ {ok}/{total} gerado(s), {len(erros)} erro(s) em {duracao:.1f}s -> {saida}", file=sys.stderr)
+    return ok, erros
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Renderização de contratos em lote (JSONL/CSV -> DOCX)")
+    parser.add_argument("entrada", help="arquivo .jsonl ou .csv com os registros")
+    parser.add_argument("--saida", required=True, help="diretório de saída ou arquivo .zip")
+    parser.add_argument("--workers", type=int, default=None, help="processos (padrão: núcleos de CPU)")
+    parser.add_argument("--modelo", default=None, help="modelo DOCX (padrão: mesma busca da API)")
+    parser.add_argument("--motor", choices=("zip", "docx"), default="zip", help="motor de render (padrão: zip)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    _, erros = executar_lote(args.entrada, args.saida, args.workers, args.modelo, args.motor)
+    return 1 if erros else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,4 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import Response, JSONResponse
 from pydantic import BaseModel
@@ -8,10 +8,39 @@ import shutil
 import re
 from docx import Document
 from datetime import datetime
-from typing import Optional
+from typing import Dict, Optional
 import logging
 import base64
+import io
 import mimetypes
+import asyncio
+import time
+import uuid
+import anyio
+
+import metricas
+from admissao import ControleAdmissao, MiddlewareAdmissao
+from perfil import MiddlewarePerfil, Perfilador
+import memoria
+from memoria import OrcamentoMemoria
+import codificadores  # registra os formatos de saída do pipeline
+import compressao
+import imagens
+from imagens import ImagemInvalida
+from cache_render import obter_cache
+from entrega import ClienteEntrega, FalhaEntrega
+from envio_zapi import EnvioZApi, normalizar_telefone
+from armazem import ArmazemDocumentos
+from resposta_arquivo import RespostaArquivo
+from resposta_json import RespostaJSONRapida, serializar_json
+from microlote import MicroLote
+from pool_render import PoolRender
+from fila_jobs import FilaCheia, FilaJobs, STATUS_CONCLUIDO
+from pipeline import PipelineRender, codificadores_registrados, obter_codificador
+from extracao import campos_de_data, extrair_dados_da_mensagem, instante_documento
+from render_docx import (
+    renderizar_com_motor_zip, renderizar_com_python_docx, renderizar_fallback, verificar_placeholders_no_documento
+)
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
@@ -34,12 +63,28 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Limite de renders simultâneos e de fila; excesso recebe 429 + Retry-After
+controle_admissao = ControleAdmissao.do_ambiente()
+app.add_middleware(MiddlewareAdmissao, controle=controle_admissao)
+
+# Pico de memória por etapa (MEMORIA_RASTREAR) e orçamento de memória dos renders (MEMORIA_ORCAMENTO_MB)
+memoria.iniciar_rastreamento()
+orcamento_memoria = OrcamentoMemoria.do_ambiente()
+
+# Profiling sob demanda (PERFIL_TOKEN): requisição com X-Perfil roda sob o cProfile
+perfilador = Perfilador.do_ambiente()
+if perfilador:
+    app.add_middleware(MiddlewarePerfil, perfilador=perfilador)
+
 # Modelos Pydantic
 class MensagemRequest(BaseModel):
     mensagem: str
     webhook_id: Optional[str] = None
     origem: Optional[str] = "n8n"
     formato_resposta: Optional[str] = "binary"  # binary, base64, json
+    enviar_para: Optional[str] = None  # telefone: envio direto pela Z-API (ZAPI_URL)
+    data_referencia: Optional[datetime] = None  # instante dos campos DATA/HORA (padrão: agora)
+    imagens: Optional[Dict[str, str]] = None  # NOME -> base64 ou data URI, para {{IMG:NOME}} no modelo
 
 class MensagemResponse(BaseModel):
     sucesso: bool
@@ -58,386 +103,42 @@ class DocumentoResponse(BaseModel):
     dados_extraidos: dict
     timestamp: str
 
-def substituir_placeholders_robusto(paragrafos, dados):
-    """
-    Substitui placeholders de forma mais robusta, lidando com runs fragmentados
-    """
-    for paragrafo in paragrafos:
-        if not paragrafo.runs:
-            continue
-            
-        # Consolidar texto completo do parágrafo
-        texto_completo = ''.join(run.text for run in paragrafo.runs)
-        
-        # Verificar se há placeholders no texto
-        texto_modificado = texto_completo
-        houve_substituicao = False
-        
-        for chave, valor in dados.items():
-            placeholder = f'{{{{{chave}}}}}'
-            valor_str = str(valor) if valor is not None else "Não informado"
-            
-            if placeholder in texto_modificado:
-                texto_modificado = texto_modificado.replace(placeholder, valor_str)
-                houve_substituicao = True
-                logger.info(f"✅ Substituído: {placeholder} -> {valor_str}")
-        
-        # Se houve substituição, reconstruir o parágrafo
-        if houve_substituicao:
-            # Preservar formatação do primeiro run com conteúdo
-            formatacao_base = None
-            for run in paragrafo.runs:
-                if run.text.strip():
-                    formatacao_base = {
-                        'font_name': run.font.name,
-                        'font_size': run.font.size,
-                        'bold': run.font.bold,
-                        'italic': run.font.italic,
-                        'underline': run.font.underline,
-                        'color': run.font.color.rgb if run.font.color.rgb else None
-                    }
-                    break
-            
-            # Limpar todos os runs
-            for run in paragrafo.runs:
-                run.text = ""
-            
-            # Garantir que há pelo menos um run
-            if not paragrafo.runs:
-                paragrafo.add_run()
-            
-            # Aplicar texto modificado no primeiro run
-            primeiro_run = paragrafo.runs[0]
-            primeiro_run.text = texto_modificado
-            
-            # Aplicar formatação preservada
-            if formatacao_base:
-                try:
-                    if formatacao_base['font_name']:
-                        primeiro_run.font.name = formatacao_base['font_name']
-                    if formatacao_base['font_size']:
-                        primeiro_run.font.size = formatacao_base['font_size']
-                    primeiro_run.font.bold = formatacao_base['bold'] or False
-                    primeiro_run.font.italic = formatacao_base['italic'] or False
-                    primeiro_run.font.underline = formatacao_base['underline'] or False
-                    if formatacao_base['color']:
-                        primeiro_run.font.color.rgb = formatacao_base['color']
-                except Exception as e:
-                    logger.warning(f"Erro ao aplicar formatação: {e}")
+# Motor de render: "docx" (python-docx, padrão) ou "zip" (só reserializa as partes com placeholders)
+MOTOR_RENDER = os.environ.get("MOTOR_RENDER", "docx")
 
-def verificar_placeholders_no_documento(doc, dados):
-    """
-    Verifica e lista todos os placeholders encontrados no documento
-    """
-    placeholders_encontrados = set()
-    
-    # Verificar parágrafos principais
-    for paragrafo in doc.paragraphs:
-        texto = ''.join(run.text for run in paragrafo.runs)
-        matches = re.findall(r'\{\{([^}]+)\}\}', texto)
-        placeholders_encontrados.update(matches)
-    
-    # Verificar tabelas
-    for tabela in doc.tables:
-        for linha in tabela.rows:
-            for celula in linha.cells:
-                for paragrafo in celula.paragraphs:
-                    texto = ''.join(run.text for run in paragrafo.runs)
-                    matches = re.findall(r'\{\{([^}]+)\}\}', texto)
-                    placeholders_encontrados.update(matches)
-    
-    # Verificar cabeçalhos e rodapés
-    for section in doc.sections:
-        if section.header:
-            for paragrafo in section.header.paragraphs:
-                texto = ''.join(run.text for run in paragrafo.runs)
-                matches = re.findall(r'\{\{([^}]+)\}\}', texto)
-                placeholders_encontrados.update(matches)
-        
-        if section.footer:
-            for paragrafo in section.footer.paragraphs:
-                texto = ''.join(run.text for run in paragrafo.runs)
-                matches = re.findall(r'\{\{([^}]+)\}\}', texto)
-                placeholders_encontrados.update(matches)
-    
-    logger.info(f"📋 Placeholders encontrados no documento: {list(placeholders_encontrados)}")
-    logger.info(f"📊 Dados disponíveis para substituição: {list(dados.keys())}")
-    
-    # Verificar quais placeholders não têm dados correspondentes
-    sem_dados = [p for p in placeholders_encontrados if p not in dados]
-    if sem_dados:
-        logger.warning(f"⚠️ Placeholders sem dados correspondentes: {sem_dados}")
-    
-    return list(placeholders_encontrados)
+motores_render = {"docx": renderizar_com_python_docx, "zip": renderizar_com_motor_zip}
 
-def debug_documento_runs(doc, limite_paragrafos=5):
-    """
-    Função para debug - mostra como os runs estão organizados no documento
-    """
-    logger.info("🔍 DEBUG: Analisando estrutura de runs do documento")
-    
-    for i, paragrafo in enumerate(doc.paragraphs[:limite_paragrafos]):
-        if not paragrafo.runs:
-            continue
-            
-        texto_completo = ''.join(run.text for run in paragrafo.runs)
-        if '{{' in texto_completo:
-            logger.info(f"📍 Parágrafo {i}: '{texto_completo[:100]}...'")
-            logger.info(f"   Número de runs: {len(paragrafo.runs)}")
-            
-            for j, run in enumerate(paragrafo.runs):
-                if run.text:
-                    logger.info(f"   Run {j}: '{run.text}'")
+# Pool de processos opcional (RENDER_POOL_WORKERS, ou RENDER_POOL_MIN/MAX para o tamanho
+# adaptativo), com micro-batching (MICROLOTE_MAX)
+pool_render = PoolRender.do_ambiente(MOTOR_RENDER)
+if pool_render:
+    pool_render.microlote = MicroLote.do_ambiente(pool_render.enviar_lote)
+    motores_render[MOTOR_RENDER] = pool_render.renderizar
+    metricas.registrar_medidor("pool_render", pool_render.exportar)
 
-def preencher_modelo(caminho_modelo, caminho_saida, dados):
-    """Preenche um modelo DOCX com os dados fornecidos - VERSÃO CORRIGIDA"""
-    try:
-        logger.info(f"📖 Abrindo modelo: {caminho_modelo}")
-        doc = Document(caminho_modelo)
-        
-        # Preparar dados - garantir que todos os valores sejam strings
-        dados_limpos = {}
-        for chave, valor in dados.items():
-            if valor is None or valor == "":
-                dados_limpos[chave] = "Não informado"
-            else:
-                dados_limpos[chave] = str(valor).strip()
-        
-        logger.info(f"📋 Dados preparados para substituição:")
-        for chave, valor in dados_limpos.items():
-            logger.info(f"   {chave}: {valor}")
-        
-        # Debug: verificar estrutura do documento se necessário
-        debug_documento_runs(doc, limite_paragrafos=3)
-        
-        # Verificar placeholders antes da substituição
-        placeholders_iniciais = verificar_placeholders_no_documento(doc, dados_limpos)
-        
-        # Processar parágrafos principais
-        logger.info("📄 Processando parágrafos principais...")
-        substituir_placeholders_robusto(doc.paragraphs, dados_limpos)
-        
-        # Processar tabelas
-        logger.info("📊 Processando tabelas...")
-        for i, tabela in enumerate(doc.tables):
-            for j, linha in enumerate(tabela.rows):
-                for k, celula in enumerate(linha.cells):
-                    substituir_placeholders_robusto(celula.paragraphs, dados_limpos)
-        
-        # Processar cabeçalhos e rodapés
-        logger.info("📑 Processando cabeçalhos e rodapés...")
-        for i, section in enumerate(doc.sections):
-            if section.header:
-                substituir_placeholders_robusto(section.header.paragraphs, dados_limpos)
-            if section.footer:
-                substituir_placeholders_robusto(section.footer.paragraphs, dados_limpos)
-        
-        # Salvar documento
-        logger.info(f"💾 Salvando documento em: {caminho_saida}")
-        doc.save(caminho_saida)
-        
-        # Verificação final
-        doc_verificacao = Document(caminho_saida)
-        placeholders_restantes = verificar_placeholders_no_documento(doc_verificacao, dados_limpos)
-        
-        if placeholders_restantes:
-            logger.warning(f"⚠️ ATENÇÃO: Ainda existem placeholders não substituídos: {placeholders_restantes}")
-            
-            # Tentar substituição adicional mais agressiva
-            logger.info("🔧 Tentando substituição adicional...")
-            for paragrafo in doc_verificacao.paragraphs:
-                texto_original = paragrafo.text
-                if '{{' in texto_original:
-                    # Substituição direta no texto do parágrafo
-                    novo_texto = texto_original
-                    for chave, valor in dados_limpos.items():
-                        placeholder = f'{{{{{chave}}}}}'
-                        if placeholder in novo_texto:
-                            novo_texto = novo_texto.replace(placeholder, valor)
-                    
-                    if novo_texto != texto_original:
-                        # Limpar runs e recriar
-                        for run in paragrafo.runs:
-                            run.text = ""
-                        if paragrafo.runs:
-                            paragrafo.runs[0].text = novo_texto
-                        else:
-                            paragrafo.add_run(novo_texto)
-                        
-                        logger.info(f"🔧 Correção aplicada: '{texto_original[:50]}...' -> '{novo_texto[:50]}...'")
-            
-            # Processar tabelas na verificação final
-            for tabela in doc_verificacao.tables:
-                for linha in tabela.rows:
-                    for celula in linha.cells:
-                        for paragrafo in celula.paragraphs:
-                            texto_original = paragrafo.text
-                            if '{{' in texto_original:
-                                novo_texto = texto_original
-                                for chave, valor in dados_limpos.items():
-                                    placeholder = f'{{{{{chave}}}}}'
-                                    if placeholder in novo_texto:
-                                        novo_texto = novo_texto.replace(placeholder, valor)
-                                
-                                if novo_texto != texto_original:
-                                    for run in paragrafo.runs:
-                                        run.text = ""
-                                    if paragrafo.runs:
-                                        paragrafo.runs[0].text = novo_texto
-                                    else:
-                                        paragrafo.add_run(novo_texto)
-                                    
-                                    logger.info(f"🔧 Correção em tabela: '{texto_original[:30]}...' -> '{novo_texto[:30]}...'")
-            
-            # Salvar novamente após correções
-            doc_verificacao.save(caminho_saida)
-            
-            # Verificação final final
-            doc_final = Document(caminho_saida)
-            placeholders_finais = verificar_placeholders_no_documento(doc_final, dados_limpos)
-            
-            if placeholders_finais:
-                logger.error(f"❌ AINDA RESTAM placeholders não substituídos: {placeholders_finais}")
-            else:
-                logger.info("✅ Correção bem-sucedida! Todos os placeholders foram substituídos.")
-        else:
-            logger.info("✅ Todos os placeholders foram substituídos com sucesso!")
-        
-        logger.info("✅ Processamento concluído!")
-        return True
-        
-    except Exception as e:
-        logger.error(f"❌ Erro ao preencher modelo: {str(e)}")
-        raise Exception(f"Erro ao preencher modelo: {str(e)}")
+def encerrar_pool_render():
+    if pool_render:
+        pool_render.encerrar()
 
-def extrair_dados_da_mensagem(mensagem: str) -> dict:
-    """Extrai os dados da mensagem com validação aprimorada"""
-    dados = {}
-    
-    # Log da mensagem recebida para debug
-    logger.info(f"📨 Mensagem recebida para extração:")
-    logger.info(f"   Tamanho: {len(mensagem)} caracteres")
-    logger.info(f"   Prévia: {mensagem[:200]}...")
-    
-    padroes = {
-        "NOME": [
-            r"Nome:\s*(.+?)(?=\n|$)", 
-            r"nome:\s*(.+?)(?=\n|$)",
-            r"NOME:\s*(.+?)(?=\n|$)"
-        ],
-        "EMAIL": [
-            r"Email:\s*(.+?)(?=\n|$)", 
-            r"email:\s*(.+?)(?=\n|$)", 
-            r"E-mail:\s*(.+?)(?=\n|$)",
-            r"EMAIL:\s*(.+?)(?=\n|$)"
-        ],
-        "CPF": [
-            r"CPF:\s*(.+?)(?=\n|$)", 
-            r"cpf:\s*(.+?)(?=\n|$)"
-        ],
-        "ENDERECO": [
-            r"Endereço:\s*(.+?)(?=\n|$)", 
-            r"endereco:\s*(.+?)(?=\n|$)", 
-            r"Endereco:\s*(.+?)(?=\n|$)",
-            r"ENDERECO:\s*(.+?)(?=\n|$)"
-        ],
-        "CEP": [
-            r"CEP:\s*(.+?)(?=\n|$)", 
-            r"cep:\s*(.+?)(?=\n|$)"
-        ],
-        "TELEFONE": [
-            r"Telefone:\s*(.+?)(?=\n|$)", 
-            r"telefone:\s*(.+?)(?=\n|$)", 
-            r"Fone:\s*(.+?)(?=\n|$)",
-            r"TELEFONE:\s*(.+?)(?=\n|$)"
-        ],
-        "VALOR": [
-            r"Valor:\s*(.+?)(?=\n|$)", 
-            r"valor:\s*(.+?)(?=\n|$)",
-            r"VALOR:\s*(.+?)(?=\n|$)"
-        ],
-        "PARCELAS": [
-            r"Quantidade de Parcelas:\s*(.+?)(?=\n|$)", 
-            r"quantidade de parcelas:\s*(.+?)(?=\n|$)",
-            r"Parcelas:\s*(.+?)(?=\n|$)",
-            r"parcelas:\s*(.+?)(?=\n|$)",
-            r"PARCELAS:\s*(.+?)(?=\n|$)"
-        ],
-        "FORMA_PAGAMENTO": [
-            r"Forma de pagamento:\s*(.+?)(?=\n|$)", 
-            r"forma de pagamento:\s*(.+?)(?=\n|$)",
-            r"Pagamento:\s*(.+?)(?=\n|$)",
-            r"pagamento:\s*(.+?)(?=\n|$)",
-            r"FORMA_PAGAMENTO:\s*(.+?)(?=\n|$)"
-        ]
-    }
-    
-    # Extrair dados usando os padrões
-    for campo, padroes_campo in padroes.items():
-        valor_encontrado = None
-        for padrao in padroes_campo:
-            match = re.search(padrao, mensagem, re.IGNORECASE | re.MULTILINE)
-            if match:
-                valor_encontrado = match.group(1).strip()
-                logger.info(f"✅ {campo}: {valor_encontrado}")
-                break
-        
-        dados[campo] = valor_encontrado if valor_encontrado else "Não informado"
-        
-        if not valor_encontrado:
-            logger.info(f"⚠️ {campo}: Não encontrado")
-    
-    # Adicionar campos de data/hora automaticamente
-    agora = datetime.now()
-    dados["DATA"] = agora.strftime("%d/%m/%Y")
-    dados["HORA"] = agora.strftime("%H:%M:%S")
-    dados["DATA_HORA"] = agora.strftime("%d/%m/%Y %H:%M:%S")
-    dados["DATA_PROCESSAMENTO"] = agora.strftime("%d/%m/%Y %H:%M:%S")
-    dados["TIMESTAMP"] = agora.isoformat()
-    
-    # Campos derivados
-    dados["PACIENTE"] = dados["NOME"]
-    dados["ARQUIVO_FONTE"] = "API N8N Cloud"
-    
-    logger.info(f"📊 Resumo da extração:")
-    logger.info(f"   Total de campos extraídos: {len([v for v in dados.values() if v != 'Não informado'])}")
-    logger.info(f"   Campos sem valor: {len([v for v in dados.values() if v == 'Não informado'])}")
-    
-    return dados
+# Armazém de documentos (ARMAZEM_DIR): respostas JSON com download_url em vez de base64
+armazem = ArmazemDocumentos.do_ambiente()
 
-def criar_documento_fallback(dados: dict, output_path: str) -> None:
-    """Cria um documento DOCX simples com os dados extraídos"""
-    doc = Document()
-    
-    # Cabeçalho
-    doc.add_heading('Dados do Cliente', 0)
-    doc.add_paragraph(f'Processado em: {dados.get("DATA_HORA", "N/A")}')
-    doc.add_paragraph('---')
-    
-    # Seção de informações pessoais
-    doc.add_heading('Informações Pessoais', level=1)
-    doc.add_paragraph(f'Nome: {dados.get("NOME", "Não informado")}')
-    doc.add_paragraph(f'Email: {dados.get("EMAIL", "Não informado")}')
-    doc.add_paragraph(f'CPF: {dados.get("CPF", "Não informado")}')
-    doc.add_paragraph(f'Telefone: {dados.get("TELEFONE", "Não informado")}')
-    
-    # Seção de endereço
-    doc.add_heading('Endereço', level=1)
-    doc.add_paragraph(f'Endereço: {dados.get("ENDERECO", "Não informado")}')
-    doc.add_paragraph(f'CEP: {dados.get("CEP", "Não informado")}')
-    
-    # Seção financeira
-    doc.add_heading('Informações Financeiras', level=1)
-    doc.add_paragraph(f'Valor: {dados.get("VALOR", "Não informado")}')
-    doc.add_paragraph(f'Quantidade de Parcelas: {dados.get("PARCELAS", "Não informado")}')
-    doc.add_paragraph(f'Forma de Pagamento: {dados.get("FORMA_PAGAMENTO", "Não informado")}')
-    
-    # Adicionar data/hora
-    doc.add_heading('Informações do Processamento', level=1)
-    doc.add_paragraph(f'Data: {dados.get("DATA", "N/A")}')
-    doc.add_paragraph(f'Hora: {dados.get("HORA", "N/A")}')
-    
-    doc.save(output_path)
+# Pipeline único usado por todos os endpoints de geração (codificadores em codificadores.py)
+pipeline = PipelineRender(
+    extrair=extrair_dados_da_mensagem,
+    motores=motores_render,
+    renderizar_fallback=renderizar_fallback,
+    motor=MOTOR_RENDER,
+    armazem=armazem,
+    orcamento=orcamento_memoria
+)
+
+metricas.registrar_medidor("memoria", lambda: dict(
+    memoria.exportar_processo(),
+    orcamento=orcamento_memoria.exportar() if orcamento_memoria else None
+))
+metricas.registrar_medidor("imagens", imagens.exportar)
+metricas.registrar_medidor("compressao", compressao.exportar)
 
 @app.get("/")
 async def root():
@@ -451,8 +152,14 @@ async def root():
             "gerar_documento": "POST /gerar-documento (retorna binário)",
             "gerar_documento_base64": "POST /gerar-documento-base64 (retorna JSON com base64)",
             "gerar_documento_whatsapp": "POST /gerar-documento-whatsapp (otimizado para Z-API)",
-            "webhook": "POST /webhook/processar",
+            "gerar_documento_zapi": "POST /gerar-documento-zapi (formato exato da Z-API; com enviar_para, envia direto)",
+            "gerar_documento_formato": "POST /gerar-documento/{formato} (binario, base64, whatsapp, zapi, pdf)",
+            "webhook": "POST /webhook/processar (com callback_url: 202 e documento entregue no callback)",
+            "jobs": "POST /jobs (assíncrono: retorna job id), GET /jobs/{job_id}, GET /jobs/{job_id}/resultado",
             "health": "GET /health",
+            "ready": "GET /ready (pronto após o aquecimento)",
+            "metrics": "GET /metrics",
+            "documentos": "GET /documentos/{hash} (download_url assinado, com ARMAZEM_DIR)",
             "test_substituicao": "POST /test-substituicao (para debug)"
         }
     }
@@ -469,6 +176,15 @@ async def health_check():
         "hora_atual": datetime.now().strftime("%H:%M:%S")
     }
 
+@app.get("/metrics")
+async def metrics():
+    """Métricas do worker: admissão, filas, cache e tempos por etapa"""
+    resultado = metricas.exportar()
+    cache = obter_cache()
+    if cache:
+        resultado["cache_render"] = cache.estatisticas()
+    return resultado
+
 @app.post("/test-substituicao")
 async def test_substituicao():
     """Endpoint para testar substituições de placeholder"""
@@ -500,321 +216,108 @@ async def test_substituicao():
     }
 
 @app.post("/gerar-documento")
-async def gerar_documento(request: MensagemRequest):
-    """Endpoint para processar mensagem E gerar documento DOCX (retorna binário)"""
+def gerar_documento(request: MensagemRequest, if_none_match: Optional[str] = Header(None)):
+    """Endpoint para processar mensagem E gerar documento DOCX (retorna binário)
+    
+    A resposta leva ETag forte; com If-None-Match igual, devolve 304 sem renderizar.
+    """
     logger.info("=== GERAÇÃO DE DOCUMENTO N8N CLOUD (BINÁRIO) ===")
     logger.info(f"Data/Hora: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}")
-    
-    temp_dir = tempfile.mkdtemp()
-    output_path = None
-    
-    try:
-        # Extrair dados
-        dados_extraidos = extrair_dados_da_mensagem(request.mensagem)
-        logger.info("Dados extraídos para documento")
-        
-        # Definir nome do arquivo
-        nome_cliente = dados_extraidos.get("NOME", "cliente").replace(" ", "_")
-        nome_cliente = re.sub(r'[^\w\-_.]', '', nome_cliente)
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        output_filename = f"documento_{nome_cliente}_{timestamp}.docx"
-        output_path = os.path.join(temp_dir, output_filename)
-        
-        logger.info(f"Gerando documento: {output_filename}")
-        
-        try:
-            # Procurar template
-            possible_templates = [
-                "template.docx",
-                "modelo.docx",
-                "templates/template.docx",
-                "templates/modelo.docx"
-            ]
-            
-            template_encontrado = None
-            for template_path in possible_templates:
-                if os.path.exists(template_path):
-                    template_encontrado = template_path
-                    break
-            
-            if template_encontrado:
-                logger.info(f"Template encontrado: {template_encontrado}")
-                preencher_modelo(template_encontrado, output_path, dados_extraidos)
-                logger.info("Template preenchido com sucesso")
-            else:
-                logger.info("Template não encontrado, criando documento padrão")
-                criar_documento_fallback(dados_extraidos, output_path)
-                
-        except Exception as e:
-            logger.error(f"Erro no preenchimento: {e}")
-            logger.info("Criando documento fallback...")
-            criar_documento_fallback(dados_extraidos, output_path)
-        
-        # Verificar se arquivo foi criado
-        if not os.path.exists(output_path):
-            raise Exception("Documento não foi gerado")
-        
-        file_size = os.path.getsize(output_path)
-        logger.info(f"Documento criado: {file_size} bytes")
-        
-        # Ler arquivo
-        with open(output_path, "rb") as f:
-            docx_content = f.read()
-        
-        return Response(
-            content=docx_content,
-            media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-            headers={
-                "Content-Disposition": f"attachment; filename={output_filename}",
-                "Content-Length": str(len(docx_content)),
-                "Cache-Control": "no-cache",
-                "X-Filename": output_filename,
-                "X-File-Size": str(file_size)
-            }
-        )
-        
-    except Exception as e:
-        logger.error(f"ERRO CRÍTICO: {e}")
-        raise HTTPException(status_code=500, detail=f"Erro na geração do documento: {str(e)}")
-    
-    finally:
-        # Limpar arquivos temporários
-        try:
-            if temp_dir and os.path.exists(temp_dir):
-                shutil.rmtree(temp_dir)
-                logger.info("Arquivos temporários removidos")
-        except Exception as e:
-            logger.warning(f"Erro na limpeza: {e}")
+    return pipeline.gerar(request.mensagem, "binario", data_referencia=request.data_referencia, if_none_match=if_none_match, imagens=request.imagens)
 
-@app.post("/gerar-documento-base64", response_model=DocumentoResponse)
-async def gerar_documento_base64(request: MensagemRequest):
+@app.post("/gerar-documento-base64", response_model=DocumentoResponse, response_class=RespostaJSONRapida)
+def gerar_documento_base64(request: MensagemRequest, accept_encoding: Optional[str] = Header(None)):
     """Endpoint que retorna o documento em base64 (ideal para integração com APIs)"""
     logger.info("=== GERAÇÃO DE DOCUMENTO N8N CLOUD (BASE64) ===")
     logger.info(f"Data/Hora: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}")
-    
-    temp_dir = tempfile.mkdtemp()
-    output_path = None
-    
-    try:
-        # Extrair dados
-        dados_extraidos = extrair_dados_da_mensagem(request.mensagem)
-        logger.info("Dados extraídos para documento")
-        
-        # Definir nome do arquivo
-        nome_cliente = dados_extraidos.get("NOME", "cliente").replace(" ", "_")
-        nome_cliente = re.sub(r'[^\w\-_.]', '', nome_cliente)
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        output_filename = f"documento_{nome_cliente}_{timestamp}.docx"
-        output_path = os.path.join(temp_dir, output_filename)
-        
-        logger.info(f"Gerando documento: {output_filename}")
-        
-        try:
-            # Procurar template
-            possible_templates = [
-                "template.docx",
-                "modelo.docx",
-                "templates/template.docx",
-                "templates/modelo.docx"
-            ]
-            
-            template_encontrado = None
-            for template_path in possible_templates:
-                if os.path.exists(template_path):
-                    template_encontrado = template_path
-                    break
-            
-            if template_encontrado:
-                logger.info(f"Template encontrado: {template_encontrado}")
-                preencher_modelo(template_encontrado, output_path, dados_extraidos)
-                logger.info("Template preenchido com sucesso")
-            else:
-                logger.info("Template não encontrado, criando documento padrão")
-                criar_documento_fallback(dados_extraidos, output_path)
-                
-        except Exception as e:
-            logger.error(f"Erro no preenchimento: {e}")
-            logger.info("Criando documento fallback...")
-            criar_documento_fallback(dados_extraidos, output_path)
-        
-        # Verificar se arquivo foi criado
-        if not os.path.exists(output_path):
-            raise Exception("Documento não foi gerado")
-        
-        file_size = os.path.getsize(output_path)
-        logger.info(f"Documento criado: {file_size} bytes")
-        
-        # Converter para base64
-        with open(output_path, "rb") as f:
-            docx_content = f.read()
-            base64_content = base64.b64encode(docx_content).decode('utf-8')
-        
-        mime_type = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-        
-        return DocumentoResponse(
-            success=True,
-            message="Documento gerado com sucesso",
-            filename=output_filename,
-            file_size=file_size,
-            mime_type=mime_type,
-            base64_content=base64_content,
-            dados_extraidos=dados_extraidos,
-            timestamp=datetime.now().isoformat()
-        )
-        
-    except Exception as e:
-        logger.error(f"ERRO CRÍTICO: {e}")
-        raise HTTPException(status_code=500, detail=f"Erro na geração do documento: {str(e)}")
-    
-    finally:
-        # Limpar arquivos temporários
-        try:
-            if temp_dir and os.path.exists(temp_dir):
-                shutil.rmtree(temp_dir)
-                logger.info("Arquivos temporários removidos")
-        except Exception as e:
-            logger.warning(f"Erro na limpeza: {e}")
+    return pipeline.gerar(request.mensagem, "base64", data_referencia=request.data_referencia, imagens=request.imagens,
+                          accept_encoding=accept_encoding)
 
-@app.post("/gerar-documento-whatsapp")
-async def gerar_documento_whatsapp(request: MensagemRequest):
+@app.post("/gerar-documento-whatsapp", response_class=RespostaJSONRapida)
+def gerar_documento_whatsapp(request: MensagemRequest, accept_encoding: Optional[str] = Header(None)):
     """Endpoint otimizado para envio via WhatsApp usando Z-API"""
     logger.info("=== GERAÇÃO DE DOCUMENTO PARA WHATSAPP ===")
     logger.info(f"Data/Hora: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}")
-    
-    temp_dir = tempfile.mkdtemp()
-    output_path = None
-    
+    return pipeline.gerar(request.mensagem, "whatsapp", data_referencia=request.data_referencia, imagens=request.imagens,
+                          accept_encoding=accept_encoding)
+
+# Modo callback do webhook: renderiza em segundo plano e entrega no callback_url
+cliente_entrega = ClienteEntrega.do_ambiente()
+tarefas_callback = set()
+
+metricas.registrar_medidor("entregas", cliente_entrega.exportar)
+metricas.registrar_medidor("callbacks_pendentes", lambda: len(tarefas_callback))
+
+async def processar_callback(callback_url: str, dados_extraidos: dict, formato: str, id_entrega: str):
+    """Gera o documento e faz POST do resultado no callback (mesmo corpo do endpoint do formato)"""
     try:
-        # Extrair dados
-        dados_extraidos = extrair_dados_da_mensagem(request.mensagem)
-        logger.info("Dados extraídos para documento WhatsApp")
-        
-        # Definir nome do arquivo (mais curto para WhatsApp)
-        nome_cliente = dados_extraidos.get("NOME", "cliente").replace(" ", "_")
-        nome_cliente = re.sub(r'[^\w\-_.]', '', nome_cliente)[:15]  # Limitar tamanho
-        timestamp = datetime.now().strftime('%d%m%Y_%H%M')
-        output_filename = f"doc_{nome_cliente}_{timestamp}.docx"
-        output_path = os.path.join(temp_dir, output_filename)
-        
-        logger.info(f"Gerando documento para WhatsApp: {output_filename}")
-        
-        try:
-            # Procurar template
-            possible_templates = [
-                "template.docx",
-                "modelo.docx",
-                "templates/template.docx",
-                "templates/modelo.docx"
-            ]
-            
-            template_encontrado = None
-            for template_path in possible_templates:
-                if os.path.exists(template_path):
-                    template_encontrado = template_path
-                    break
-            
-            if template_encontrado:
-                logger.info(f"Template encontrado: {template_encontrado}")
-                preencher_modelo(template_encontrado, output_path, dados_extraidos)
-                logger.info("Template preenchido com sucesso")
-            else:
-                logger.info("Template não encontrado, criando documento padrão")
-                criar_documento_fallback(dados_extraidos, output_path)
-                
-        except Exception as e:
-            logger.error(f"Erro no preenchimento: {e}")
-            logger.info("Criando documento fallback...")
-            criar_documento_fallback(dados_extraidos, output_path)
-        
-        # Verificar se arquivo foi criado
-        if not os.path.exists(output_path):
-            raise Exception("Documento não foi gerado")
-        
-        file_size = os.path.getsize(output_path)
-        logger.info(f"Documento criado: {file_size} bytes")
-        
-        # Verificar se o arquivo não está corrompido
-        if file_size < 1000:  # DOCX mínimo tem pelo menos 1KB
-            raise Exception("Arquivo gerado parece estar corrompido (muito pequeno)")
-        
-        # Converter para base64 com validação
-        with open(output_path, "rb") as f:
-            docx_content = f.read()
-            
-            # Validar se é um arquivo DOCX válido (inicia com PK)
-            if not docx_content.startswith(b'PK'):
-                raise Exception("Arquivo gerado não é um DOCX válido")
-            
-            # Gerar base64 limpo
-            base64_content = base64.b64encode(docx_content).decode('utf-8')
-            
-            # Verificar se base64 foi gerado corretamente
-            if not base64_content or len(base64_content) < 100:
-                raise Exception("Erro na codificação base64")
-            
-            logger.info(f"Base64 gerado: {len(base64_content)} caracteres")
-        
-        # Criar caption curta para WhatsApp
-        nome_curto = dados_extraidos.get('NOME', 'Cliente')[:30]
-        caption = f"📄 {nome_curto}\n📅 {dados_extraidos.get('DATA', 'N/A')} {dados_extraidos.get('HORA', 'N/A')}"
-        
-        # Resposta otimizada para integração com Z-API
-        return {
-            "success": True,
-            "status": "document_ready",
-            "message": "Documento gerado com sucesso para WhatsApp",
-            "file": {
-                "filename": output_filename,
-                "base64": base64_content,
-                "mimetype": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-                "caption": caption,
-                "size": file_size
-            },
-            # Formato alternativo para diferentes APIs
-            "whatsapp_data": {
-                "filename": output_filename,
-                "base64": base64_content,
-                "mimetype": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-                "caption": caption
-            },
-            "document_info": {
-                "filename": output_filename,
-                "file_size": file_size,
-                "mime_type": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-                "base64_length": len(base64_content)
-            },
-            "dados_extraidos": dados_extraidos,
-            "timestamp": datetime.now().isoformat(),
-            "environment": "production"
-        }
-        
+        resposta = await asyncio.to_thread(pipeline.gerar, None, formato, dados_extraidos)
+        corpo = resposta.body
+        headers = {chave: valor for chave, valor in resposta.headers.items() if chave != "content-length"}
     except Exception as e:
-        logger.error(f"ERRO CRÍTICO: {e}")
-        return {
+        logger.error(f"❌ Erro na geração para callback {id_entrega}: {e}")
+        corpo = serializar_json({
             "success": False,
-            "status": "error",
-            "message": f"Erro na geração do documento: {str(e)}",
+            "error": str(getattr(e, "detail", e)),
             "timestamp": datetime.now().isoformat()
-        }
+        })
+        headers = {"content-type": "application/json"}
     
-    finally:
-        # Limpar arquivos temporários
-        try:
-            if temp_dir and os.path.exists(temp_dir):
-                shutil.rmtree(temp_dir)
-                logger.info("Arquivos temporários removidos")
-        except Exception as e:
-            logger.warning(f"Erro na limpeza: {e}")
+    headers["X-Entrega-Id"] = id_entrega
+    try:
+        entregue = await cliente_entrega.enviar(callback_url, corpo, headers)
+        logger.info(f"📤 Callback {id_entrega} entregue em {callback_url} (HTTP {entregue.status_code}, {len(corpo)} bytes)")
+    except FalhaEntrega as e:
+        logger.error(f"❌ {e}")
 
-@app.post("/webhook/processar")
+def agendar_callback(callback_url: str, dados_extraidos: dict, formato: str, agora: datetime):
+    if not callback_url.startswith(("http://", "https://")):
+        return RespostaJSONRapida({
+            "status": "error",
+            "message": "callback_url deve ser uma URL http(s)",
+            "timestamp": agora.isoformat()
+        }, status_code=400)
+    if obter_codificador(formato) is None:
+        return RespostaJSONRapida({
+            "status": "error",
+            "message": f"Formato de saída desconhecido: {formato}",
+            "formatos": sorted(codificadores_registrados()),
+            "timestamp": agora.isoformat()
+        }, status_code=400)
+    
+    id_entrega = uuid.uuid4().hex
+    tarefa = asyncio.create_task(processar_callback(callback_url, dados_extraidos, formato, id_entrega))
+    tarefas_callback.add(tarefa)
+    tarefa.add_done_callback(tarefas_callback.discard)
+    
+    logger.info(f"📥 Callback {id_entrega} agendado: formato {formato} -> {callback_url}")
+    return RespostaJSONRapida({
+        "status": "accepted",
+        "message": "Documento será entregue no callback_url",
+        "entrega_id": id_entrega,
+        "callback_url": callback_url,
+        "formato": formato,
+        "dados": dados_extraidos,
+        "timestamp": agora.isoformat()
+    }, status_code=202)
+
+@app.post("/webhook/processar", response_class=RespostaJSONRapida)
 async def webhook_processar(dados: dict):
-    """Endpoint específico para webhooks do N8N"""
+    """Endpoint específico para webhooks do N8N
+    
+    Com "callback_url" no corpo, responde 202 na hora, gera o documento em
+    segundo plano (formato em "formato", padrão base64) e faz POST do resultado
+    no callback. "data_referencia" (ISO 8601) fixa os campos de data do documento.
+    """
     logger.info("=== WEBHOOK N8N CLOUD ===")
     logger.info(f"Data/Hora: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}")
     logger.info(f"Dados recebidos: {dados}")
     
     try:
         agora = datetime.now()
+        data_referencia = dados.get("data_referencia")
+        if data_referencia:
+            data_referencia = datetime.fromisoformat(str(data_referencia))
         
         # Verificar se tem mensagem em texto
         mensagem_texto = None
@@ -826,7 +329,7 @@ async def webhook_processar(dados: dict):
             mensagem_texto = dados["texto"]
         
         if mensagem_texto:
-            dados_extraidos = extrair_dados_da_mensagem(mensagem_texto)
+            dados_extraidos = extrair_dados_da_mensagem(mensagem_texto, data_referencia)
         else:
             dados_extraidos = {
                 "NOME": dados.get("nome") or dados.get("NOME") or "Não informado",
@@ -840,23 +343,29 @@ async def webhook_processar(dados: dict):
                 "FORMA_PAGAMENTO": dados.get("forma_pagamento") or dados.get("FORMA_PAGAMENTO") or "Não informado",
                 "PACIENTE": dados.get("nome") or dados.get("NOME") or "Não informado",
                 
-                "DATA": agora.strftime("%d/%m/%Y"),
-                "HORA": agora.strftime("%H:%M:%S"),
-                "DATA_HORA": agora.strftime("%d/%m/%Y %H:%M:%S"),
-                "DATA_PROCESSAMENTO": agora.strftime("%d/%m/%Y %H:%M:%S"),
-                "TIMESTAMP": agora.isoformat(),
+                **campos_de_data(instante_documento(data_referencia)),
                 "ARQUIVO_FONTE": "Webhook N8N Cloud"
             }
+        if dados.get("imagens"):
+            # Decodificação e redução das imagens (Pillow) fora do event loop
+            dados_extraidos.update(await asyncio.to_thread(imagens.registrar, dados.get("imagens")))
         
-        return {
+        callback_url = dados.get("callback_url") or dados.get("callback")
+        if callback_url:
+            return agendar_callback(str(callback_url), dados_extraidos, dados.get("formato") or "base64", agora)
+        
+        return RespostaJSONRapida({
             "status": "success",
             "message": "Dados processados com sucesso",
             "dados": dados_extraidos,
             "timestamp": agora.isoformat(),
             "data_processamento": agora.strftime("%d/%m/%Y %H:%M:%S"),
             "environment": "production"
-        }
+        })
         
+    except ImagemInvalida as e:
+        logger.warning(f"🖼️ Imagem recusada (webhook): {e}")
+        raise HTTPException(status_code=422, detail=str(e))
     except Exception as e:
         logger.error(f"Erro no webhook: {e}")
         return {
@@ -865,99 +374,285 @@ async def webhook_processar(dados: dict):
             "timestamp": datetime.now().isoformat()
         }
 
-@app.post("/gerar-documento-zapi")
-async def gerar_documento_zapi(request: MensagemRequest):
-    """Endpoint específico para Z-API com formato exato que ela espera"""
+# Envio direto à Z-API (opcional): evita o segundo salto do base64 pelo N8N
+envio_zapi = EnvioZApi.do_ambiente(cliente_entrega)
+
+def enviar_documento_zapi(request: MensagemRequest):
+    """Gera o documento e envia pela Z-API; a resposta não carrega o base64"""
+    agora = datetime.now()
+    telefone = normalizar_telefone(request.enviar_para)
+    if envio_zapi is None or len(telefone) < 12:
+        return RespostaJSONRapida({
+            "success": False,
+            "error": "Envio direto não configurado (ZAPI_URL)" if envio_zapi is None else f"Telefone inválido: {request.enviar_para}",
+            "timestamp": agora.isoformat()
+        }, status_code=400)
+    
+    codificador = obter_codificador("zapi")
+    try:
+        dados_extraidos = pipeline.extrair(request.mensagem, request.data_referencia, request.imagens)
+        documento = pipeline.renderizar(dados_extraidos)
+        pipeline.validar(documento)
+        filename = codificador.nome_arquivo(dados_extraidos, agora)
+        
+        with metricas.medir_etapa("zapi_envio"):
+            retorno = anyio.from_thread.run(
+                envio_zapi.enviar_documento, telefone, documento.conteudo, filename, codificador.media_type
+            )
+    except FalhaEntrega as e:
+        logger.error(f"❌ {e}")
+        return RespostaJSONRapida({
+            "success": False,
+            "error": str(e),
+            "timestamp": datetime.now().isoformat()
+        }, status_code=502)
+    except Exception as e:
+        logger.error(f"ERRO CRÍTICO: {e}")
+        return codificador.erro(e)
+    
+    return RespostaJSONRapida({
+        "success": True,
+        "enviado": True,
+        "phone": telefone,
+        "filename": filename,
+        "size": documento.tamanho,
+        "zapi": retorno,
+        "dados": dados_extraidos,
+        "timestamp": datetime.now().isoformat()
+    })
+
+@app.post("/gerar-documento-zapi", response_class=RespostaJSONRapida)
+def gerar_documento_zapi(request: MensagemRequest, accept_encoding: Optional[str] = Header(None)):
+    """Endpoint específico para Z-API com formato exato que ela espera
+    
+    Com "enviar_para" (telefone) e ZAPI_URL configurada, o documento é enviado
+    direto pela Z-API em vez de voltar em base64.
+    """
     logger.info("=== GERAÇÃO DE DOCUMENTO PARA Z-API ===")
     logger.info(f"Data/Hora: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}")
+    if request.enviar_para:
+        return enviar_documento_zapi(request)
+    return pipeline.gerar(request.mensagem, "zapi", data_referencia=request.data_referencia, imagens=request.imagens,
+                          accept_encoding=accept_encoding)
+
+@app.post("/gerar-documento/{formato}")
+def gerar_documento_formato(formato: str, request: MensagemRequest, if_none_match: Optional[str] = Header(None),
+                            accept_encoding: Optional[str] = Header(None)):
+    """Endpoint genérico: qualquer formato registrado no pipeline (binario, base64, whatsapp, zapi, pdf...)"""
+    logger.info(f"=== GERAÇÃO DE DOCUMENTO ({formato.upper()}) ===")
+    return pipeline.gerar(request.mensagem, formato, data_referencia=request.data_referencia, if_none_match=if_none_match, imagens=request.imagens,
+                          accept_encoding=accept_encoding)
+
+def renderizar_job(request: MensagemRequest, pasta_job: str) -> dict:
+    """Renderiza o documento de um job assíncrono dentro da pasta do job"""
+    dados_extraidos = pipeline.extrair(request.mensagem, request.data_referencia, request.imagens)
+    documento = pipeline.renderizar(dados_extraidos)
+    pipeline.validar(documento)
     
-    temp_dir = tempfile.mkdtemp()
+    output_filename = obter_codificador("binario").nome_arquivo(dados_extraidos, datetime.now())
+    with open(os.path.join(pasta_job, output_filename), "wb") as f:
+        f.write(documento.conteudo)
+    
+    return {
+        "filename": output_filename,
+        "file_size": documento.tamanho,
+        "dados_extraidos": dados_extraidos
+    }
+
+fila_jobs = FilaJobs.do_ambiente(renderizar_job)
+
+metricas.registrar_medidor("admissao", controle_admissao.exportar)
+metricas.registrar_medidor("jobs_fila", lambda: fila_jobs.profundidade)
+metricas.registrar_medidor("jobs_recusados", lambda: fila_jobs.recusados)
+
+@app.on_event("startup")
+async def iniciar_fila_jobs():
+    await fila_jobs.iniciar()
+
+# Aquecimento: imports pesados, modelos, tabelas de extração e um render sintético
+# por formato de saída. /ready só responde OK depois que ele termina.
+MENSAGEM_AQUECIMENTO = """Nome: Aquecimento Sintético
+Email: aquecimento@exemplo.com
+CPF: 000.000.000-00
+Endereço: Rua Exemplo, 1
+CEP: 00000-000
+Telefone: (00) 00000-0000
+Valor: 1.000,00
+Quantidade de Parcelas: 10
+Forma de pagamento: PIX"""
+
+estado_aquecimento = {
+    "pronto": False,
+    "em_andamento": False,
+    "duracao_s": None,
+    "concluido_em": None,
+    "erro": None
+}
+
+def aquecer() -> dict:
+    """Executa o aquecimento uma única vez por processo (ou antes do fork)"""
+    if estado_aquecimento["pronto"] or estado_aquecimento["em_andamento"]:
+        return estado_aquecimento
+    
+    estado_aquecimento["em_andamento"] = True
+    inicio = time.perf_counter()
+    logger.info("🔥 Iniciando aquecimento...")
     
     try:
-        # Extrair dados
-        dados_extraidos = extrair_dados_da_mensagem(request.mensagem)
-        logger.info("Dados extraídos para Z-API")
-        
-        # Nome do arquivo simplificado
-        nome_cliente = re.sub(r'[^\w]', '', dados_extraidos.get("NOME", "cliente"))[:10]
-        timestamp = datetime.now().strftime('%d%m_%H%M')
-        filename = f"{nome_cliente}_{timestamp}.docx"
-        output_path = os.path.join(temp_dir, filename)
+        import docx.oxml
+        import lxml.etree
+        import modelo_compilado
         
-        # Criar documento
-        try:
-            possible_templates = ["template.docx", "modelo.docx", "templates/template.docx"]
-            template_encontrado = None
-            for template_path in possible_templates:
-                if os.path.exists(template_path):
-                    template_encontrado = template_path
-                    break
-            
-            if template_encontrado:
-                preencher_modelo(template_encontrado, output_path, dados_extraidos)
-            else:
-                criar_documento_fallback(dados_extraidos, output_path)
-                
-        except Exception as e:
-            logger.error(f"Erro: {e}")
-            criar_documento_fallback(dados_extraidos, output_path)
+        modelo_compilado.compilar_modelos()
+        extrair_dados_da_mensagem(MENSAGEM_AQUECIMENTO)
         
-        # Verificar arquivo
-        if not os.path.exists(output_path):
-            raise Exception("Documento não foi gerado")
+        for formato in codificadores_registrados():
+            resposta = pipeline.gerar(MENSAGEM_AQUECIMENTO, formato)
+            if resposta.status_code != 200 or b'"success":false' in resposta.body:
+                raise Exception(f"Render sintético falhou no formato {formato}")
         
-        file_size = os.path.getsize(output_path)
-        if file_size < 1000:
-            raise Exception("Arquivo muito pequeno - possível corrupção")
-        
-        # Ler e validar arquivo
-        with open(output_path, "rb") as f:
-            file_bytes = f.read()
-            
-        # Validar se é DOCX válido
-        if not file_bytes.startswith(b'PK'):
-            raise Exception("Arquivo não é um DOCX válido")
-        
-        # Gerar base64 sem quebras de linha
-        base64_string = base64.b64encode(file_bytes).decode('ascii')
-        
-        # Validar base64
-        if len(base64_string) < 1000:
-            raise Exception("Base64 muito pequeno")
-        
-        # Testar se base64 pode ser decodificado
-        try:
-            base64.b64decode(base64_string)
-        except Exception:
-            raise Exception("Base64 inválido gerado")
-        
-        logger.info(f"✅ Arquivo: {filename} ({file_size} bytes)")
-        logger.info(f"✅ Base64: {len(base64_string)} caracteres")
-        
-        return {
-            "success": True,
-            "filename": filename,
-            "base64": base64_string,
-            "size": file_size,
-            "mimetype": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-            "dados": dados_extraidos,
-            "timestamp": datetime.now().isoformat()
-        }
+        # Caminho sem modelo (documento padrão do python-docx)
+        renderizar_fallback(extrair_dados_da_mensagem(MENSAGEM_AQUECIMENTO))
         
+        estado_aquecimento["pronto"] = True
     except Exception as e:
-        logger.error(f"❌ ERRO: {e}")
-        return {
-            "success": False,
-            "error": str(e),
-            "timestamp": datetime.now().isoformat()
-        }
-    
+        estado_aquecimento["erro"] = str(e)
+        logger.error(f"❌ Erro no aquecimento: {e}")
     finally:
-        try:
-            if temp_dir and os.path.exists(temp_dir):
-                shutil.rmtree(temp_dir)
-        except:
-            pass
+        estado_aquecimento["em_andamento"] = False
+        estado_aquecimento["duracao_s"] = round(time.perf_counter() - inicio, 3)
+        estado_aquecimento["concluido_em"] = datetime.now().isoformat()
+        metricas.registrar_tempo("aquecimento", time.perf_counter() - inicio)
+    
+    logger.info(f"🔥 Aquecimento concluído em {estado_aquecimento['duracao_s']}s (pronto: {estado_aquecimento['pronto']})")
+    return estado_aquecimento
+
+def aquecer_worker():
+    """Render sintético num worker recém-criado pelo fork (pool de render e recursos do processo)"""
+    try:
+        pipeline.gerar(MENSAGEM_AQUECIMENTO, "binario")
+    except Exception as e:
+        logger.warning(f"⚠️ Aquecimento do worker {os.getpid()} falhou: {e}")
+
+metricas.registrar_medidor("aquecimento", lambda: dict(estado_aquecimento))
+
+@app.on_event("startup")
+async def iniciar_aquecimento():
+    # Em segundo plano: /health responde durante o aquecimento, /ready não
+    if not estado_aquecimento["pronto"]:
+        asyncio.get_running_loop().run_in_executor(None, aquecer)
+
+@app.get("/debug/perfis/{id_perfil}")
+async def obter_perfil(id_perfil: str, formato: str = "texto", x_perfil: Optional[str] = Header(None), perfil: Optional[str] = None):
+    """Resumo (texto) ou estatísticas do pstats (formato=prof) de um perfil gravado"""
+    if perfilador is None or not perfilador.autorizado(x_perfil or perfil):
+        raise HTTPException(status_code=404, detail="Perfil não encontrado")
+    extensao = "prof" if formato == "prof" else "txt"
+    caminho = perfilador.caminho(id_perfil, extensao)
+    if caminho is None:
+        raise HTTPException(status_code=404, detail="Perfil não encontrado")
+    media_type = "application/octet-stream" if extensao == "prof" else "text/plain; charset=utf-8"
+    return RespostaArquivo(caminho, media_type=media_type, filename=f"{id_perfil}.{extensao}" if extensao == "prof" else None)
+
+tarefas_manutencao = set()
+
+@app.on_event("startup")
+async def iniciar_limpeza_armazem():
+    if armazem:
+        tarefas_manutencao.add(asyncio.create_task(armazem.limpar_periodicamente()))
+
+@app.api_route("/documentos/{hash_documento}", methods=["GET", "HEAD"])
+async def baixar_documento(hash_documento: str, nome: str, expira: int, assinatura: str):
+    """Download de um documento do armazém (link assinado do download_url)"""
+    if armazem is None:
+        raise HTTPException(status_code=404, detail="Armazém de documentos desativado")
+    if not armazem.verificar(hash_documento, expira, nome, assinatura):
+        raise HTTPException(status_code=403, detail="Link inválido ou expirado")
+    
+    caminho = armazem.localizar(hash_documento)
+    if caminho is None:
+        raise HTTPException(status_code=404, detail="Documento não encontrado ou expirado")
+    
+    metricas.incrementar("armazem_downloads")
+    media_type = mimetypes.guess_type(nome)[0] or "application/octet-stream"
+    return RespostaArquivo(
+        caminho,
+        media_type=media_type,
+        filename=nome,
+        etag=f'"{hash_documento}"',
+        headers={"Cache-Control": "private, max-age=300"},
+        x_accel=armazem.caminho_x_accel(hash_documento)
+    )
+
+@app.get("/ready")
+async def ready_check():
+    """Readiness: OK somente depois do aquecimento (modelos compilados e render sintético)"""
+    corpo = {
+        "status": "ready" if estado_aquecimento["pronto"] else "warming_up",
+        "aquecimento": estado_aquecimento,
+        "timestamp": datetime.now().isoformat()
+    }
+    return JSONResponse(corpo, status_code=200 if estado_aquecimento["pronto"] else 503)
+
+@app.on_event("shutdown")
+async def parar_fila_jobs():
+    await fila_jobs.parar()
+    await cliente_entrega.fechar()
+    encerrar_pool_render()
+
+@app.post("/jobs", status_code=202)
+async def criar_job(request: MensagemRequest):
+    """Recebe a mensagem e retorna imediatamente um job id; o documento é gerado em segundo plano"""
+    logger.info("=== NOVO JOB DE GERAÇÃO DE DOCUMENTO ===")
+    
+    try:
+        status = fila_jobs.enviar(request)
+    except FilaCheia as e:
+        raise HTTPException(
+            status_code=429,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    
+    job_id = status["job_id"]
+    return {
+        "success": True,
+        "job_id": job_id,
+        "status": status["status"],
+        "status_url": f"/jobs/{job_id}",
+        "result_url": f"/jobs/{job_id}/resultado",
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.get("/jobs/{job_id}")
+async def status_job(job_id: str):
+    """Consulta o status de um job"""
+    status = fila_jobs.obter_status(job_id)
+    if not status:
+        raise HTTPException(status_code=404, detail="Job não encontrado ou expirado")
+    
+    resposta = dict(status)
+    if status.get("status") == STATUS_CONCLUIDO:
+        resposta["result_url"] = f"/jobs/{job_id}/resultado"
+    return resposta
+
+@app.get("/jobs/{job_id}/resultado")
+async def resultado_job(job_id: str):
+    """Baixa o documento de um job concluído"""
+    status = fila_jobs.obter_status(job_id)
+    if not status:
+        raise HTTPException(status_code=404, detail="Job não encontrado ou expirado")
+    
+    caminho = fila_jobs.caminho_resultado(job_id)
+    if not caminho:
+        raise HTTPException(status_code=409, detail=f"Job ainda não concluído (status: {status.get('status')})")
+    
+    return RespostaArquivo(
+        caminho,
+        media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+        filename=status["filename"],
+        headers={"X-File-Size": str(status.get("file_size", 0))}
+    )
 
 @app.post("/test-docx")
 async def test_docx():
@@ -1092,4 +787,9 @@ if __name__ == "__main__":
     logger.info(f"📅 Data atual: {datetime.now().strftime('%d/%m/%Y')}")
     logger.info(f"🕐 Hora atual: {datetime.now().strftime('%H:%M:%S')}")
     
-    uvicorn.run(app, host="0.0.0.0", port=port)
\ No newline at end of file
+    # Com WORKERS > 1 usa o servidor pré-fork (modelos compilados antes do fork)
+    if int(os.environ.get("WORKERS", 1)) > 1:
+        import servidor
+        servidor.executar(port=port)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=port)
\ No newline at end of file
@@ -0,0 +1,158 @@
+"""
+Rastreamento de memória por etapa e orçamento de memória dos renders.
+
+Um render carrega o modelo aberto pelo python-docx (milhares de objetos
+proxy), os bytes do DOCX, o base64 e o corpo JSON ao mesmo tempo. Numa rajada
+o RSS do worker cresce até o container ser morto por OOM nos planos pequenos.
+
+Rastreamento (MEMORIA_RASTREAR=1): liga o tracemalloc no worker; cada etapa
+medida por metricas.medir_etapa passa a registrar o pico de memória alocada e
+o pipeline registra o pico da geração inteira por modelo e formato
+("documento_<modelo>_<formato>" em /metrics -> memoria). O pico do tracemalloc
+é do processo: só entram nas estatísticas as medições que não se sobrepuseram
+a outra geração (as demais são contadas em "sobrepostas"). O tracemalloc custa
+CPU: é para diagnóstico, não para ficar ligado sempre.
+
+Orçamento (MEMORIA_ORCAMENTO_MB): cada geração reserva a memória estimada
+para o seu modelo e formato antes de renderizar. Se a reserva não cabe no
+orçamento, a geração espera até MEMORIA_ESPERA_S por outras terminarem e, se
+ainda não couber, é recusada com 503 e Retry-After. A estimativa começa em
+MEMORIA_FATOR_MODELO vezes o tamanho do modelo e, com o rastreamento ligado,
+passa a seguir os picos das gerações que rodaram sozinhas no worker. Uma
+geração sozinha é sempre admitida, mesmo acima do orçamento.
+
+Configuração por variáveis de ambiente:
+    MEMORIA_RASTREAR       1 = tracemalloc ligado (padrão: desligado)
+    MEMORIA_ORCAMENTO_MB   memória reservável por gerações simultâneas no worker (0 = sem limite)
+    MEMORIA_ESPERA_S       espera máxima por orçamento (padrão: 10)
+    MEMORIA_FATOR_MODELO   estimativa inicial em múltiplos do tamanho do modelo (padrão: 8)
+"""
+
+import logging
+import math
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import metricas
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+
+def iniciar_rastreamento():
+    """Liga o tracemalloc se MEMORIA_RASTREAR estiver ativo; devolve se está rastreando"""
+    if os.environ.get("MEMORIA_RASTREAR", "").lower() in ("1", "true", "sim") and not tracemalloc.is_tracing():
+        tracemalloc.start(1)
+        logger.info("🧠 Rastreamento de memória ligado (tracemalloc)")
+    return tracemalloc.is_tracing()
+
+
+def rss_atual():
+    """RSS do processo em bytes (Linux) ou None"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def exportar_processo():
+    resultado = {"rastreando": tracemalloc.is_tracing()}
+    rss = rss_atual()
+    if rss is not None:
+        resultado["rss_mb"] = round(rss / MB, 1)
+    if tracemalloc.is_tracing():
+        resultado["rastreada_mb"] = round(tracemalloc.get_traced_memory()[0] / MB, 1)
+    return resultado
+
+
+class MemoriaEsgotada(Exception):
+    """O orçamento de memória não liberou espaço a tempo"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Orçamento de memória esgotado, tente novamente em {retry_after}s")
+        self.retry_after = retry_after
+
+
+class OrcamentoMemoria:
+    """Reservas de memória por geração, com espera limitada"""
+
+    def __init__(self, limite, espera=10.0, fator_modelo=8.0):
+        self.limite = limite
+        self.espera = espera
+        self.fator_modelo = fator_modelo
+        self.reservado = 0
+        self.em_andamento = 0
+        self.aguardando = 0
+        self.recusadas = 0
+        self._estimativas = {}
+        self._condicao = threading.Condition()
+
+    @classmethod
+    def do_ambiente(cls):
+        limite_mb = float(os.environ.get("MEMORIA_ORCAMENTO_MB", 0))
+        if limite_mb <= 0:
+            return None
+        return cls(
+            int(limite_mb * MB),
+            espera=float(os.environ.get("MEMORIA_ESPERA_S", 10)),
+            fator_modelo=float(os.environ.get("MEMORIA_FATOR_MODELO", 8))
+        )
+
+    def estimar(self, chave, tamanho_modelo):
+        estimativa = self._estimativas.get(chave)
+        if estimativa is None:
+            estimativa = int(self.fator_modelo * tamanho_modelo)
+        return estimativa
+
+    def aprender(self, chave, pico):
+        """Ajusta a estimativa pelo pico medido: sobe na hora, desce devagar"""
+        anterior = self._estimativas.get(chave)
+        if anterior is None or pico >= anterior:
+            self._estimativas[chave] = pico
+        else:
+            self._estimativas[chave] = int(anterior * 0.9 + pico * 0.1)
+
+    def _cabe(self, estimativa):
+        return self.em_andamento == 0 or self.reservado + estimativa <= self.limite
+
+    @contextmanager
+    def reservar(self, estimativa):
+        inicio = time.perf_counter()
+        with self._condicao:
+            if not self._cabe(estimativa):
+                metricas.incrementar("memoria_esperas")
+                self.aguardando += 1
+                try:
+                    self._condicao.wait_for(lambda: self._cabe(estimativa), timeout=self.espera)
+                finally:
+                    self.aguardando -= 1
+                if not self._cabe(estimativa):
+                    self.recusadas += 1
+                    metricas.incrementar("memoria_recusadas")
+                    raise MemoriaEsgotada(max(1, math.ceil(self.espera / 2)))
+            self.reservado += estimativa
+            self.em_andamento += 1
+        metricas.registrar_tempo("memoria_espera", time.perf_counter() - inicio)
+
+        try:
+            yield
+        finally:
+            with self._condicao:
+                self.reservado -= estimativa
+                self.em_andamento -= 1
+                self._condicao.notify_all()
+
+    def exportar(self):
+        return {
+            "limite_mb": round(self.limite / MB, 1),
+            "reservado_mb": round(self.reservado / MB, 1),
+            "em_andamento": self.em_andamento,
+            "aguardando": self.aguardando,
+            "recusadas": self.recusadas,
+            "estimativas_mb": {chave: round(valor / MB, 2) for chave, valor in self._estimativas.items()}
+        }
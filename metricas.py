@@ -0,0 +1,220 @@
+"""
+Métricas em memória do processo: contadores, medidores e tempos por etapa.
+
+Exportadas em JSON pelo endpoint GET /metrics. No modo pré-fork cada worker tem
+as próprias métricas; o campo "pid" identifica qual worker respondeu.
+
+Com o tracemalloc ligado (MEMORIA_RASTREAR, ver memoria.py), cada etapa medida
+também registra o pico de memória alocada durante o bloco. O pico do
+tracemalloc é global ao processo: o reset_peak() só é feito quando nenhuma
+outra thread tem medição aberta, e uma medição que se sobrepôs à de outra
+thread não entra nas estatísticas da etapa (o valor incluiria a memória da
+outra requisição); ela só é contada em "sobrepostas". Num worker sempre com
+renders simultâneos os picos por etapa vêm das requisições que rodaram
+sozinhas.
+"""
+
+import os
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+
+_trava = threading.Lock()
+_contadores = {}
+_medidores = {}
+_etapas = {}
+_memoria = {}
+# Pilha de medições de memória abertas na thread (etapas aninhadas)
+_pilha_memoria = threading.local()
+# Medições abertas por thread e total de medições iniciadas no processo
+_trava_memoria = threading.Lock()
+_abertas_por_thread = {}
+_medicoes_iniciadas = 0
+
+
+class EstatisticaEtapa:
+    """Tempos de uma etapa: total, máximo e amostras recentes para percentis"""
+
+    def __init__(self, amostras=1000):
+        self.quantidade = 0
+        self.total = 0.0
+        self.maximo = 0.0
+        self.recentes = deque(maxlen=amostras)
+
+    def registrar(self, segundos):
+        self.quantidade += 1
+        self.total += segundos
+        self.maximo = max(self.maximo, segundos)
+        self.recentes.append(segundos)
+
+    def percentil(self, p):
+        if not self.recentes:
+            return 0.0
+        ordenadas = sorted(self.recentes)
+        indice = min(len(ordenadas) - 1, int(round(p / 100 * (len(ordenadas) - 1))))
+        return ordenadas[indice]
+
+    def exportar(self):
+        return {
+            "quantidade": self.quantidade,
+            "total_s": round(self.total, 6),
+            "media_ms": round(self.total / self.quantidade * 1000, 3) if self.quantidade else 0.0,
+            "p50_ms": round(self.percentil(50) * 1000, 3),
+            "p95_ms": round(self.percentil(95) * 1000, 3),
+            "max_ms": round(self.maximo * 1000, 3)
+        }
+
+
+class EstatisticaMemoria:
+    """Picos de memória de uma etapa: máximo, média e amostras recentes"""
+
+    def __init__(self, amostras=1000):
+        self.quantidade = 0
+        self.sobrepostas = 0
+        self.total = 0
+        self.maximo = 0
+        self.recentes = deque(maxlen=amostras)
+
+    def registrar(self, pico, isolada=True):
+        if not isolada:
+            self.sobrepostas += 1
+            return
+        self.quantidade += 1
+        self.total += pico
+        self.maximo = max(self.maximo, pico)
+        self.recentes.append(pico)
+
+    def exportar(self):
+        ordenados = sorted(self.recentes)
+        p95 = ordenados[min(len(ordenados) - 1, int(round(0.95 * (len(ordenados) - 1))))] if ordenados else 0
+        return {
+            "quantidade": self.quantidade,
+            "sobrepostas": self.sobrepostas,
+            "media_mb": round(self.total / self.quantidade / 1048576, 3) if self.quantidade else 0.0,
+            "p95_mb": round(p95 / 1048576, 3),
+            "max_mb": round(self.maximo / 1048576, 3)
+        }
+
+
+def incrementar(nome, valor=1):
+    with _trava:
+        _contadores[nome] = _contadores.get(nome, 0) + valor
+
+
+def registrar_medidor(nome, funcao):
+    """Registra uma função que devolve o valor atual do medidor na exportação"""
+    _medidores[nome] = funcao
+
+
+def registrar_tempo(etapa, segundos):
+    with _trava:
+        estatistica = _etapas.get(etapa)
+        if estatistica is None:
+            estatistica = _etapas[etapa] = EstatisticaEtapa()
+        estatistica.registrar(segundos)
+
+
+def registrar_memoria(etapa, pico, isolada=True):
+    with _trava:
+        estatistica = _memoria.get(etapa)
+        if estatistica is None:
+            estatistica = _memoria[etapa] = EstatisticaMemoria()
+        estatistica.registrar(pico, isolada)
+
+
+@contextmanager
+def medir_memoria(etapa):
+    """
+    Registra o pico de memória alocada (acima do início) durante o bloco
+
+    Devolve um dict que recebe "pico" (bytes) e "isolada" ao final. isolada é
+    False quando outra thread mediu memória ao mesmo tempo: o pico então é um
+    limite superior (inclui a outra requisição) e não entra nas estatísticas.
+    Sem tracemalloc, nada é medido.
+    """
+    global _medicoes_iniciadas
+    medida = {"pico": None, "isolada": False}
+    if not tracemalloc.is_tracing():
+        yield medida
+        return
+
+    local = _pilha_memoria
+    if getattr(local, "pilha", None) is None:
+        local.pilha = []
+        local.iniciadas = 0
+    pilha = local.pilha
+    thread = threading.get_ident()
+
+    def outras_abertas():
+        return sum(_abertas_por_thread.values()) - _abertas_por_thread.get(thread, 0)
+
+    with _trava_memoria:
+        sobreposta = outras_abertas() > 0
+        base = tracemalloc.get_traced_memory()[0]
+        # O pico do bloco externo não pode se perder no reset do bloco interno
+        if pilha:
+            pilha[-1] = max(pilha[-1], tracemalloc.get_traced_memory()[1])
+        # O reset vale para o processo inteiro: só sem medições abertas em outras threads
+        if not sobreposta:
+            tracemalloc.reset_peak()
+        _abertas_por_thread[thread] = _abertas_por_thread.get(thread, 0) + 1
+        _medicoes_iniciadas += 1
+        local.iniciadas += 1
+        iniciadas_no_processo = _medicoes_iniciadas
+        iniciadas_na_thread = local.iniciadas
+    pilha.append(0)
+    try:
+        yield medida
+    finally:
+        pico_absoluto = max(pilha.pop(), tracemalloc.get_traced_memory()[1])
+        if pilha:
+            pilha[-1] = max(pilha[-1], pico_absoluto)
+        with _trava_memoria:
+            _abertas_por_thread[thread] -= 1
+            if not _abertas_por_thread[thread]:
+                del _abertas_por_thread[thread]
+            # Medições de outras threads que começaram (e talvez já terminaram) durante o bloco
+            de_outras = (_medicoes_iniciadas - iniciadas_no_processo) - (local.iniciadas - iniciadas_na_thread)
+            sobreposta = sobreposta or de_outras > 0 or outras_abertas() > 0
+        medida["pico"] = max(0, pico_absoluto - base)
+        medida["isolada"] = not sobreposta
+        registrar_memoria(etapa, medida["pico"], medida["isolada"])
+
+
+@contextmanager
+def medir_etapa(etapa, memoria=True):
+    """
+    Mede o tempo (e, com tracemalloc, o pico de memória) de um bloco
+
+    memoria=False para blocos que atravessam um await: a pilha de medições é
+    por thread e corrotinas intercaladas no mesmo loop a embaralhariam.
+    """
+    inicio = time.perf_counter()
+    try:
+        if memoria:
+            with medir_memoria(etapa):
+                yield
+        else:
+            yield
+    finally:
+        registrar_tempo(etapa, time.perf_counter() - inicio)
+
+
+def exportar():
+    medidores = {}
+    for nome, funcao in list(_medidores.items()):
+        try:
+            medidores[nome] = funcao()
+        except Exception as e:
+            medidores[nome] = f"erro: {e}"
+
+    with _trava:
+        return {
+            "pid": os.getpid(),
+            "contadores": dict(_contadores),
+            "medidores": medidores,
+            "etapas": {nome: estatistica.exportar() for nome, estatistica in _etapas.items()},
+            "memoria": {nome: estatistica.exportar() for nome, estatistica in _memoria.items()}
+        }
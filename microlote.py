@@ -0,0 +1,113 @@
+"""
+Micro-batching de renders concorrentes.
+
+Quando o N8N dispara dezenas de webhooks ao mesmo tempo, mandar cada render
+sozinho ao pool de processos paga IPC e serialização por documento. O
+MicroLote fica na frente do pool: junta as requisições que chegam dentro de uma
+janela de poucos milissegundos (ou até completar o tamanho máximo), envia todas
+como um único lote a um processo do pool e devolve a cada endpoint o seu
+resultado.
+
+Os endpoints de geração rodam em threads (def síncrono); cada um bloqueia só no
+próprio Future enquanto uma thread coletora monta os lotes.
+
+Configuração por variáveis de ambiente:
+    MICROLOTE_JANELA_MS   tempo máximo de espera para completar um lote (padrão: 5)
+    MICROLOTE_MAX         itens por lote (padrão: 0 = micro-batching desativado)
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import metricas
+
+logger = logging.getLogger(__name__)
+
+
+class MicroLote:
+    """Agrupa itens concorrentes em lotes e distribui os resultados"""
+
+    def __init__(self, enviar_lote, janela_ms=5, tamanho_maximo=16):
+        self.enviar_lote = enviar_lote
+        self.janela = janela_ms / 1000
+        self.tamanho_maximo = tamanho_maximo
+        self._fila = queue.Queue()
+        self._coletor = None
+        self._pid = None
+        self._trava = threading.Lock()
+
+    @classmethod
+    def do_ambiente(cls, enviar_lote):
+        tamanho_maximo = int(os.environ.get("MICROLOTE_MAX", 0))
+        if tamanho_maximo <= 1:
+            return None
+        return cls(
+            enviar_lote,
+            janela_ms=float(os.environ.get("MICROLOTE_JANELA_MS", 5)),
+            tamanho_maximo=tamanho_maximo
+        )
+
+    def _garantir_coletor(self):
+        # Threads não sobrevivem ao fork: cada processo tem a própria coletora
+        with self._trava:
+            if self._coletor is None or self._pid != os.getpid():
+                self._fila = queue.Queue()
+                self._coletor = threading.Thread(target=self._coletar, name="microlote", daemon=True)
+                self._coletor.start()
+                self._pid = os.getpid()
+
+    def submeter(self, item):
+        """Enfileira um item; devolve um Future com o resultado individual"""
+        self._garantir_coletor()
+        futuro = Future()
+        self._fila.put((item, futuro, time.perf_counter()))
+        return futuro
+
+    def executar(self, item):
+        return self.submeter(item).result()
+
+    def _coletar(self):
+        fila = self._fila
+        while True:
+            lote = [fila.get()]
+            prazo = time.perf_counter() + self.janela
+            while len(lote) < self.tamanho_maximo:
+                restante = prazo - time.perf_counter()
+                if restante <= 0:
+                    break
+                try:
+                    lote.append(fila.get(timeout=restante))
+                except queue.Empty:
+                    break
+            self._despachar(lote)
+
+    def _despachar(self, lote):
+        agora = time.perf_counter()
+        for _, _, chegada in lote:
+            metricas.registrar_tempo("microlote_espera", agora - chegada)
+        metricas.incrementar("microlote_lotes")
+        metricas.incrementar("microlote_itens", len(lote))
+
+        futuros = [futuro for _, futuro, _ in lote]
+        try:
+            envio = self.enviar_lote([item for item, _, _ in lote])
+        except Exception as e:
+            for futuro in futuros:
+                futuro.set_exception(e)
+            return
+
+        def distribuir(concluido):
+            try:
+                resultados = concluido.result()
+            except Exception as e:
+                for futuro in futuros:
+                    futuro.set_exception(e)
+                return
+            for futuro, resultado in zip(futuros, resultados):
+                futuro.set_result(resultado)
+
+        envio.add_done_callback(distribuir)
@@ -0,0 +1,296 @@
+"""
+Minificação de modelos DOCX na compilação.
+
+Modelos salvos pelo Word carregam ruído que é reserializado, comprimido e
+codificado em base64 a cada requisição:
+    - atributos w:rsid* (identificadores de sessão de edição) e a lista
+      w:rsids do settings.xml;
+    - marcas de revisão ortográfica (w:proofErr, w:proofState) e w:lang nos
+      runs (o idioma padrão em styles.xml é mantido);
+    - w:lastRenderedPageBreak (cache de paginação do Word);
+    - runs vizinhos com a mesma formatação, fragmentados pela edição;
+    - estilos que nenhuma parte usa (direta ou indiretamente, via basedOn,
+      next e link; estilos padrão são sempre mantidos).
+
+O resultado é um DOCX equivalente com XML menor: substituição, save e base64
+mais rápidos e menos bytes no WhatsApp. Ativado com MODELOS_MINIFICAR=1 (ver
+modelo_compilado.py); o modelo original no disco não é alterado.
+
+Uso avulso (relatório de tamanho e de tempo de render antes/depois):
+    python minificar.py template.docx
+    python minificar.py template.docx --saida template.min.docx --renders 50
+"""
+
+import argparse
+import base64
+import io
+import logging
+import os
+import sys
+import time
+import zipfile
+
+import lxml.etree
+
+logger = logging.getLogger(__name__)
+
+W = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+XML_SPACE = "{http://www.w3.org/XML/1998/namespace}space"
+
+# Elementos removidos de todas as partes do Word
+ELEMENTOS_RUIDO = {f"{{{W}}}proofErr", f"{{{W}}}lastRenderedPageBreak"}
+# Removidos só das partes de conteúdo (em styles.xml definem o idioma padrão)
+ELEMENTOS_RUIDO_CONTEUDO = {f"{{{W}}}lang"}
+# Removidos do settings.xml
+ELEMENTOS_RUIDO_CONFIGURACAO = {f"{{{W}}}rsids", f"{{{W}}}proofState"}
+
+# Referências a estilos dentro das partes e entre os próprios estilos
+REFERENCIAS_ESTILO = {f"{{{W}}}{nome}" for nome in ("pStyle", "rStyle", "tblStyle", "numStyleLink", "styleLink")}
+DEPENDENCIAS_ESTILO = {f"{{{W}}}{nome}" for nome in ("basedOn", "next", "link")}
+
+
+def _w(nome):
+    return f"{{{W}}}{nome}"
+
+
+def _eh_parte_word(nome):
+    return nome.startswith("word/") and nome.endswith(".xml")
+
+
+def remover_ruido(raiz, nome):
+    """Remove rsid, marcas de revisão e cache de paginação; devolve quantos itens saíram"""
+    removidos = 0
+    elementos = set(ELEMENTOS_RUIDO)
+    if nome != "word/styles.xml":
+        elementos |= ELEMENTOS_RUIDO_CONTEUDO
+    if nome == "word/settings.xml":
+        elementos |= ELEMENTOS_RUIDO_CONFIGURACAO
+
+    for elemento in list(raiz.iter()):
+        if elemento.tag in elementos:
+            elemento.getparent().remove(elemento)
+            removidos += 1
+            continue
+        for atributo in [a for a in elemento.attrib if a.startswith(f"{{{W}}}rsid")]:
+            del elemento.attrib[atributo]
+            removidos += 1
+
+    # Propriedades de run que ficaram vazias (ex.: só tinham w:lang)
+    for rpr in list(raiz.iter(_w("rPr"))):
+        if len(rpr) == 0 and not rpr.attrib and rpr.getparent() is not None:
+            rpr.getparent().remove(rpr)
+    return removidos
+
+
+def _run_simples(elemento):
+    """(rPr serializado, w:t) se o run for só formatação + um texto, senão None"""
+    if elemento.tag != _w("r"):
+        return None
+    filhos = list(elemento)
+    rpr = b""
+    if filhos and filhos[0].tag == _w("rPr"):
+        rpr = lxml.etree.tostring(filhos[0])
+        filhos = filhos[1:]
+    if len(filhos) != 1 or filhos[0].tag != _w("t") or elemento.attrib:
+        return None
+    return rpr, filhos[0]
+
+
+def mesclar_runs(raiz):
+    """Junta runs vizinhos com a mesma formatação; devolve quantos runs saíram"""
+    mesclados = 0
+    for pai in list(raiz.iter(_w("p"), _w("hyperlink"), _w("smartTag"), _w("fldSimple"))):
+        anterior = None
+        for filho in list(pai):
+            atual = _run_simples(filho)
+            if atual is None:
+                anterior = None
+                continue
+            if anterior is not None and anterior[0] == atual[0]:
+                texto = anterior[1]
+                texto.text = (texto.text or "") + (atual[1].text or "")
+                texto.set(XML_SPACE, "preserve")
+                pai.remove(filho)
+                mesclados += 1
+                continue
+            anterior = atual
+    return mesclados
+
+
+def podar_estilos(estilos, partes):
+    """Remove de styles.xml os estilos que nenhuma parte usa; devolve quantos saíram"""
+    usados = set()
+    for raiz in partes:
+        for elemento in raiz.iter(*REFERENCIAS_ESTILO):
+            usados.add(elemento.get(_w("val")))
+
+    por_id = {}
+    for estilo in estilos.iter(_w("style")):
+        por_id[estilo.get(_w("styleId"))] = estilo
+        if estilo.get(_w("default")) in ("1", "true", "on"):
+            usados.add(estilo.get(_w("styleId")))
+        # Referências de um estilo de tabela/numeração para outros estilos
+        for elemento in estilo.iter(*REFERENCIAS_ESTILO):
+            if elemento.getparent() is not estilo:
+                usados.add(elemento.get(_w("val")))
+
+    # Fecho transitivo: basedOn, next e link
+    pendentes = list(usados)
+    while pendentes:
+        estilo = por_id.get(pendentes.pop())
+        if estilo is None:
+            continue
+        for elemento in estilo:
+            if elemento.tag in DEPENDENCIAS_ESTILO:
+                referencia = elemento.get(_w("val"))
+                if referencia not in usados:
+                    usados.add(referencia)
+                    pendentes.append(referencia)
+
+    removidos = 0
+    for estilo_id, estilo in por_id.items():
+        if estilo_id not in usados:
+            estilo.getparent().remove(estilo)
+            removidos += 1
+    return removidos
+
+
+def _serializar(raiz):
+    return lxml.etree.tostring(raiz, xml_declaration=True, encoding="UTF-8", standalone=True)
+
+
+def minificar_pacote(conteudo):
+    """
+    Minifica um DOCX em memória
+
+    Returns:
+        tuple: (bytes do DOCX minificado, relatório com tamanhos e contagens)
+    """
+    inicio = time.perf_counter()
+    with zipfile.ZipFile(io.BytesIO(conteudo)) as pacote:
+        infos = pacote.infolist()
+        dados = {info.filename: pacote.read(info.filename) for info in infos}
+
+    raizes = {}
+    parser = lxml.etree.XMLParser(remove_blank_text=False, resolve_entities=False)
+    for nome, xml in dados.items():
+        if _eh_parte_word(nome):
+            raiz = lxml.etree.fromstring(xml, parser)
+            if raiz.tag.startswith(f"{{{W}}}"):
+                raizes[nome] = raiz
+
+    relatorio = {"ruido_removido": 0, "runs_mesclados": 0, "estilos_removidos": 0}
+    for nome, raiz in raizes.items():
+        relatorio["ruido_removido"] += remover_ruido(raiz, nome)
+        relatorio["runs_mesclados"] += mesclar_runs(raiz)
+
+    estilos = raizes.get("word/styles.xml")
+    if estilos is not None:
+        outras = [raiz for nome, raiz in raizes.items() if nome != "word/styles.xml"]
+        relatorio["estilos_removidos"] = podar_estilos(estilos, outras)
+
+    xml_antes = sum(len(dados[nome]) for nome in raizes)
+    for nome, raiz in raizes.items():
+        dados[nome] = _serializar(raiz)
+    xml_depois = sum(len(dados[nome]) for nome in raizes)
+
+    saida = io.BytesIO()
+    with zipfile.ZipFile(saida, "w") as pacote:
+        for info in infos:
+            pacote.writestr(info, dados[info.filename], compress_type=info.compress_type)
+    minificado = saida.getvalue()
+
+    relatorio.update({
+        "xml_antes": xml_antes,
+        "xml_depois": xml_depois,
+        "pacote_antes": len(conteudo),
+        "pacote_depois": len(minificado),
+        "base64_antes": 4 * ((len(conteudo) + 2) // 3),
+        "base64_depois": 4 * ((len(minificado) + 2) // 3),
+        "tempo_ms": round((time.perf_counter() - inicio) * 1000, 1)
+    })
+    return minificado, relatorio
+
+
+def _reducao(antes, depois):
+    return f"{antes} → {depois} bytes ({(1 - depois / antes) * 100 if antes else 0:.1f}% menor)"
+
+
+def descrever(relatorio):
+    """Resumo de uma linha para o log da compilação"""
+    return (
+        f"XML {_reducao(relatorio['xml_antes'], relatorio['xml_depois'])}, "
+        f"pacote {_reducao(relatorio['pacote_antes'], relatorio['pacote_depois'])}; "
+        f"{relatorio['ruido_removido']} itens de ruído, {relatorio['runs_mesclados']} runs mesclados, "
+        f"{relatorio['estilos_removidos']} estilos removidos"
+    )
+
+
+def _medir_render(conteudo, renders):
+    """Tempo médio (ms) de render pelos dois motores e tamanho do base64 gerado"""
+    import motor_zip
+    import preencher
+    from modelo_compilado import ModeloCompilado
+
+    dados = {
+        "NOME": "Cliente Minificação", "CPF": "000.000.000-00", "VALOR": "1.000,00",
+        "PARCELAS": "10", "DATA": "01/01/2026", "HORA": "00:00:00"
+    }
+    modelo = ModeloCompilado("minificar", conteudo)
+    inicio = time.perf_counter()
+    for _ in range(renders):
+        documento = motor_zip.renderizar(modelo, dados)
+    tempo_zip = (time.perf_counter() - inicio) * 1000 / renders
+
+    inicio = time.perf_counter()
+    for _ in range(renders):
+        saida = io.BytesIO()
+        preencher.preencher_modelo(io.BytesIO(conteudo), saida, dados)
+    tempo_docx = (time.perf_counter() - inicio) * 1000 / renders
+
+    inicio = time.perf_counter()
+    for _ in range(renders):
+        codificado = base64.b64encode(documento)
+    tempo_base64 = (time.perf_counter() - inicio) * 1000 / renders
+    return tempo_zip, tempo_docx, tempo_base64, len(codificado)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Minifica um modelo DOCX e mede o ganho")
+    parser.add_argument("modelo")
+    parser.add_argument("--saida", default=None, help="grava o DOCX minificado neste caminho")
+    parser.add_argument("--renders", type=int, default=20, help="renders por motor na medição de tempo")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    logging.disable(logging.INFO)
+
+    with open(args.modelo, "rb") as f:
+        original = f.read()
+    minificado, relatorio = minificar_pacote(original)
+    print(f"🗜️ {args.modelo}: {descrever(relatorio)} (em {relatorio['tempo_ms']}ms)")
+    print(f"   base64 do modelo: {_reducao(relatorio['base64_antes'], relatorio['base64_depois'])}")
+
+    if args.renders > 0:
+        # preencher.py imprime o progresso de cada render
+        with open(os.devnull, "w") as nulo:
+            saida_padrao, sys.stdout = sys.stdout, nulo
+            try:
+                antes = _medir_render(original, args.renders)
+                depois = _medir_render(minificado, args.renders)
+            finally:
+                sys.stdout = saida_padrao
+        print(f"{'medida':<22} {'original':>10} {'minificado':>11}")
+        for rotulo, a, d in zip(("motor zip (ms)", "motor docx (ms)", "base64 (ms)", "base64 gerado (bytes)"), antes, depois):
+            casas = 0 if "bytes" in rotulo else 1
+            print(f"{rotulo:<22} {a:>10.{casas}f} {d:>11.{casas}f}")
+
+    if args.saida:
+        with open(args.saida, "wb") as f:
+            f.write(minificado)
+        print(f"✅ Modelo minificado salvo em {args.saida}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
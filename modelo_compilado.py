@@ -0,0 +1,353 @@
+"""
+Compilação de modelos DOCX em memória.
+
+O modelo é lido do disco uma única vez por processo: o conteúdo bruto, o hash, o
+XML de cada parte, o índice de placeholders por parte e os membros do pacote já
+comprimidos (prontos para serem copiados sem recompressão pelo motor_zip) ficam
+guardados em memória. Cada requisição abre o documento a partir desses dados,
+sem tocar o disco.
+
+A forma compilada é persistida em MODELOS_CACHE_DIR como um artefato indexado
+pelo hash do conteúdo do modelo. Processos novos (wake-up do Render, réplicas
+do autoscaling) carregam o artefato em vez de descompactar, indexar e
+recomprimir o DOCX. Artefatos de outro modelo, de outra versão do formato ou de
+outra versão do python-docx/lxml são ignorados e recompilados.
+
+O artefato só contém dados: um índice JSON seguido dos bytes das partes e dos
+membros (nada é executado ao carregar). Sem MODELOS_CACHE_DIR, o diretório
+padrão fica no cache do usuário (XDG_CACHE_HOME ou ~/.cache), nunca no /tmp
+compartilhado. O diretório é criado com permissão 0700 e só é usado se
+pertencer ao usuário do processo e não puder ser gravado por outros.
+
+Quando o servidor roda em modo pré-fork (servidor.py), os modelos são compilados
+no processo mestre antes do fork e ficam compartilhados entre os workers por
+copy-on-write.
+
+Com MODELOS_MINIFICAR=1 o modelo é minificado na compilação (minificar.py:
+sem rsid, marcas de revisão, runs fragmentados e estilos sem uso) e todos os
+motores passam a renderizar a partir da versão minificada, que vai junto no
+artefato.
+"""
+
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import stat
+import struct
+import time
+import zipfile
+import zlib
+from collections import namedtuple
+from importlib.metadata import PackageNotFoundError, version
+
+import lxml.etree
+from docx import Document
+
+from minificar import descrever, minificar_pacote
+
+logger = logging.getLogger(__name__)
+
+# Placeholders no formato {{CHAVE}}
+PADRAO_PLACEHOLDER = re.compile(r'\{\{([^}]+)\}\}')
+PADRAO_TAG_XML = re.compile(r'<[^>]+>')
+
+# Ordem de busca dos modelos usada pelos endpoints
+MODELOS_POSSIVEIS = [
+    "template.docx",
+    "modelo.docx",
+    "templates/template.docx",
+    "templates/modelo.docx"
+]
+
+# Incrementar sempre que o conteúdo do artefato mudar
+VERSAO_ARTEFATO = 4
+# Início do arquivo do artefato, seguido do tamanho do índice JSON ("<I")
+ASSINATURA_ARTEFATO = b"MODC"
+
+# Nível do deflate das partes recomprimidas a cada render (0 = gravadas sem compressão);
+# as partes estáticas são comprimidas uma vez na compilação com NIVEL_MODELO
+NIVEL_DEFLATE = int(os.environ.get("RENDER_NIVEL_DEFLATE", 6))
+NIVEL_MODELO = 9
+# Mídia que já vem comprimida: gravada como está (deflate só gastaria CPU)
+EXTENSOES_COMPRIMIDAS = (".png", ".jpg", ".jpeg", ".jfif", ".gif", ".wdp", ".mp3", ".mp4", ".zip")
+
+# Membro do pacote já comprimido (deflate bruto) e pronto para ser gravado no zip
+MembroZip = namedtuple("MembroZip", "nome dados crc tamanho tamanho_comprimido metodo")
+
+
+def _versao_pacote(nome):
+    try:
+        return version(nome)
+    except PackageNotFoundError:
+        return "desconhecida"
+
+
+def assinatura_bibliotecas():
+    """Versões que invalidam o artefato quando mudam"""
+    return {
+        "artefato": VERSAO_ARTEFATO,
+        "python_docx": _versao_pacote("python-docx"),
+        "lxml": ".".join(str(parte) for parte in lxml.etree.LXML_VERSION)
+    }
+
+
+def minificacao_ativa():
+    return os.environ.get("MODELOS_MINIFICAR", "").lower() in ("1", "true", "sim")
+
+
+def comprimir_membro(nome, dados, nivel=None):
+    """Comprime um membro com deflate bruto, no formato gravado direto no zip"""
+    if nivel is None:
+        nivel = NIVEL_DEFLATE
+    if nivel == 0 or nome.lower().endswith(EXTENSOES_COMPRIMIDAS):
+        return MembroZip(nome, dados, zlib.crc32(dados), len(dados), len(dados), zipfile.ZIP_STORED)
+    compressor = zlib.compressobj(nivel, zlib.DEFLATED, -15)
+    comprimido = compressor.compress(dados) + compressor.flush()
+    return MembroZip(nome, comprimido, zlib.crc32(dados), len(dados), len(comprimido), zipfile.ZIP_DEFLATED)
+
+
+class ModeloCompilado:
+    """Modelo DOCX pré-carregado e indexado"""
+
+    def __init__(self, caminho, conteudo, mtime=None, estado=None, minificar=False):
+        self.caminho = caminho
+        self.mtime = mtime
+        # hash_original identifica o arquivo no disco (artefato); hash, o conteúdo renderizado
+        self.hash_original = hashlib.sha256(conteudo).hexdigest()
+        self.minificacao = None
+
+        if estado is not None and "conteudo" in estado:
+            conteudo = estado["conteudo"]
+            self.minificacao = estado["minificacao"]
+        elif estado is None and minificar:
+            conteudo, self.minificacao = minificar_pacote(conteudo)
+
+        self.conteudo = conteudo
+        self.hash = hashlib.sha256(conteudo).hexdigest()
+
+        if estado is not None:
+            self.partes = estado["partes"]
+            self.placeholders = estado["placeholders"]
+            self.membros = estado["membros"]
+            return
+
+        self.partes = {}
+        self.placeholders = {}
+        self.membros = []
+
+        with zipfile.ZipFile(io.BytesIO(conteudo)) as pacote:
+            for info in pacote.infolist():
+                dados_parte = pacote.read(info.filename)
+                self.membros.append(comprimir_membro(info.filename, dados_parte, NIVEL_MODELO))
+                if info.filename.endswith(".xml") or info.filename.endswith(".rels"):
+                    self.partes[info.filename] = dados_parte
+                    texto = PADRAO_TAG_XML.sub("", dados_parte.decode("utf-8", errors="ignore"))
+                    encontrados = set(PADRAO_PLACEHOLDER.findall(texto))
+                    if encontrados:
+                        self.placeholders[info.filename] = sorted(encontrados)
+
+    @property
+    def todos_placeholders(self):
+        """Conjunto de placeholders encontrados em todas as partes"""
+        resultado = set()
+        for encontrados in self.placeholders.values():
+            resultado.update(encontrados)
+        return resultado
+
+    def abrir(self):
+        """Abre um novo Document a partir dos bytes em memória"""
+        return Document(io.BytesIO(self.conteudo))
+
+
+def diretorio_artefatos():
+    padrao = os.path.join(
+        os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"),
+        "modelos_compilados"
+    )
+    return os.environ.get("MODELOS_CACHE_DIR") or padrao
+
+
+def diretorio_confiavel(diretorio):
+    """Diretório do próprio usuário e sem escrita para grupo/outros (artefatos plantados são ignorados)"""
+    try:
+        info = os.lstat(diretorio)
+    except OSError:
+        return False
+    if not stat.S_ISDIR(info.st_mode):
+        return False
+    if hasattr(os, "getuid") and info.st_uid != os.getuid():
+        return False
+    return not info.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+
+
+def _caminho_artefato(hash_modelo, minificado=False):
+    sufixo = ".min" if minificado else ""
+    return os.path.join(diretorio_artefatos(), f"{hash_modelo}{sufixo}.artefato")
+
+
+def serializar_artefato(modelo):
+    """Índice JSON + bytes brutos das partes, dos membros e do conteúdo minificado"""
+    blocos = []
+    posicao = 0
+
+    def bloco(dados):
+        nonlocal posicao
+        blocos.append(dados)
+        posicao += len(dados)
+        return [posicao - len(dados), len(dados)]
+
+    indice = {
+        "hash": modelo.hash_original,
+        "bibliotecas": assinatura_bibliotecas(),
+        "placeholders": modelo.placeholders,
+        "partes": {nome: bloco(dados) for nome, dados in modelo.partes.items()},
+        "membros": [
+            [membro.nome, membro.crc, membro.tamanho, membro.tamanho_comprimido, membro.metodo, bloco(membro.dados)]
+            for membro in modelo.membros
+        ],
+        "minificacao": modelo.minificacao,
+        "conteudo": bloco(modelo.conteudo) if modelo.minificacao is not None else None
+    }
+    cabecalho = json.dumps(indice, separators=(",", ":")).encode("utf-8")
+    return b"".join([ASSINATURA_ARTEFATO, struct.pack("<I", len(cabecalho)), cabecalho] + blocos)
+
+
+def desserializar_artefato(dados):
+    """(índice, estado) de um artefato; ValueError se o arquivo não estiver no formato"""
+    if not dados.startswith(ASSINATURA_ARTEFATO):
+        raise ValueError("assinatura inválida")
+    (tamanho_indice,) = struct.unpack_from("<I", dados, len(ASSINATURA_ARTEFATO))
+    inicio = len(ASSINATURA_ARTEFATO) + 4
+    indice = json.loads(dados[inicio:inicio + tamanho_indice])
+    corpo = memoryview(dados)[inicio + tamanho_indice:]
+
+    def bloco(posicao):
+        deslocamento, tamanho = posicao
+        if deslocamento < 0 or deslocamento + tamanho > len(corpo):
+            raise ValueError("bloco fora do arquivo")
+        return bytes(corpo[deslocamento:deslocamento + tamanho])
+
+    estado = {
+        "partes": {nome: bloco(posicao) for nome, posicao in indice["partes"].items()},
+        "placeholders": indice["placeholders"],
+        "membros": [
+            MembroZip(nome, bloco(posicao), crc, tamanho, tamanho_comprimido, metodo)
+            for nome, crc, tamanho, tamanho_comprimido, metodo, posicao in indice["membros"]
+        ]
+    }
+    if indice.get("conteudo") is not None:
+        estado["conteudo"] = bloco(indice["conteudo"])
+        estado["minificacao"] = indice["minificacao"]
+    return indice, estado
+
+
+def carregar_artefato(caminho, conteudo, mtime, minificar=False):
+    """Carrega a forma compilada persistida ou None se ausente/incompatível"""
+    hash_modelo = hashlib.sha256(conteudo).hexdigest()
+    diretorio = diretorio_artefatos()
+    caminho_artefato = _caminho_artefato(hash_modelo, minificar)
+    if not os.path.exists(caminho_artefato):
+        return None
+    if not diretorio_confiavel(diretorio):
+        logger.warning(f"⚠️ Diretório de artefatos {diretorio} não é privado do usuário, artefato ignorado")
+        return None
+    try:
+        with open(caminho_artefato, "rb") as f:
+            indice, estado = desserializar_artefato(f.read())
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"⚠️ Artefato de modelo ilegível, recompilando: {e}")
+        return None
+
+    if indice.get("hash") != hash_modelo or indice.get("bibliotecas") != assinatura_bibliotecas():
+        logger.info(f"♻️ Artefato de {caminho} incompatível (hash ou versão), recompilando")
+        return None
+
+    return ModeloCompilado(caminho, conteudo, mtime, estado=estado)
+
+
+def salvar_artefato(modelo):
+    """Grava a forma compilada de forma atômica (outros processos podem estar lendo)"""
+    diretorio = diretorio_artefatos()
+    try:
+        os.makedirs(diretorio, mode=0o700, exist_ok=True)
+        if not diretorio_confiavel(diretorio):
+            logger.warning(f"⚠️ Diretório de artefatos {diretorio} não é privado do usuário, artefato não salvo")
+            return
+        destino = _caminho_artefato(modelo.hash_original, modelo.minificacao is not None)
+        temporario = f"{destino}.{os.getpid()}.tmp"
+        with open(temporario, "wb") as f:
+            f.write(serializar_artefato(modelo))
+        os.replace(temporario, destino)
+    except OSError as e:
+        logger.warning(f"⚠️ Não foi possível salvar o artefato do modelo: {e}")
+
+
+_modelos = {}
+
+
+def compilar_modelo(caminho):
+    """Lê e compila um modelo (ou carrega o artefato), substituindo a versão em memória"""
+    inicio = time.perf_counter()
+    mtime = os.path.getmtime(caminho)
+    with open(caminho, "rb") as f:
+        conteudo = f.read()
+
+    minificar = minificacao_ativa()
+    modelo = carregar_artefato(caminho, conteudo, mtime, minificar)
+    origem = "artefato"
+    if modelo is None:
+        modelo = ModeloCompilado(caminho, conteudo, mtime, minificar=minificar)
+        salvar_artefato(modelo)
+        origem = "compilação"
+
+    _modelos[caminho] = modelo
+    logger.info(
+        f"🧩 Modelo carregado por {origem}: {caminho} ({len(conteudo)} bytes, "
+        f"{len(modelo.membros)} partes, {len(modelo.todos_placeholders)} placeholders) "
+        f"em {(time.perf_counter() - inicio) * 1000:.1f}ms"
+    )
+    if modelo.minificacao is not None:
+        logger.info(f"🗜️ Modelo minificado: {descrever(modelo.minificacao)}")
+    return modelo
+
+
+def obter_modelo(caminho):
+    """Retorna o modelo compilado, recompilando se o arquivo mudou no disco"""
+    modelo = _modelos.get(caminho)
+    if modelo is not None:
+        try:
+            if os.path.getmtime(caminho) == modelo.mtime:
+                return modelo
+        except OSError:
+            return modelo
+    return compilar_modelo(caminho)
+
+
+def encontrar_modelo(possiveis=None):
+    """Retorna o caminho do primeiro modelo existente ou None"""
+    for caminho in possiveis or MODELOS_POSSIVEIS:
+        if os.path.exists(caminho):
+            return caminho
+    return None
+
+
+def compilar_modelos(possiveis=None):
+    """Compila todos os modelos existentes (usado antes do fork dos workers)"""
+    compilados = []
+    for caminho in possiveis or MODELOS_POSSIVEIS:
+        if os.path.exists(caminho):
+            compilados.append(obter_modelo(caminho))
+    return compilados
+
+
+if __name__ == "__main__":
+    # Pré-compila os modelos no build (Dockerfile/render.yaml) para o artefato já
+    # existir no primeiro start do container
+    logging.basicConfig(level=logging.INFO)
+    for modelo in compilar_modelos():
+        print(f"✅ {modelo.caminho}: {modelo.hash[:12]} -> {_caminho_artefato(modelo.hash_original, modelo.minificacao is not None)}")
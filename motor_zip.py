@@ -0,0 +1,185 @@
+"""
+Motor de render no nível do zip.
+
+Em vez de abrir o pacote inteiro com o python-docx, só as partes que contêm
+placeholders (índice do ModeloCompilado) são analisadas e reserializadas. Todos
+os outros membros do pacote (fontes, estilos, tema, mídia...) são gravados a
+partir dos bytes já comprimidos na compilação, sem descompactar nem recomprimir.
+
+A substituição segue a mesma regra de substituir_placeholders_robusto: o texto
+do parágrafo é consolidado a partir dos runs, os placeholders são trocados e o
+resultado vai para o primeiro run com conteúdo, preservando a formatação dele.
+
+Selecionado com MOTOR_RENDER=zip (o padrão continua sendo o python-docx).
+
+Placeholders de imagem ({{IMG:NOME}}, ver imagens.py) viram runs com a
+imagem; a mídia, as relações e os content types entram no pacote junto com os
+membros pré-comprimidos.
+
+O mesmo escritor de zip serve o motor python-docx (salvar_pacote, no lugar
+de doc.save): as partes que saem idênticas às do modelo compilado são
+copiadas já comprimidas, mídia já comprimida (PNG/JPEG...) vai sem deflate e
+as partes alteradas usam RENDER_NIVEL_DEFLATE (ver modelo_compilado.py).
+"""
+
+import logging
+import struct
+import zipfile
+import zlib
+
+import lxml.etree
+from docx.opc.packuri import CONTENT_TYPES_URI, PACKAGE_URI
+from docx.opc.pkgwriter import _ContentTypesItem
+from docx.oxml.ns import qn
+from docx.oxml.parser import parse_xml
+
+from imagens import ImagensDoRender, eh_chave_imagem
+from modelo_compilado import comprimir_membro
+from repeticao import expandir_repeticoes, preparar_listas
+
+logger = logging.getLogger(__name__)
+
+# Data fixa dos membros (1980-01-01 00:00): a saída não depende do relógio
+DATA_DOS = (1 << 5) | 1
+HORA_DOS = 0
+FLAG_UTF8 = 0x800
+
+
+def limpar_dados(dados):
+    """Mesma preparação de preencher_modelo: strings sem espaços, vazio vira 'Não informado'"""
+    dados_limpos = {}
+    for chave, valor in dados.items():
+        if isinstance(valor, list) or eh_chave_imagem(chave):
+            continue  # listas das seções repetidas (repeticao.py) e imagens (imagens.py)
+        if valor is None or valor == "":
+            dados_limpos[chave] = "Não informado"
+        else:
+            dados_limpos[chave] = str(valor).strip()
+    return dados_limpos
+
+
+def substituir_na_parte(xml, dados_limpos, dados=None, imagens=None, nome=None):
+    """Expande as seções repetidas, substitui os placeholders e devolve o XML serializado
+
+    Com imagens (ImagensDoRender), os placeholders {{IMG:...}} da parte nome
+    viram imagens depois da substituição de texto.
+    """
+    raiz = parse_xml(xml)
+    if dados is not None:
+        expandir_repeticoes(raiz, dados)
+    substituicoes = 0
+
+    for paragrafo in raiz.iter(qn("w:p")):
+        # Filtro barato antes de consolidar os runs (tabelas grandes têm muitos parágrafos sem placeholder)
+        if "{{" not in "".join(t.text or "" for t in paragrafo.iter(qn("w:t"))):
+            continue
+        runs = paragrafo.r_lst
+        if not runs:
+            continue
+
+        texto_completo = "".join(run.text for run in runs)
+        if "{{" not in texto_completo:
+            continue
+
+        texto_modificado = texto_completo
+        for chave, valor in dados_limpos.items():
+            placeholder = f'{{{{{chave}}}}}'
+            if placeholder in texto_modificado:
+                texto_modificado = texto_modificado.replace(placeholder, valor)
+                substituicoes += 1
+
+        if texto_modificado == texto_completo:
+            continue
+
+        destino = next((run for run in runs if run.text.strip()), runs[0])
+        for run in runs:
+            if run is not destino:
+                run.text = ""
+        destino.text = texto_modificado
+
+    if imagens is not None:
+        imagens.substituir(raiz, nome)
+
+    logger.debug(f"🔁 {substituicoes} substituição(ões) na parte")
+    return lxml.etree.tostring(raiz, encoding="UTF-8", standalone=True)
+
+
+def escrever_zip(membros):
+    """Monta o arquivo zip a partir de membros já comprimidos"""
+    partes = []
+    central = []
+    deslocamento = 0
+
+    for membro in membros:
+        nome = membro.nome.encode("utf-8")
+        cabecalho = struct.pack(
+            "<IHHHHHIIIHH",
+            0x04034B50, 20, FLAG_UTF8, membro.metodo, HORA_DOS, DATA_DOS,
+            membro.crc, membro.tamanho_comprimido, membro.tamanho, len(nome), 0
+        )
+        partes.append(cabecalho)
+        partes.append(nome)
+        partes.append(membro.dados)
+
+        central.append(struct.pack(
+            "<IHHHHHHIIIHHHHHII",
+            0x02014B50, 20, 20, FLAG_UTF8, membro.metodo, HORA_DOS, DATA_DOS,
+            membro.crc, membro.tamanho_comprimido, membro.tamanho, len(nome),
+            0, 0, 0, 0, 0, deslocamento
+        ) + nome)
+        deslocamento += len(cabecalho) + len(nome) + len(membro.dados)
+
+    diretorio = b"".join(central)
+    fim = struct.pack(
+        "<IHHHHIIH",
+        0x06054B50, 0, 0, len(membros), len(membros), len(diretorio), deslocamento, 0
+    )
+    return b"".join(partes) + diretorio + fim
+
+
+def renderizar(modelo, dados):
+    """Renderiza o modelo compilado com os dados e devolve os bytes do DOCX"""
+    dados = preparar_listas(dados)
+    dados_limpos = limpar_dados(dados)
+    imagens = ImagensDoRender(modelo, dados) if any(map(eh_chave_imagem, modelo.todos_placeholders)) else None
+    membros = []
+
+    for membro in modelo.membros:
+        if membro.nome in modelo.placeholders:
+            xml = substituir_na_parte(modelo.partes[membro.nome], dados_limpos, dados, imagens, membro.nome)
+            membro = comprimir_membro(membro.nome, xml)
+        membros.append(membro)
+
+    if imagens is not None:
+        membros = imagens.aplicar(membros)
+    return escrever_zip(membros)
+
+
+def salvar_pacote(doc, modelo=None):
+    """Serializa um Document do python-docx, reaproveitando os membros comprimidos do modelo"""
+    pacote = doc.part.package
+    partes = list(pacote.iter_parts())
+    compilados = {membro.nome: membro for membro in modelo.membros} if modelo is not None else {}
+
+    def membro(nome, dados):
+        original = compilados.get(nome)
+        if original is not None and original.tamanho == len(dados) and original.crc == zlib.crc32(dados):
+            return original
+        return comprimir_membro(nome, dados)
+
+    membros = [
+        membro(CONTENT_TYPES_URI.membername, _ContentTypesItem.from_parts(partes).blob),
+        membro(PACKAGE_URI.rels_uri.membername, pacote.rels.xml)
+    ]
+    for parte in partes:
+        membros.append(membro(parte.partname.membername, parte.blob))
+        if len(parte.rels):
+            membros.append(membro(parte.partname.rels_uri.membername, parte.rels.xml))
+    return escrever_zip(membros)
+
+
+def validar(conteudo):
+    """Confere CRC e estrutura do zip gerado (usado em testes e no stress)"""
+    import io
+    with zipfile.ZipFile(io.BytesIO(conteudo)) as pacote:
+        return pacote.testzip() is None
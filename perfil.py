@@ -0,0 +1,215 @@
+"""
+Profiling sob demanda de uma requisição.
+
+Quando um modelo ou uma mensagem específica renderiza devagar em produção, a
+requisição pode ser repetida com o cabeçalho X-Perfil (ou ?perfil=) contendo
+o token configurado. Ela roda sob o cProfile e o perfil fica gravado em
+PERFIL_DIR:
+    <id>.prof  estatísticas do pstats (snakeviz, python -m pstats)
+    <id>.txt   resumo por componente (python-docx, lxml, zlib, base64...), as
+               etapas do projeto (preencher_modelo, substituir_placeholders_robusto,
+               salvar_pacote...) e as funções mais caras
+
+A resposta leva X-Perfil-Id e X-Perfil-Url (GET /debug/perfis/{id}, com o
+mesmo token). O profiler só é ligado na thread que executa o pipeline
+(perfilar(), em PipelineRender.gerar): com o pool de processos, o render em
+si aparece como espera.
+
+Sem PERFIL_TOKEN o middleware nem é instalado e perfilar() não faz nada além
+de ler uma ContextVar.
+
+Configuração por variáveis de ambiente:
+    PERFIL_TOKEN   token exigido para perfilar (vazio = desativado)
+    PERFIL_DIR     diretório dos perfis (padrão: <tmp>/perfis)
+    PERFIL_LINHAS  funções listadas no resumo (padrão: 40)
+"""
+
+import contextvars
+import cProfile
+import hmac
+import io
+import logging
+import os
+import pstats
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+from urllib.parse import parse_qs
+
+import metricas
+
+logger = logging.getLogger(__name__)
+
+# Perfil da requisição atual (copiado para a thread do endpoint junto com o contexto)
+_perfil_atual = contextvars.ContextVar("perfil_atual", default=None)
+
+# Funções do projeto destacadas no resumo (tempo acumulado)
+FUNCOES_DESTAQUE = (
+    "preencher_modelo",
+    "substituir_placeholders_robusto",
+    "expandir_documento",
+    "substituir_na_parte",
+    "salvar_pacote",
+    "salvar_documento",
+    "codificar_base64",
+    "b64encode",
+)
+
+DIRETORIO_PROJETO = os.path.dirname(os.path.abspath(__file__))
+
+
+@contextmanager
+def perfilar():
+    """Liga o profiler da requisição (se houver) na thread atual durante o bloco"""
+    perfil = _perfil_atual.get()
+    if perfil is None:
+        yield
+        return
+    perfil.enable()
+    try:
+        yield
+    finally:
+        perfil.disable()
+
+
+def componente(arquivo, funcao):
+    """Agrupa uma entrada do pstats por biblioteca ou módulo do projeto"""
+    if arquivo == "~":
+        # Funções em C: "<built-in method zlib.crc32>", "<method 'compress' of 'zlib.Compress' objects>"
+        for nome in ("zlib", "binascii", "lxml", "_pickle", "_sqlite3"):
+            if nome in funcao:
+                return "base64" if nome == "binascii" else nome.lstrip("_")
+        return "builtins"
+    if arquivo.startswith("<"):
+        return "stdlib"  # <frozen posixpath>, <string>...
+    caminho = arquivo.replace("\\", "/")
+    for pacote in ("docx", "lxml", "zipfile", "base64", "orjson", "starlette", "fastapi", "anyio"):
+        if f"/{pacote}/" in caminho or caminho.endswith(f"/{pacote}.py"):
+            return "python-docx" if pacote == "docx" else pacote
+    if os.path.dirname(os.path.abspath(arquivo)) == DIRETORIO_PROJETO:
+        return os.path.splitext(os.path.basename(arquivo))[0]
+    return "outros"
+
+
+def resumir(estatisticas, titulo, linhas=40):
+    """Texto com o tempo por componente, as etapas destacadas e as funções mais caras"""
+    total = estatisticas.total_tt or 1e-9
+    por_componente = {}
+    destaques = {}
+    for (arquivo, _, funcao), (_, _, proprio, acumulado, _) in estatisticas.stats.items():
+        nome = componente(arquivo, funcao)
+        por_componente[nome] = por_componente.get(nome, 0.0) + proprio
+        if funcao in FUNCOES_DESTAQUE:
+            destaques[funcao] = max(destaques.get(funcao, 0.0), acumulado)
+
+    saida = io.StringIO()
+    saida.write(f"{titulo}\n\nPor componente (tempo próprio):\n")
+    for nome, tempo in sorted(por_componente.items(), key=lambda item: -item[1]):
+        saida.write(f"  {nome:<28} {tempo * 1000:>9.1f} ms {tempo / total * 100:>5.1f}%\n")
+    if destaques:
+        saida.write("\nEtapas (tempo acumulado):\n")
+        for funcao, tempo in sorted(destaques.items(), key=lambda item: -item[1]):
+            saida.write(f"  {funcao:<28} {tempo * 1000:>9.1f} ms\n")
+    saida.write("\n")
+    estatisticas.stream = saida
+    estatisticas.sort_stats("cumulative").print_stats(linhas)
+    return saida.getvalue()
+
+
+class Perfilador:
+    """Token, destino e formato dos perfis sob demanda"""
+
+    def __init__(self, token, diretorio, linhas=40):
+        self.token = token
+        self.diretorio = diretorio
+        self.linhas = linhas
+        self.gerados = 0
+        os.makedirs(diretorio, exist_ok=True)
+
+    @classmethod
+    def do_ambiente(cls):
+        token = os.environ.get("PERFIL_TOKEN")
+        if not token:
+            return None
+        return cls(
+            token,
+            os.environ.get("PERFIL_DIR") or os.path.join(tempfile.gettempdir(), "perfis"),
+            linhas=int(os.environ.get("PERFIL_LINHAS", 40))
+        )
+
+    def autorizado(self, token):
+        """Compara em bytes: compare_digest recusa str com caracteres fora do ASCII"""
+        if not token:
+            return False
+        try:
+            recebido = token.encode("utf-8") if isinstance(token, str) else bytes(token)
+        except (UnicodeError, TypeError):
+            return False
+        return hmac.compare_digest(recebido, self.token.encode("utf-8"))
+
+    def pedido(self, scope):
+        """Token do cabeçalho X-Perfil ou do parâmetro ?perfil= da requisição"""
+        if scope.get("path", "").startswith("/debug/perfis/"):
+            return False
+        for chave, valor in scope.get("headers", []):
+            if chave == b"x-perfil":
+                return self.autorizado(valor.decode("latin-1"))
+        consulta = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        return self.autorizado((consulta.get("perfil") or [""])[0])
+
+    def caminho(self, id_perfil, extensao):
+        if not id_perfil.isalnum():
+            return None
+        caminho = os.path.join(self.diretorio, f"{id_perfil}.{extensao}")
+        return caminho if os.path.exists(caminho) else None
+
+    def salvar(self, id_perfil, perfil, titulo):
+        """Grava o .prof e o resumo .txt; devolve o resumo"""
+        estatisticas = pstats.Stats(perfil)
+        estatisticas.dump_stats(os.path.join(self.diretorio, f"{id_perfil}.prof"))
+        resumo = resumir(estatisticas, titulo, self.linhas)
+        with open(os.path.join(self.diretorio, f"{id_perfil}.txt"), "w", encoding="utf-8") as f:
+            f.write(resumo)
+        self.gerados += 1
+        metricas.incrementar("perfis_gerados")
+        return resumo
+
+
+class MiddlewarePerfil:
+    """Middleware ASGI que perfila as requisições com o token de profiling"""
+
+    def __init__(self, app, perfilador):
+        self.app = app
+        self.perfilador = perfilador
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.perfilador.pedido(scope):
+            await self.app(scope, receive, send)
+            return
+
+        perfil = cProfile.Profile()
+        id_perfil = uuid.uuid4().hex[:16]
+        inicio = time.perf_counter()
+        titulo = f"Perfil {id_perfil}: {scope.get('method')} {scope.get('path')}"
+
+        async def enviar(mensagem):
+            # Endpoints síncronos terminam o trabalho antes de iniciar a resposta
+            if mensagem["type"] == "http.response.start" and perfil.getstats():
+                duracao = (time.perf_counter() - inicio) * 1000
+                try:
+                    self.perfilador.salvar(id_perfil, perfil, f"{titulo} ({duracao:.1f} ms na requisição)")
+                    logger.info(f"🔬 {titulo} gravado em {self.perfilador.diretorio} ({duracao:.1f} ms)")
+                except Exception as e:
+                    logger.warning(f"⚠️ Não foi possível gravar o perfil {id_perfil}: {e}")
+                mensagem = dict(mensagem, headers=list(mensagem.get("headers", [])) + [
+                    (b"x-perfil-id", id_perfil.encode("ascii")),
+                    (b"x-perfil-url", f"/debug/perfis/{id_perfil}".encode("ascii"))
+                ])
+            await send(mensagem)
+
+        token = _perfil_atual.set(perfil)
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            _perfil_atual.reset(token)
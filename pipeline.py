@@ -0,0 +1,295 @@
+"""
+Pipeline único de geração de documentos.
+
+Todos os endpoints de geração passam pelas mesmas etapas explícitas:
+
+    extrair -> localizar modelo -> renderizar (cache -> motor -> fallback)
+            -> validar -> [publicar no armazém] -> codificar
+
+A saída é determinística: o mesmo modelo com os mesmos dados produz os mesmos
+bytes (zip com datas fixas e ordem estável, ver motor_zip.py). Por isso a
+chave de conteúdo do cache também serve de ETag forte para os formatos que
+devolvem o próprio documento: um If-None-Match igual responde 304 antes de
+renderizar. Os campos de data (DATA, HORA...) vêm do instante informado pelo
+chamador (data_referencia) ou do relógio.
+
+O documento renderizado fica em memória (bytes) e é entregue ao codificador do
+formato pedido sem ser copiado de novo. Os formatos de saída (binário, base64,
+WhatsApp, Z-API, PDF...) são codificadores registrados com
+registrar_codificador(); um formato novo não exige mexer no pipeline. Cache,
+motor de render e métricas por etapa valem para todos os formatos.
+"""
+
+import hashlib
+import logging
+import os
+import re
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+from fastapi import HTTPException
+from fastapi.responses import Response
+
+import compressao
+import metricas
+import modelo_compilado
+import perfil
+import imagens
+from cache_render import chave_render, obter_cache
+from imagens import ImagemInvalida
+from memoria import MemoriaEsgotada
+from modelo_compilado import MODELOS_POSSIVEIS, encontrar_modelo, obter_modelo
+
+logger = logging.getLogger(__name__)
+
+MIME_DOCX = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+# DOCX mínimo tem pelo menos 1KB
+TAMANHO_MINIMO_DOCX = 1000
+
+# Base da estimativa de memória quando não há modelo (documento fallback)
+TAMANHO_FALLBACK = 64 * 1024
+
+ORIGEM_CACHE = "cache"
+ORIGEM_MODELO = "modelo"
+ORIGEM_FALLBACK = "fallback"
+
+
+class DocumentoRenderizado:
+    """Resultado da etapa de render: bytes do DOCX e dados que o originaram"""
+
+    def __init__(self, conteudo, dados_extraidos, origem, modelo=None, chave=None):
+        self.conteudo = conteudo
+        self.dados_extraidos = dados_extraidos
+        self.origem = origem
+        self.modelo = modelo
+        self.chave = chave
+        # Preenchidos quando o armazém está ativo: link (formatos JSON) ou
+        # arquivo em disco (formatos binários servidos com sendfile)
+        self.download_url = None
+        self.hash = None
+        self.caminho = None
+        self.x_accel = None
+        # ETag forte do documento (formatos com etag_forte, fora do fallback)
+        self.etag = None
+        # Content-Encoding negociado (formatos com comprimir) e marcador do
+        # base64 no corpo JSON, trocado pelo trecho comprimido (compressao.py)
+        self.codificacao = None
+        self.marcador_base64 = None
+
+    @property
+    def tamanho(self):
+        return len(self.conteudo)
+
+
+class Codificador:
+    """Formato de saída: nome do arquivo, resposta de sucesso e resposta de erro"""
+
+    nome = None
+    media_type = MIME_DOCX
+    # Formatos JSON: com o armazém ativo, levam download_url em vez do base64
+    entrega_por_url = False
+    # Formatos que devolvem o próprio DOCX: com o armazém ativo, servidos do disco
+    servir_do_disco = False
+    # Corpo da resposta depende só do documento: recebe ETag forte e responde 304
+    etag_forte = False
+    # Corpo JSON comprimido conforme o Accept-Encoding (compressao.py)
+    comprimir = False
+
+    def nome_arquivo(self, dados, agora):
+        nome_cliente = dados.get("NOME", "cliente").replace(" ", "_")
+        nome_cliente = re.sub(r'[^\w\-_.]', '', nome_cliente)
+        return f"documento_{nome_cliente}_{agora.strftime('%Y%m%d_%H%M%S')}.docx"
+
+    def codificar(self, documento, filename):
+        raise NotImplementedError
+
+    def erro(self, excecao):
+        raise HTTPException(status_code=500, detail=f"Erro na geração do documento: {str(excecao)}")
+
+
+_codificadores = {}
+
+
+def registrar_codificador(classe):
+    """Registra um codificador (pode ser usado como decorador de classe)"""
+    codificador = classe() if isinstance(classe, type) else classe
+    _codificadores[codificador.nome] = codificador
+    return classe
+
+
+def obter_codificador(nome):
+    return _codificadores.get(nome)
+
+
+def codificadores_registrados():
+    return dict(_codificadores)
+
+
+class PipelineRender:
+    """Etapas de geração compartilhadas por todos os endpoints"""
+
+    def __init__(self, extrair, motores, renderizar_fallback, motor="docx", modelos=None, armazem=None, orcamento=None):
+        self.extrair_dados = extrair
+        self.motores = motores
+        self.renderizar_fallback = renderizar_fallback
+        self.motor = motor
+        self.modelos = modelos or MODELOS_POSSIVEIS
+        self.armazem = armazem
+        self.orcamento = orcamento
+
+    def extrair(self, mensagem, data_referencia=None, imagens_recebidas=None):
+        """Dados da mensagem, mais as referências das imagens recebidas ({{IMG:NOME}})"""
+        with metricas.medir_etapa("pipeline_extrair"):
+            dados_extraidos = self.extrair_dados(mensagem, data_referencia)
+        if imagens_recebidas:
+            dados_extraidos.update(imagens.registrar(imagens_recebidas))
+        return dados_extraidos
+
+    def localizar(self, dados_extraidos):
+        """(caminho, modelo compilado, chave de conteúdo); modelo e chave são None sem modelo"""
+        with metricas.medir_etapa("pipeline_localizar_modelo"):
+            caminho_modelo = encontrar_modelo(self.modelos)
+            modelo = obter_modelo(caminho_modelo) if caminho_modelo else None
+            chave = chave_render(modelo, dados_extraidos, variante=self.motor) if modelo else None
+        return caminho_modelo, modelo, chave
+
+    def etag(self, chave, formato):
+        """ETag forte de um documento: chave de conteúdo + formato + nível de compressão"""
+        if chave is None:
+            return None
+        base = f"{chave}:{formato}:{modelo_compilado.NIVEL_DEFLATE}".encode("utf-8")
+        return f'"{hashlib.sha256(base).hexdigest()[:32]}"'
+
+    @contextmanager
+    def memoria_da_geracao(self, localizado, formato):
+        """Reserva do orçamento de memória e pico medido da geração, por modelo e formato"""
+        caminho_modelo, modelo, _ = localizado
+        nome_modelo = os.path.splitext(os.path.basename(caminho_modelo))[0] if caminho_modelo else ORIGEM_FALLBACK
+        chave = f"{nome_modelo}_{formato}"
+
+        reserva = nullcontext()
+        if self.orcamento is not None:
+            tamanho = len(modelo.conteudo) if modelo else TAMANHO_FALLBACK
+            reserva = self.orcamento.reservar(self.orcamento.estimar(chave, tamanho))
+
+        with reserva, metricas.medir_memoria(f"documento_{chave}") as medida:
+            yield
+        # Só picos medidos sem outra geração simultânea (os demais incluem a memória dela)
+        if medida["isolada"] and self.orcamento is not None:
+            self.orcamento.aprender(chave, medida["pico"])
+
+    def renderizar(self, dados_extraidos, localizado=None):
+        """Cache compartilhado -> motor configurado -> documento fallback"""
+        caminho_modelo, modelo, chave = localizado or self.localizar(dados_extraidos)
+
+        cache = obter_cache()
+        if chave and cache:
+            with metricas.medir_etapa("pipeline_cache"):
+                conteudo = cache.obter(chave)
+            if conteudo is not None:
+                logger.info(f"🗄️ Documento obtido do cache de render: {chave[:12]}")
+                return self._resultado(conteudo, dados_extraidos, ORIGEM_CACHE, modelo, chave)
+
+        if modelo:
+            try:
+                logger.info(f"Template encontrado: {caminho_modelo} (motor {self.motor})")
+                with metricas.medir_etapa(f"pipeline_renderizar_{self.motor}"):
+                    conteudo = self.motores[self.motor](caminho_modelo, dados_extraidos)
+                logger.info("Template preenchido com sucesso")
+                if chave and cache:
+                    cache.guardar(chave, conteudo)
+                return self._resultado(conteudo, dados_extraidos, ORIGEM_MODELO, modelo, chave)
+            except Exception as e:
+                logger.error(f"Erro no preenchimento: {e}")
+                logger.info("Criando documento fallback...")
+        else:
+            logger.info("Template não encontrado, criando documento padrão")
+
+        with metricas.medir_etapa("pipeline_renderizar_fallback"):
+            conteudo = self.renderizar_fallback(dados_extraidos)
+        return self._resultado(conteudo, dados_extraidos, ORIGEM_FALLBACK, modelo)
+
+    def _resultado(self, conteudo, dados_extraidos, origem, modelo, chave=None):
+        metricas.incrementar(f"documentos_origem_{origem}")
+        return DocumentoRenderizado(conteudo, dados_extraidos, origem, modelo, chave)
+
+    def validar(self, documento):
+        with metricas.medir_etapa("pipeline_validar"):
+            if documento.tamanho < TAMANHO_MINIMO_DOCX:
+                raise Exception("Arquivo gerado parece estar corrompido (muito pequeno)")
+            if not documento.conteudo.startswith(b'PK'):
+                raise Exception("Arquivo gerado não é um DOCX válido")
+
+    def gerar(self, mensagem, formato, dados_extraidos=None, data_referencia=None, if_none_match=None, imagens=None,
+              accept_encoding=None):
+        """
+        Executa o pipeline completo e devolve a resposta HTTP do formato pedido
+
+        Com dados_extraidos (já extraídos pelo chamador), a extração é pulada.
+        Com if_none_match igual ao ETag do documento, responde 304 sem renderizar.
+        imagens ({"NOME": base64}) preenchem os placeholders {{IMG:NOME}}.
+        accept_encoding escolhe a compressão dos formatos JSON (gzip/br).
+        """
+        codificador = obter_codificador(formato)
+        if codificador is None:
+            raise HTTPException(status_code=404, detail=f"Formato de saída desconhecido: {formato}")
+
+        inicio = time.perf_counter()
+        with perfil.perfilar():
+            return self._gerar(codificador, mensagem, formato, dados_extraidos, data_referencia, if_none_match, imagens,
+                               accept_encoding, inicio)
+
+    def _gerar(self, codificador, mensagem, formato, dados_extraidos, data_referencia, if_none_match, imagens_recebidas,
+               accept_encoding, inicio):
+        try:
+            if dados_extraidos is None:
+                dados_extraidos = self.extrair(mensagem, data_referencia, imagens_recebidas)
+            localizado = self.localizar(dados_extraidos)
+
+            etag = self.etag(localizado[2], formato) if codificador.etag_forte else None
+            if etag and if_none_match and etag in [v.strip() for v in if_none_match.split(",")]:
+                metricas.incrementar("documentos_304")
+                logger.info(f"♻️ Documento inalterado para o cliente (ETag {etag}), render evitado")
+                return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+            with self.memoria_da_geracao(localizado, formato):
+                documento = self.renderizar(dados_extraidos, localizado)
+                self.validar(documento)
+                if documento.origem != ORIGEM_FALLBACK:
+                    documento.etag = etag
+                if codificador.comprimir:
+                    documento.codificacao = compressao.negociar(accept_encoding)
+
+                filename = codificador.nome_arquivo(dados_extraidos, datetime.now())
+                logger.info(f"Documento criado: {filename} ({documento.tamanho} bytes, origem {documento.origem})")
+
+                if self.armazem is not None and codificador.entrega_por_url:
+                    documento.download_url = self.armazem.publicar(documento.conteudo, filename)
+                elif self.armazem is not None and codificador.servir_do_disco:
+                    documento.hash = self.armazem.guardar(documento.conteudo)
+                    documento.caminho = self.armazem.caminho(documento.hash)
+                    documento.x_accel = self.armazem.caminho_x_accel(documento.hash)
+
+                with metricas.medir_etapa(f"pipeline_codificar_{formato}"):
+                    resposta = codificador.codificar(documento, filename)
+
+            metricas.incrementar(f"documentos_formato_{formato}")
+            return resposta
+
+        except HTTPException:
+            raise
+        except ImagemInvalida as e:
+            logger.warning(f"🖼️ Imagem recusada ({formato}): {e}")
+            raise HTTPException(status_code=422, detail=str(e))
+        except MemoriaEsgotada as e:
+            logger.warning(f"🧠 Geração recusada ({formato}): {e}")
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+        except Exception as e:
+            logger.error(f"ERRO CRÍTICO: {e}")
+            metricas.incrementar(f"erros_formato_{formato}")
+            return codificador.erro(e)
+
+        finally:
+            metricas.registrar_tempo("pipeline_total", time.perf_counter() - inicio)
@@ -0,0 +1,331 @@
+"""
+Pool de processos de render.
+
+Os renders rodam em processos separados que mantêm o modelo compilado em
+memória, fora do GIL do processo HTTP. O pool recebe lotes: o micro-batcher
+(microlote.py) junta requisições concorrentes e envia várias de uma vez,
+pagando o IPC e a serialização uma vez por lote em vez de uma vez por documento.
+
+O pool é criado sob demanda e por PID: o processo mestre do modo pré-fork usa
+um pool próprio no aquecimento e o encerra antes do fork; cada worker cria o
+seu no primeiro render.
+
+Tamanho adaptativo: cada processo do pool é um executor de um processo só, e
+cada lote vai para o processo pronto com menos lotes pendentes. Uma thread de
+controle mede a espera na fila (do envio até o processo começar o lote) e:
+    - cresce um processo quando o p95 da espera passa de RENDER_POOL_ESPERA_MS,
+      se há CPU livre (carga média por núcleo abaixo de RENDER_POOL_CARGA_MAX)
+      e nenhum processo novo ainda está aquecendo;
+    - encerra um processo acima do mínimo que ficou ocioso por
+      RENDER_POOL_OCIOSO_S.
+Um processo novo só recebe lotes depois de carregar o modelo compilado
+(_aquecer_processo). As decisões aparecem em /metrics (medidor "pool_render"
+e contadores pool_render_crescimentos / pool_render_reducoes).
+
+Configuração por variáveis de ambiente:
+    RENDER_POOL_WORKERS     processos de render (padrão: 0 = desativado, render na thread)
+    RENDER_POOL_MIN         mínimo de processos (padrão: RENDER_POOL_WORKERS ou 1)
+    RENDER_POOL_MAX         máximo de processos (padrão: RENDER_POOL_WORKERS; maior que o
+                            mínimo = pool adaptativo)
+    RENDER_POOL_ESPERA_MS   p95 da espera na fila que dispara o crescimento (padrão: 50)
+    RENDER_POOL_OCIOSO_S    ociosidade para encerrar um processo acima do mínimo (padrão: 60)
+    RENDER_POOL_CARGA_MAX   carga média por núcleo acima da qual o pool não cresce (padrão: 1.0)
+"""
+
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import metricas
+
+logger = logging.getLogger(__name__)
+
+# Estado dos processos do pool (preenchido no initializer)
+_motor = "zip"
+
+
+def _inicializar_processo(motor):
+    global _motor
+    logging.disable(logging.INFO)
+    _motor = motor
+
+
+def _aquecer_processo():
+    """Carrega o motor e os modelos compilados antes do processo receber lotes"""
+    import modelo_compilado
+    if _motor == "zip":
+        import motor_zip  # noqa: F401
+    else:
+        # Só o motor: o app FastAPI (main.py) não é montado nos processos do pool
+        import render_docx  # noqa: F401
+    modelo_compilado.compilar_modelos()
+    return os.getpid()
+
+
+def _renderizar(caminho_modelo, dados):
+    if _motor == "zip":
+        import modelo_compilado
+        import motor_zip
+        return motor_zip.renderizar(modelo_compilado.obter_modelo(caminho_modelo), dados)
+
+    from render_docx import renderizar_com_python_docx
+    return renderizar_com_python_docx(caminho_modelo, dados)
+
+
+def _renderizar_lote(itens):
+    """Executa no processo do pool: [(caminho, dados), ...] -> (início, [(ok, bytes | erro), ...])"""
+    inicio = time.time()
+    resultados = []
+    for caminho_modelo, dados in itens:
+        try:
+            resultados.append((True, _renderizar(caminho_modelo, dados)))
+        except Exception as e:
+            resultados.append((False, str(e)))
+    return inicio, resultados
+
+
+def nucleos_disponiveis():
+    try:
+        return max(1, len(os.sched_getaffinity(0)))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def carga_por_nucleo():
+    """Carga média do último minuto por núcleo (None onde não existe getloadavg)"""
+    try:
+        return os.getloadavg()[0] / nucleos_disponiveis()
+    except (AttributeError, OSError):
+        return None
+
+
+class ErroRender(Exception):
+    """Falha no render de um item dentro do pool"""
+
+
+class ProcessoRender:
+    """Um processo do pool: executor de um processo só, aquecido na criação"""
+
+    def __init__(self, motor):
+        self.executor = ProcessPoolExecutor(
+            1,
+            # spawn: processos limpos mesmo quando o chamador tem threads ou é um worker pré-fork
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_inicializar_processo,
+            initargs=(motor,)
+        )
+        self.aquecimento = self.executor.submit(_aquecer_processo)
+        self.pendentes = 0
+        self.ocioso_desde = time.monotonic()
+
+    @property
+    def pronto(self):
+        return self.aquecimento.done()
+
+    def encerrar(self, esperar=False):
+        self.executor.shutdown(wait=esperar, cancel_futures=True)
+
+
+class PoolRender:
+    """Processos de render com o motor e o modelo compilado carregados, em número adaptativo"""
+
+    def __init__(self, workers, motor="zip", microlote=None, minimo=None, maximo=None,
+                 espera_alvo_ms=50, ocioso_s=60, carga_maxima=1.0, intervalo_s=1.0):
+        self.workers = workers
+        self.motor = motor
+        self.microlote = microlote
+        self.minimo = max(1, minimo or workers)
+        self.maximo = max(self.minimo, maximo or workers)
+        self.espera_alvo = espera_alvo_ms / 1000
+        self.ocioso_s = ocioso_s
+        self.carga_maxima = carga_maxima
+        self.intervalo_s = intervalo_s
+        self.decisoes = deque(maxlen=20)
+        self._processos = []
+        self._esperas = deque(maxlen=1000)
+        self._ultimo_p95 = 0.0
+        self._pid = None
+        self._parar = threading.Event()
+        self._trava = threading.Lock()
+
+    @classmethod
+    def do_ambiente(cls, motor):
+        workers = int(os.environ.get("RENDER_POOL_WORKERS", 0))
+        maximo = int(os.environ.get("RENDER_POOL_MAX", 0)) or workers
+        if maximo <= 0:
+            return None
+        minimo = int(os.environ.get("RENDER_POOL_MIN", 0)) or min(workers or 1, maximo)
+        return cls(
+            workers or minimo,
+            motor,
+            minimo=minimo,
+            maximo=maximo,
+            espera_alvo_ms=float(os.environ.get("RENDER_POOL_ESPERA_MS", 50)),
+            ocioso_s=float(os.environ.get("RENDER_POOL_OCIOSO_S", 60)),
+            carga_maxima=float(os.environ.get("RENDER_POOL_CARGA_MAX", 1.0))
+        )
+
+    @property
+    def adaptativo(self):
+        return self.maximo > self.minimo
+
+    def _garantir_processos(self):
+        with self._trava:
+            if self._pid != os.getpid():
+                self._processos = [ProcessoRender(self.motor) for _ in range(self.minimo)]
+                self._esperas.clear()
+                self._parar = threading.Event()
+                self._pid = os.getpid()
+                if self.adaptativo:
+                    threading.Thread(target=self._controlar, name="pool_render", daemon=True).start()
+                logger.info(
+                    f"🏭 Pool de render iniciado: {self.minimo} processo(s)"
+                    f"{f' (até {self.maximo})' if self.adaptativo else ''}, motor {self.motor}"
+                )
+
+    def _escolher_processo(self):
+        prontos = [processo for processo in self._processos if processo.pronto] or self._processos
+        return min(prontos, key=lambda processo: processo.pendentes)
+
+    def enviar_lote(self, itens):
+        """Envia [(caminho, dados), ...] a um processo; devolve um Future da lista de resultados"""
+        self._garantir_processos()
+        metricas.incrementar("pool_render_lotes")
+        metricas.incrementar("pool_render_itens", len(itens))
+
+        with self._trava:
+            processo = self._escolher_processo()
+            processo.pendentes += 1
+        envio = time.time()
+        futuro = Future()
+
+        def concluir(concluido):
+            with self._trava:
+                processo.pendentes -= 1
+                if processo.pendentes == 0:
+                    processo.ocioso_desde = time.monotonic()
+            try:
+                inicio, resultados = concluido.result()
+            except BrokenProcessPool as e:
+                self._substituir(processo)
+                futuro.set_exception(e)
+                return
+            except BaseException as e:
+                futuro.set_exception(e)
+                return
+            espera = max(0.0, inicio - envio)
+            self._esperas.append(espera)
+            metricas.registrar_tempo("pool_render_fila", espera)
+            futuro.set_result(resultados)
+
+        try:
+            processo.executor.submit(_renderizar_lote, itens).add_done_callback(concluir)
+        except BrokenProcessPool:
+            with self._trava:
+                processo.pendentes -= 1
+            self._substituir(processo)
+            raise
+        return futuro
+
+    def renderizar(self, caminho_modelo, dados):
+        """Render de um documento no pool, agrupado pelo micro-batcher quando configurado"""
+        inicio = time.perf_counter()
+        if self.microlote is not None:
+            ok, resultado = self.microlote.executar((caminho_modelo, dados))
+        else:
+            ok, resultado = self.enviar_lote([(caminho_modelo, dados)]).result()[0]
+        metricas.registrar_tempo("pool_render_item", time.perf_counter() - inicio)
+        if not ok:
+            raise ErroRender(resultado)
+        return resultado
+
+    def _substituir(self, processo):
+        """Troca um processo que morreu (OOM, sinal) por um novo"""
+        with self._trava:
+            if processo not in self._processos:
+                return
+            self._processos.remove(processo)
+            self._processos.append(ProcessoRender(self.motor))
+        metricas.incrementar("pool_render_substituicoes")
+        logger.warning("⚠️ Processo de render terminou inesperadamente, substituído")
+
+    def _registrar_decisao(self, acao, motivo):
+        tamanho = len(self._processos)
+        self.decisoes.append({"instante": time.time(), "acao": acao, "tamanho": tamanho, "motivo": motivo})
+        logger.info(f"🏭 Pool de render {acao} para {tamanho} processo(s): {motivo}")
+
+    def avaliar(self):
+        """Uma decisão de tamanho: cresce, encolhe ou mantém; devolve a ação tomada ou None"""
+        esperas = sorted(self._esperas)
+        self._esperas.clear()
+        p95 = esperas[min(len(esperas) - 1, int(round(0.95 * (len(esperas) - 1))))] if esperas else 0.0
+        self._ultimo_p95 = p95
+        carga = carga_por_nucleo()
+
+        with self._trava:
+            aquecendo = any(not processo.pronto for processo in self._processos)
+            if p95 > self.espera_alvo and len(self._processos) < self.maximo and not aquecendo:
+                if carga is not None and carga >= self.carga_maxima:
+                    metricas.incrementar("pool_render_crescimentos_sem_cpu")
+                    return None
+                self._processos.append(ProcessoRender(self.motor))
+                metricas.incrementar("pool_render_crescimentos")
+                self._registrar_decisao("cresceu", f"p95 da fila {p95 * 1000:.0f} ms")
+                return "cresceu"
+
+            if len(self._processos) > self.minimo and p95 <= self.espera_alvo:
+                agora = time.monotonic()
+                ociosos = [
+                    processo for processo in self._processos
+                    if processo.pronto and processo.pendentes == 0 and agora - processo.ocioso_desde >= self.ocioso_s
+                ]
+                if ociosos:
+                    processo = ociosos[0]
+                    self._processos.remove(processo)
+                    self._registrar_decisao("encolheu", f"processo ocioso há {agora - processo.ocioso_desde:.0f}s")
+                else:
+                    processo = None
+            else:
+                processo = None
+
+        if processo is not None:
+            processo.encerrar()
+            metricas.incrementar("pool_render_reducoes")
+            return "encolheu"
+        return None
+
+    def _controlar(self):
+        parar = self._parar
+        while not parar.wait(self.intervalo_s):
+            try:
+                self.avaliar()
+            except Exception as e:
+                logger.warning(f"⚠️ Falha no controle do pool de render: {e}")
+
+    def exportar(self):
+        with self._trava:
+            processos = list(self._processos) if self._pid == os.getpid() else []
+        return {
+            "tamanho": len(processos),
+            "prontos": sum(1 for processo in processos if processo.pronto),
+            "pendentes": sum(processo.pendentes for processo in processos),
+            "minimo": self.minimo,
+            "maximo": self.maximo,
+            "espera_p95_ms": round(self._ultimo_p95 * 1000, 3),
+            "carga_por_nucleo": carga_por_nucleo(),
+            "decisoes": list(self.decisoes)
+        }
+
+    def encerrar(self):
+        with self._trava:
+            self._parar.set()
+            processos = self._processos if self._pid == os.getpid() else []
+            self._processos = []
+            self._pid = None
+        for processo in processos:
+            processo.encerrar(esperar=True)
@@ -1,4 +1,5 @@
 from docx import Document
+from repeticao import celulas_da_tabela, expandir_documento, preparar_listas
 
 def substituir_em_runs_preservando_tudo(paragrafos, dados):
     """
@@ -50,9 +51,15 @@ def preencher_modelo(caminho_modelo, caminho_saida, dados):
         print(f"📄 Abrindo modelo: {caminho_modelo}")
         doc = Document(caminho_modelo)
         
+        # Expandir seções repetidas ({{PARCELA.CAMPO}})
+        dados = preparar_listas(dados)
+        expandir_documento(doc, dados)
+        
         # Converter todos os valores para string e tratar None
         dados_limpos = {}
         for chave, valor in dados.items():
+            if isinstance(valor, list):
+                continue
             if valor is None or valor == "":
                 dados_limpos[chave] = "Não informado"
             else:
@@ -71,9 +78,8 @@ def preencher_modelo(caminho_modelo, caminho_saida, dados):
         print("🔄 Processando tabelas...")
         for i, tabela in enumerate(doc.tables):
             print(f"   Tabela {i+1}...")
-            for j, linha in enumerate(tabela.rows):
-                for k, celula in enumerate(linha.cells):
-                    substituir_em_runs_preservando_tudo(celula.paragraphs, dados_limpos)
+            for celula in celulas_da_tabela(tabela):
+                substituir_em_runs_preservando_tudo(celula.paragraphs, dados_limpos)
         
         # Substituir nos cabeçalhos e rodapés
         print("🔄 Processando cabeçalhos e rodapés...")
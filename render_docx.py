@@ -0,0 +1,344 @@
+"""
+Motor de render python-docx (o padrão) e o documento fallback.
+
+Fica fora do main.py para os processos do pool de render (pool_render.py), o
+benchmark e os scripts importarem só o motor, sem montar o app FastAPI (e seus
+middlewares, pool, armazém, fila de jobs...) em cada processo.
+"""
+
+import io
+import logging
+
+from docx import Document
+
+import imagens
+import motor_zip
+from modelo_compilado import PADRAO_PLACEHOLDER, obter_modelo
+from repeticao import celulas_da_tabela, expandir_documento, preparar_listas
+
+logger = logging.getLogger(__name__)
+
+def substituir_placeholders_robusto(paragrafos, dados):
+    """
+    Substitui placeholders de forma mais robusta, lidando com runs fragmentados
+    """
+    for paragrafo in paragrafos:
+        if not paragrafo.runs:
+            continue
+            
+        # Consolidar texto completo do parágrafo
+        texto_completo = ''.join(run.text for run in paragrafo.runs)
+        
+        # Verificar se há placeholders no texto
+        texto_modificado = texto_completo
+        houve_substituicao = False
+        
+        for chave, valor in dados.items():
+            placeholder = f'{{{{{chave}}}}}'
+            valor_str = str(valor) if valor is not None else "Não informado"
+            
+            if placeholder in texto_modificado:
+                texto_modificado = texto_modificado.replace(placeholder, valor_str)
+                houve_substituicao = True
+                logger.info(f"✅ Substituído: {placeholder} -> {valor_str}")
+        
+        # Se houve substituição, reconstruir o parágrafo
+        if houve_substituicao:
+            # Preservar formatação do primeiro run com conteúdo
+            formatacao_base = None
+            for run in paragrafo.runs:
+                if run.text.strip():
+                    formatacao_base = {
+                        'font_name': run.font.name,
+                        'font_size': run.font.size,
+                        'bold': run.font.bold,
+                        'italic': run.font.italic,
+                        'underline': run.font.underline,
+                        'color': run.font.color.rgb if run.font.color.rgb else None
+                    }
+                    break
+            
+            # Limpar todos os runs
+            for run in paragrafo.runs:
+                run.text = ""
+            
+            # Garantir que há pelo menos um run
+            if not paragrafo.runs:
+                paragrafo.add_run()
+            
+            # Aplicar texto modificado no primeiro run
+            primeiro_run = paragrafo.runs[0]
+            primeiro_run.text = texto_modificado
+            
+            # Aplicar formatação preservada
+            if formatacao_base:
+                try:
+                    if formatacao_base['font_name']:
+                        primeiro_run.font.name = formatacao_base['font_name']
+                    if formatacao_base['font_size']:
+                        primeiro_run.font.size = formatacao_base['font_size']
+                    primeiro_run.font.bold = formatacao_base['bold'] or False
+                    primeiro_run.font.italic = formatacao_base['italic'] or False
+                    primeiro_run.font.underline = formatacao_base['underline'] or False
+                    if formatacao_base['color']:
+                        primeiro_run.font.color.rgb = formatacao_base['color']
+                except Exception as e:
+                    logger.warning(f"Erro ao aplicar formatação: {e}")
+
+def verificar_placeholders_no_documento(doc, dados):
+    """
+    Verifica e lista todos os placeholders encontrados no documento
+    """
+    placeholders_encontrados = set()
+    
+    # Verificar parágrafos principais
+    for paragrafo in doc.paragraphs:
+        texto = ''.join(run.text for run in paragrafo.runs)
+        matches = PADRAO_PLACEHOLDER.findall(texto)
+        placeholders_encontrados.update(matches)
+    
+    # Verificar tabelas
+    for tabela in doc.tables:
+        for celula in celulas_da_tabela(tabela):
+            for paragrafo in celula.paragraphs:
+                texto = ''.join(run.text for run in paragrafo.runs)
+                matches = PADRAO_PLACEHOLDER.findall(texto)
+                placeholders_encontrados.update(matches)
+    
+    # Verificar cabeçalhos e rodapés
+    for section in doc.sections:
+        if section.header:
+            for paragrafo in section.header.paragraphs:
+                texto = ''.join(run.text for run in paragrafo.runs)
+                matches = PADRAO_PLACEHOLDER.findall(texto)
+                placeholders_encontrados.update(matches)
+        
+        if section.footer:
+            for paragrafo in section.footer.paragraphs:
+                texto = ''.join(run.text for run in paragrafo.runs)
+                matches = PADRAO_PLACEHOLDER.findall(texto)
+                placeholders_encontrados.update(matches)
+    
+    logger.info(f"📋 Placeholders encontrados no documento: {list(placeholders_encontrados)}")
+    logger.info(f"📊 Dados disponíveis para substituição: {list(dados.keys())}")
+    
+    # Verificar quais placeholders não têm dados correspondentes
+    sem_dados = [p for p in placeholders_encontrados if p not in dados and not imagens.eh_chave_imagem(p)]
+    if sem_dados:
+        logger.warning(f"⚠️ Placeholders sem dados correspondentes: {sem_dados}")
+    
+    return list(placeholders_encontrados)
+
+def debug_documento_runs(doc, limite_paragrafos=5):
+    """
+    Função para debug - mostra como os runs estão organizados no documento
+    """
+    logger.info("🔍 DEBUG: Analisando estrutura de runs do documento")
+    
+    for i, paragrafo in enumerate(doc.paragraphs[:limite_paragrafos]):
+        if not paragrafo.runs:
+            continue
+            
+        texto_completo = ''.join(run.text for run in paragrafo.runs)
+        if '{{' in texto_completo:
+            logger.info(f"📍 Parágrafo {i}: '{texto_completo[:100]}...'")
+            logger.info(f"   Número de runs: {len(paragrafo.runs)}")
+            
+            for j, run in enumerate(paragrafo.runs):
+                if run.text:
+                    logger.info(f"   Run {j}: '{run.text}'")
+
+def salvar_documento(doc, destino, modelo=None):
+    """Salva em caminho ou buffer (buffer é reescrito do início)
+
+    Usa o escritor de zip do motor_zip: partes inalteradas do modelo são
+    copiadas já comprimidas em vez de recomprimidas a cada requisição.
+    """
+    conteudo = motor_zip.salvar_pacote(doc, modelo)
+    if hasattr(destino, "seek"):
+        destino.seek(0)
+        destino.truncate()
+        destino.write(conteudo)
+    else:
+        with open(destino, "wb") as f:
+            f.write(conteudo)
+
+def preencher_modelo(caminho_modelo, caminho_saida, dados):
+    """Preenche um modelo DOCX com os dados fornecidos - VERSÃO CORRIGIDA
+    
+    caminho_saida pode ser um caminho ou um buffer (io.BytesIO)
+    """
+    try:
+        logger.info(f"📖 Abrindo modelo: {caminho_modelo}")
+        modelo = obter_modelo(caminho_modelo)
+        doc = modelo.abrir()
+        
+        # Seções repetidas ({{PARCELA.CAMPO}}) são expandidas antes da substituição
+        dados = preparar_listas(dados)
+        expandir_documento(doc, dados)
+        
+        # Preparar dados - garantir que todos os valores sejam strings
+        dados_limpos = {}
+        for chave, valor in dados.items():
+            if isinstance(valor, list) or imagens.eh_chave_imagem(chave):
+                continue
+            if valor is None or valor == "":
+                dados_limpos[chave] = "Não informado"
+            else:
+                dados_limpos[chave] = str(valor).strip()
+        
+        logger.info(f"📋 Dados preparados para substituição:")
+        for chave, valor in dados_limpos.items():
+            logger.info(f"   {chave}: {valor}")
+        
+        # Debug: verificar estrutura do documento se necessário
+        debug_documento_runs(doc, limite_paragrafos=3)
+        
+        # Verificar placeholders antes da substituição
+        placeholders_iniciais = verificar_placeholders_no_documento(doc, dados_limpos)
+        
+        # Processar parágrafos principais
+        logger.info("📄 Processando parágrafos principais...")
+        substituir_placeholders_robusto(doc.paragraphs, dados_limpos)
+        
+        # Processar tabelas
+        logger.info("📊 Processando tabelas...")
+        for i, tabela in enumerate(doc.tables):
+            for celula in celulas_da_tabela(tabela):
+                substituir_placeholders_robusto(celula.paragraphs, dados_limpos)
+        
+        # Processar cabeçalhos e rodapés
+        logger.info("📑 Processando cabeçalhos e rodapés...")
+        for i, section in enumerate(doc.sections):
+            if section.header:
+                substituir_placeholders_robusto(section.header.paragraphs, dados_limpos)
+            if section.footer:
+                substituir_placeholders_robusto(section.footer.paragraphs, dados_limpos)
+        
+        # Imagens ({{IMG:NOME}}): assinatura/logo recebidos ou de IMAGENS_DIR
+        imagens.inserir_no_documento(doc, dados)
+        
+        # Salvar documento
+        logger.info(f"💾 Salvando documento em: {caminho_saida}")
+        salvar_documento(doc, caminho_saida, modelo)
+        
+        # Verificação final
+        doc_verificacao = Document(caminho_saida)
+        placeholders_restantes = verificar_placeholders_no_documento(doc_verificacao, dados_limpos)
+        
+        if placeholders_restantes:
+            logger.warning(f"⚠️ ATENÇÃO: Ainda existem placeholders não substituídos: {placeholders_restantes}")
+            
+            # Tentar substituição adicional mais agressiva
+            logger.info("🔧 Tentando substituição adicional...")
+            for paragrafo in doc_verificacao.paragraphs:
+                texto_original = paragrafo.text
+                if '{{' in texto_original:
+                    # Substituição direta no texto do parágrafo
+                    novo_texto = texto_original
+                    for chave, valor in dados_limpos.items():
+                        placeholder = f'{{{{{chave}}}}}'
+                        if placeholder in novo_texto:
+                            novo_texto = novo_texto.replace(placeholder, valor)
+                    
+                    if novo_texto != texto_original:
+                        # Limpar runs e recriar
+                        for run in paragrafo.runs:
+                            run.text = ""
+                        if paragrafo.runs:
+                            paragrafo.runs[0].text = novo_texto
+                        else:
+                            paragrafo.add_run(novo_texto)
+                        
+                        logger.info(f"🔧 Correção aplicada: '{texto_original[:50]}...' -> '{novo_texto[:50]}...'")
+            
+            # Processar tabelas na verificação final
+            for tabela in doc_verificacao.tables:
+                for celula in celulas_da_tabela(tabela):
+                    for paragrafo in celula.paragraphs:
+                        texto_original = paragrafo.text
+                        if '{{' in texto_original:
+                            novo_texto = texto_original
+                            for chave, valor in dados_limpos.items():
+                                placeholder = f'{{{{{chave}}}}}'
+                                if placeholder in novo_texto:
+                                    novo_texto = novo_texto.replace(placeholder, valor)
+                            
+                            if novo_texto != texto_original:
+                                for run in paragrafo.runs:
+                                    run.text = ""
+                                if paragrafo.runs:
+                                    paragrafo.runs[0].text = novo_texto
+                                else:
+                                    paragrafo.add_run(novo_texto)
+                                
+                                logger.info(f"🔧 Correção em tabela: '{texto_original[:30]}...' -> '{novo_texto[:30]}...'")
+            
+            # Salvar novamente após correções
+            salvar_documento(doc_verificacao, caminho_saida, modelo)
+            
+            # Verificação final final
+            doc_final = Document(caminho_saida)
+            placeholders_finais = verificar_placeholders_no_documento(doc_final, dados_limpos)
+            
+            if placeholders_finais:
+                logger.error(f"❌ AINDA RESTAM placeholders não substituídos: {placeholders_finais}")
+            else:
+                logger.info("✅ Correção bem-sucedida! Todos os placeholders foram substituídos.")
+        else:
+            logger.info("✅ Todos os placeholders foram substituídos com sucesso!")
+        
+        logger.info("✅ Processamento concluído!")
+        return True
+        
+    except Exception as e:
+        logger.error(f"❌ Erro ao preencher modelo: {str(e)}")
+        raise Exception(f"Erro ao preencher modelo: {str(e)}")
+
+def criar_documento_fallback(dados: dict, output_path: str) -> None:
+    """Cria um documento DOCX simples com os dados extraídos"""
+    doc = Document()
+    
+    # Cabeçalho
+    doc.add_heading('Dados do Cliente', 0)
+    doc.add_paragraph(f'Processado em: {dados.get("DATA_HORA", "N/A")}')
+    doc.add_paragraph('---')
+    
+    # Seção de informações pessoais
+    doc.add_heading('Informações Pessoais', level=1)
+    doc.add_paragraph(f'Nome: {dados.get("NOME", "Não informado")}')
+    doc.add_paragraph(f'Email: {dados.get("EMAIL", "Não informado")}')
+    doc.add_paragraph(f'CPF: {dados.get("CPF", "Não informado")}')
+    doc.add_paragraph(f'Telefone: {dados.get("TELEFONE", "Não informado")}')
+    
+    # Seção de endereço
+    doc.add_heading('Endereço', level=1)
+    doc.add_paragraph(f'Endereço: {dados.get("ENDERECO", "Não informado")}')
+    doc.add_paragraph(f'CEP: {dados.get("CEP", "Não informado")}')
+    
+    # Seção financeira
+    doc.add_heading('Informações Financeiras', level=1)
+    doc.add_paragraph(f'Valor: {dados.get("VALOR", "Não informado")}')
+    doc.add_paragraph(f'Quantidade de Parcelas: {dados.get("PARCELAS", "Não informado")}')
+    doc.add_paragraph(f'Forma de Pagamento: {dados.get("FORMA_PAGAMENTO", "Não informado")}')
+    
+    # Adicionar data/hora
+    doc.add_heading('Informações do Processamento', level=1)
+    doc.add_paragraph(f'Data: {dados.get("DATA", "N/A")}')
+    doc.add_paragraph(f'Hora: {dados.get("HORA", "N/A")}')
+    
+    salvar_documento(doc, output_path)
+
+def renderizar_com_python_docx(caminho_modelo: str, dados: dict) -> bytes:
+    """Motor padrão: preencher_modelo em um buffer em memória"""
+    buffer = io.BytesIO()
+    preencher_modelo(caminho_modelo, buffer, dados)
+    return buffer.getvalue()
+
+def renderizar_com_motor_zip(caminho_modelo: str, dados: dict) -> bytes:
+    return motor_zip.renderizar(obter_modelo(caminho_modelo), dados)
+
+def renderizar_fallback(dados: dict) -> bytes:
+    buffer = io.BytesIO()
+    criar_documento_fallback(dados, buffer)
+    return buffer.getvalue()
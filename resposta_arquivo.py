@@ -0,0 +1,187 @@
+"""
+Respostas binárias sem cópia: arquivo em disco (ETag, Range, sendfile) e
+buffer em memória enviado em fatias.
+
+O FileResponse do Starlette desta versão não trata Range nem usa o hash do
+conteúdo como ETag. RespostaArquivo:
+    - responde 304 para If-None-Match com o ETag atual;
+    - atende um intervalo "bytes=a-b" com 206 (If-Range respeitado) e 416 para
+      intervalos fora do arquivo;
+    - usa a extensão ASGI http.response.zerocopysend (sendfile) quando o
+      servidor a oferece e, senão, envia em blocos lidos em thread;
+    - com x_accel, devolve só os cabeçalhos e X-Accel-Redirect para o nginx
+      servir o arquivo com sendfile (ARMAZEM_X_ACCEL, ver nginx.conf);
+    - responde 404 se o arquivo sumiu entre a criação da resposta e o envio
+      (limpar_expirados do armazém ou da fila de jobs).
+
+O uvicorn não oferece zerocopysend: sem ARMAZEM_X_ACCEL o corpo sai sempre
+em blocos de TAMANHO_BLOCO lidos em thread e copiados para o socket. Para ter
+sendfile de fato, ponha o nginx na frente com ARMAZEM_X_ACCEL.
+
+RespostaMemoria envia um documento que está em memória em fatias memoryview
+(sem cópia) com Content-Length: o uvicorn aplica controle de fluxo entre as
+fatias, então uma conexão lenta não acumula o documento inteiro de novo no
+buffer de escrita.
+"""
+
+import os
+import re
+
+import anyio
+from fastapi.responses import Response
+
+import metricas
+
+TAMANHO_BLOCO = 256 * 1024
+PADRAO_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def _cabecalho(scope, nome):
+    nome = nome.encode("latin-1")
+    for chave, valor in scope.get("headers", []):
+        if chave == nome:
+            return valor.decode("latin-1")
+    return None
+
+
+def intervalo_pedido(valor, tamanho):
+    """(inicio, fim) inclusivo de um Range simples; None = arquivo inteiro; False = inválido"""
+    encontrado = PADRAO_RANGE.match(valor.strip()) if valor else None
+    if not encontrado:
+        return None
+    inicio, fim = encontrado.groups()
+    if not inicio and not fim:
+        return None
+    if not inicio:
+        # Sufixo: últimos N bytes
+        quantidade = int(fim)
+        if quantidade == 0:
+            return False
+        return max(0, tamanho - quantidade), tamanho - 1
+    inicio = int(inicio)
+    fim = min(int(fim), tamanho - 1) if fim else tamanho - 1
+    if inicio >= tamanho or inicio > fim:
+        return False
+    return inicio, fim
+
+
+class RespostaArquivo(Response):
+    """Arquivo em disco com ETag forte, Range e sendfile"""
+
+    def __init__(self, caminho, media_type, filename=None, etag=None, headers=None, x_accel=None):
+        super().__init__(content=None, media_type=media_type, headers=headers)
+        self.caminho = caminho
+        self.etag = etag
+        self.x_accel = x_accel
+        self.headers["accept-ranges"] = "bytes"
+        if etag:
+            self.headers["etag"] = etag
+        if filename:
+            self.headers["content-disposition"] = f"attachment; filename={filename}"
+        # content-length é definido por intervalo em __call__
+        if "content-length" in self.headers:
+            del self.headers["content-length"]
+
+    async def __call__(self, scope, receive, send):
+        # O arquivo aberto continua legível mesmo se for apagado durante o envio
+        try:
+            arquivo = await anyio.open_file(self.caminho, "rb")
+        except FileNotFoundError:
+            metricas.incrementar("arquivos_404")
+            corpo = b'{"detail":"Arquivo n\\u00e3o encontrado ou expirado"}'
+            await send({"type": "http.response.start", "status": 404, "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(corpo)).encode())
+            ]})
+            await send({"type": "http.response.body", "body": corpo})
+            return
+        async with arquivo:
+            await self._enviar(scope, send, arquivo, os.fstat(arquivo.wrapped.fileno()).st_size)
+
+    async def _enviar(self, scope, send, arquivo, tamanho):
+        cabecalhos = [(k, v) for k, v in self.raw_headers]
+        if_none_match = _cabecalho(scope, "if-none-match")
+        if self.etag and if_none_match and self.etag in [v.strip() for v in if_none_match.split(",")]:
+            metricas.incrementar("arquivos_304")
+            await send({"type": "http.response.start", "status": 304, "headers": cabecalhos})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        # Range só vale para GET/HEAD (RFC 9110); um POST recebe o arquivo inteiro
+        intervalo = None
+        if scope.get("method") in ("GET", "HEAD"):
+            intervalo = intervalo_pedido(_cabecalho(scope, "range"), tamanho)
+        if_range = _cabecalho(scope, "if-range")
+        if intervalo and if_range and if_range.strip() != self.etag:
+            intervalo = None
+
+        if intervalo is False:
+            cabecalhos.append((b"content-range", f"bytes */{tamanho}".encode()))
+            cabecalhos.append((b"content-length", b"0"))
+            await send({"type": "http.response.start", "status": 416, "headers": cabecalhos})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        if self.x_accel:
+            # O nginx trata Range/If-None-Match e envia o arquivo com sendfile
+            cabecalhos.append((b"x-accel-redirect", self.x_accel.encode("latin-1")))
+            await send({"type": "http.response.start", "status": 200, "headers": cabecalhos})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        if intervalo:
+            inicio, fim = intervalo
+            status = 206
+            cabecalhos.append((b"content-range", f"bytes {inicio}-{fim}/{tamanho}".encode()))
+            metricas.incrementar("arquivos_206")
+        else:
+            inicio, fim = 0, tamanho - 1
+            status = 200
+        quantidade = fim - inicio + 1
+        cabecalhos.append((b"content-length", str(quantidade).encode()))
+
+        await send({"type": "http.response.start", "status": status, "headers": cabecalhos})
+        if scope.get("method") == "HEAD":
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        if "http.response.zerocopysend" in scope.get("extensions", {}):
+            await send({
+                "type": "http.response.zerocopysend",
+                "file": arquivo.wrapped.fileno(),
+                "offset": inicio,
+                "count": quantidade
+            })
+            return
+
+        await arquivo.seek(inicio)
+        restante = quantidade
+        while restante > 0:
+            bloco = await arquivo.read(min(TAMANHO_BLOCO, restante))
+            if not bloco:
+                break
+            restante -= len(bloco)
+            await send({"type": "http.response.body", "body": bloco, "more_body": restante > 0})
+        if restante > 0 or quantidade == 0:
+            await send({"type": "http.response.body", "body": b""})
+
+
+class RespostaMemoria(Response):
+    """Bytes em memória enviados em fatias memoryview, com Content-Length"""
+
+    def __init__(self, conteudo, media_type, headers=None):
+        super().__init__(content=None, media_type=media_type, headers=headers)
+        self.conteudo = conteudo
+        self.headers["content-length"] = str(len(conteudo))
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope.get("method") == "HEAD" or not self.conteudo:
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        visao = memoryview(self.conteudo)
+        total = len(visao)
+        for inicio in range(0, total, TAMANHO_BLOCO):
+            fim = min(inicio + TAMANHO_BLOCO, total)
+            await send({"type": "http.response.body", "body": visao[inicio:fim], "more_body": fim < total})
@@ -0,0 +1,36 @@
+"""
+Serialização JSON rápida para as respostas grandes (base64 de documentos).
+
+As respostas montadas pela própria API já têm o formato certo, então são
+devolvidas como RespostaJSONRapida diretamente: o FastAPI não passa o conteúdo
+pelo jsonable_encoder nem revalida o response_model. A codificação usa orjson
+quando instalado (muito mais rápido para strings de centenas de KB) e cai para o
+json da biblioteca padrão caso contrário. O tempo gasto aparece na etapa
+"serializacao_json" das métricas.
+"""
+
+import json
+
+from fastapi.responses import Response
+
+import metricas
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depende do ambiente
+    orjson = None
+
+
+def serializar_json(conteudo) -> bytes:
+    """Codifica o conteúdo em JSON (UTF-8)"""
+    if orjson is not None:
+        return orjson.dumps(conteudo)
+    return json.dumps(conteudo, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class RespostaJSONRapida(Response):
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        with metricas.medir_etapa("serializacao_json"):
+            return serializar_json(content)
@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""
+Servidor de produção com pré-fork de workers.
+
+O processo mestre importa a aplicação, compila os modelos DOCX e as expressões
+regulares de extração e só então cria os workers com os.fork(). Tudo que foi
+carregado antes do fork fica compartilhado entre os workers por copy-on-write,
+em vez de ser reconstruído em cada um.
+
+Reciclagem: o trabalho com python-docx/lxml fragmenta o heap e o RSS dos
+workers cresce ao longo dos dias. Com WORKER_MAX_REQUISICOES ou
+WORKER_MAX_RSS_MB, o worker que passa do limite avisa o mestre por um pipe; o
+mestre cria o substituto (já com os modelos compilados, herdados do fork),
+espera ele avisar que está pronto e só então manda SIGTERM ao antigo, que para
+de aceitar conexões e drena as requisições em andamento. Uma reciclagem por
+vez: o próximo worker só é trocado depois que o anterior terminou de drenar.
+
+Configuração por variáveis de ambiente:
+    PORT                    porta HTTP (padrão: 8000)
+    HOST                    endereço de escuta (padrão: 0.0.0.0)
+    WORKERS                 número de workers (padrão: WEB_CONCURRENCY ou núcleos disponíveis)
+    WORKER_MAX_REQUISICOES  recicla o worker após N requisições, +até 10% aleatório (0 = desligado)
+    WORKER_MAX_RSS_MB       recicla o worker quando o RSS passa deste valor (0 = desligado)
+    WORKER_TEMPO_DRENAGEM   segundos para drenar as requisições no SIGTERM (padrão: 30)
+
+Uso:
+    python servidor.py
+"""
+
+import gc
+import logging
+import os
+import random
+import select
+import signal
+import socket
+import time
+
+import uvicorn
+
+import memoria
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("servidor")
+
+MB = 1024 * 1024
+# Tempo máximo para o substituto ficar pronto; depois disso o antigo é trocado mesmo assim
+PRAZO_SUBSTITUTO_S = 60
+
+
+def numero_de_workers():
+    """Lê o número de workers do ambiente ou usa os núcleos disponíveis"""
+    valor = os.environ.get("WORKERS") or os.environ.get("WEB_CONCURRENCY")
+    if valor:
+        return max(1, int(valor))
+    try:
+        return max(1, len(os.sched_getaffinity(0)))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+class LimitesReciclagem:
+    """Limites de requisições e de RSS que disparam a reciclagem de um worker"""
+
+    def __init__(self, max_requisicoes=0, max_rss=0, tempo_drenagem=30.0):
+        self.max_requisicoes = max_requisicoes
+        self.max_rss = max_rss
+        self.tempo_drenagem = tempo_drenagem
+
+    @classmethod
+    def do_ambiente(cls):
+        return cls(
+            max_requisicoes=int(os.environ.get("WORKER_MAX_REQUISICOES", 0)),
+            max_rss=int(float(os.environ.get("WORKER_MAX_RSS_MB", 0)) * MB),
+            tempo_drenagem=float(os.environ.get("WORKER_TEMPO_DRENAGEM", 30))
+        )
+
+    @property
+    def ativos(self):
+        return self.max_requisicoes > 0 or self.max_rss > 0
+
+
+class AppReciclavel:
+    """
+    Envolve a aplicação ASGI no worker: avisa o mestre quando o worker está
+    pronto (fim do startup) e quando passou de um limite de reciclagem
+    """
+
+    def __init__(self, app, canal, limites):
+        self.app = app
+        self.canal = canal
+        self.limites = limites
+        self.requisicoes = 0
+        self.reciclagem_pedida = False
+        # Jitter para os workers criados juntos não reciclarem juntos
+        self.max_requisicoes = limites.max_requisicoes
+        if self.max_requisicoes > 0:
+            self.max_requisicoes += random.randint(0, self.max_requisicoes // 10)
+
+    def _avisar(self, tipo):
+        try:
+            os.write(self.canal, f"{tipo} {os.getpid()}\n".encode("ascii"))
+        except OSError as e:
+            logger.warning(f"⚠️ Não foi possível avisar o mestre ({tipo}): {e}")
+
+    def _verificar_limites(self):
+        motivo = None
+        if self.max_requisicoes > 0 and self.requisicoes >= self.max_requisicoes:
+            motivo = f"{self.requisicoes} requisições"
+        elif self.limites.max_rss > 0:
+            rss = memoria.rss_atual()
+            if rss is not None and rss >= self.limites.max_rss:
+                motivo = f"RSS de {rss / MB:.0f} MB"
+        if motivo:
+            self.reciclagem_pedida = True
+            logger.info(f"♻️ Worker {os.getpid()} pediu reciclagem: {motivo}")
+            self._avisar("reciclar")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            async def enviar(mensagem):
+                await send(mensagem)
+                if mensagem["type"] == "lifespan.startup.complete":
+                    self._avisar("pronto")
+            await self.app(scope, receive, enviar)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            if scope["type"] == "http" and not self.reciclagem_pedida:
+                self.requisicoes += 1
+                self._verificar_limites()
+
+
+def criar_socket(host, port):
+    """Cria o socket de escuta compartilhado por todos os workers"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+class ServidorPreFork:
+    """Processo mestre: prepara a aplicação, cria e supervisiona os workers"""
+
+    def __init__(self, host="0.0.0.0", port=8000, workers=1, limites=None):
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.limites = limites or LimitesReciclagem()
+        self.sock = None
+        self.app = None
+        self.filhos = {}
+        self.encerrando = False
+        # Pipe de avisos dos workers ("pronto <pid>", "reciclar <pid>")
+        self.leitura = None
+        self.escrita = None
+        self.pendentes = []
+        # pid do substituto -> (pid do antigo, instante da criação)
+        self.substituicoes = {}
+        # pid -> prazo para drenar antes do SIGKILL
+        self.drenando = {}
+        self.reciclados = 0
+
+    def preparar(self):
+        """Importa a aplicação e compila os dados imutáveis antes do fork"""
+        inicio = time.perf_counter()
+
+        import main
+        import modelo_compilado
+
+        modelo_compilado.compilar_modelos()
+        self.app = main.app
+
+        # Aquecimento no mestre: os workers já nascem prontos para /ready
+        main.aquecer()
+        # O pool de render do mestre não serve aos workers (cada um cria o seu)
+        main.encerrar_pool_render()
+
+        # Move os objetos já criados para a geração permanente: o coletor de lixo
+        # dos workers não escreve neles e as páginas continuam compartilhadas
+        gc.collect()
+        gc.freeze()
+
+        logger.info(f"🧩 Aplicação preparada em {time.perf_counter() - inicio:.2f}s")
+
+    def _executar_worker(self):
+        """Corpo do processo filho: roda o uvicorn sobre o socket herdado"""
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        os.close(self.leitura)
+
+        # Recursos por processo (pool de render, conexões) antes de aceitar tráfego
+        import main
+        main.aquecer_worker()
+
+        app = AppReciclavel(self.app, self.escrita, self.limites)
+        config = uvicorn.Config(
+            app,
+            log_level="info",
+            timeout_graceful_shutdown=self.limites.tempo_drenagem
+        )
+        servidor = uvicorn.Server(config)
+        servidor.run(sockets=[self.sock])
+
+    def criar_worker(self):
+        pid = os.fork()
+        if pid == 0:
+            codigo = 0
+            try:
+                self._executar_worker()
+            except BaseException:
+                logger.exception("❌ Worker encerrado com erro")
+                codigo = 1
+            finally:
+                os._exit(codigo)
+
+        self.filhos[pid] = time.time()
+        logger.info(f"👷 Worker iniciado: pid {pid}")
+        return pid
+
+    def _drenar(self, pid):
+        """SIGTERM: o uvicorn para de aceitar conexões e termina as requisições em andamento"""
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            return
+        self.drenando[pid] = time.monotonic() + self.limites.tempo_drenagem + 5
+
+    def _encerrar(self, signum, frame):
+        if self.encerrando:
+            return
+        self.encerrando = True
+        logger.info("🛑 Encerrando workers...")
+        for pid in list(self.filhos):
+            self._drenar(pid)
+
+    def _iniciar_reciclagem(self):
+        """Cria o substituto do próximo worker pendente (uma reciclagem por vez)"""
+        if self.encerrando or self.substituicoes or self.drenando:
+            return
+        while self.pendentes:
+            antigo = self.pendentes.pop(0)
+            if antigo in self.filhos:
+                novo = self.criar_worker()
+                self.substituicoes[novo] = (antigo, time.monotonic())
+                logger.info(f"♻️ Reciclando worker {antigo}: substituto {novo} em aquecimento")
+                return
+
+    def _substituto_pronto(self, novo):
+        antigo, _ = self.substituicoes.pop(novo)
+        if antigo is None:
+            return
+        logger.info(f"♻️ Substituto {novo} pronto, drenando worker {antigo}")
+        self.reciclados += 1
+        self._drenar(antigo)
+
+    def _ler_avisos(self):
+        for linha in os.read(self.leitura, 4096).decode("ascii").splitlines():
+            try:
+                tipo, pid = linha.split()
+                pid = int(pid)
+            except ValueError:
+                continue
+            if tipo == "reciclar" and pid in self.filhos and pid not in self.pendentes:
+                self.pendentes.append(pid)
+            elif tipo == "pronto" and pid in self.substituicoes:
+                self._substituto_pronto(pid)
+
+    def _verificar_prazos(self):
+        agora = time.monotonic()
+        for novo, (antigo, criado) in list(self.substituicoes.items()):
+            if agora - criado > PRAZO_SUBSTITUTO_S:
+                logger.warning(f"⚠️ Substituto {novo} não ficou pronto em {PRAZO_SUBSTITUTO_S}s")
+                self._substituto_pronto(novo)
+        for pid, prazo in list(self.drenando.items()):
+            if agora > prazo:
+                logger.warning(f"⚠️ Worker {pid} não terminou de drenar no prazo, encerrando à força")
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+                self.drenando[pid] = float("inf")
+
+    def _worker_terminou(self, pid, status):
+        self.filhos.pop(pid, None)
+        drenado = self.drenando.pop(pid, None) is not None
+        if self.encerrando:
+            return
+
+        if pid in self.substituicoes:
+            # Substituto morreu antes de ficar pronto: o antigo continua e tenta de novo
+            antigo, _ = self.substituicoes.pop(pid)
+            logger.warning(f"⚠️ Substituto {pid} terminou antes de ficar pronto (status {status})")
+            self.pendentes.insert(0, antigo)
+        elif drenado:
+            logger.info(f"♻️ Worker {pid} reciclado")
+        elif any(antigo == pid for antigo, _ in self.substituicoes.values()):
+            # O substituto já está a caminho
+            logger.warning(f"⚠️ Worker {pid} terminou (status {status}) durante a reciclagem")
+            for novo, (antigo, criado) in list(self.substituicoes.items()):
+                if antigo == pid:
+                    self.substituicoes[novo] = (None, criado)
+        else:
+            logger.warning(f"⚠️ Worker {pid} terminou (status {status}), recriando...")
+            self.criar_worker()
+
+    def _colher_workers(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            self._worker_terminou(pid, status)
+
+    def executar(self):
+        self.preparar()
+        self.sock = criar_socket(self.host, self.port)
+        self.leitura, self.escrita = os.pipe()
+
+        logger.info(f"🚀 Servidor pré-fork em http://{self.host}:{self.port} com {self.workers} worker(s)")
+        if self.limites.ativos:
+            logger.info(
+                f"♻️ Reciclagem de workers: {self.limites.max_requisicoes or '-'} requisições, "
+                f"{self.limites.max_rss // MB or '-'} MB de RSS"
+            )
+        for _ in range(self.workers):
+            self.criar_worker()
+
+        signal.signal(signal.SIGTERM, self._encerrar)
+        signal.signal(signal.SIGINT, self._encerrar)
+
+        while self.filhos:
+            self._colher_workers()
+            prontos, _, _ = select.select([self.leitura], [], [], 1.0)
+            if prontos:
+                self._ler_avisos()
+            self._verificar_prazos()
+            self._iniciar_reciclagem()
+
+        self.sock.close()
+        logger.info(f"✅ Servidor encerrado ({self.reciclados} worker(s) reciclado(s))")
+
+
+def executar(host=None, port=None, workers=None):
+    servidor = ServidorPreFork(
+        host=host or os.environ.get("HOST", "0.0.0.0"),
+        port=port or int(os.environ.get("PORT", 8000)),
+        workers=workers or numero_de_workers(),
+        limites=LimitesReciclagem.do_ambiente()
+    )
+    servidor.executar()
+
+
+if __name__ == "__main__":
+    executar()
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Teste de estresse e de corretude dos motores de render concorrentes.
+
+O modelo compilado (ModeloCompilado) é compartilhado entre threads e entre as
+requisições de um processo do pool. Qualquer estado mutável que vaze de um
+render para outro colocaria os dados de um cliente no contrato de outro. Este
+script renderiza milhares de entradas distintas em cada motor e compara cada
+documento com o render de referência da mesma entrada, feito antes numa thread
+só e pelo mesmo motor:
+
+    docx       python-docx direto nas threads da requisição
+    zip        motor_zip direto nas threads da requisição
+    pool       pool de processos, um item por envio (motor de --motor-pool)
+    microlote  pool de processos com micro-batching (vários itens por envio)
+
+Cada entrada leva um identificador único (PAC-000123) em vários campos. Além
+da igualdade byte a byte com a referência, o texto de cada documento (inclusive
+o de referência) precisa conter o identificador da própria entrada e nenhum
+outro. O motor docx é bem mais lento: reduza --entradas ao incluí-lo. Para cada
+nível de concorrência o script informa a vazão e a latência, e termina com
+código 1 se houver qualquer divergência, vazamento ou erro.
+
+Uso:
+    python stress.py
+    python stress.py --entradas 5000 --concorrencias 1,8,32,128 --cenarios zip,pool
+    python stress.py --cenarios pool,microlote --motor-pool docx --workers 4
+"""
+
+import argparse
+import io
+import logging
+import os
+import random
+import re
+import sys
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import modelo_compilado
+from benchmark import motor_direto, percentil
+from microlote import MicroLote
+from pool_render import PoolRender
+
+PADRAO_IDENTIFICADOR = re.compile(r"PAC-(\d{6})", re.IGNORECASE)
+PADRAO_TAG = re.compile(r"<[^>]+>")
+
+# Valores com acentos e caracteres reservados do XML exercitam o escape
+LOGRADOUROS = ["Rua da Conceição", "Av. A & B", "Travessa <Beco>", "Rua \"Aspas\" 'Simples'", "Alameda Ñandú"]
+FORMAS_PAGAMENTO = ["PIX", "Boleto", "Cartão de crédito", "Transferência"]
+
+# Exemplos de problema mostrados por cenário
+EXEMPLOS = 5
+
+
+def gerar_dados(i):
+    """Entrada distinta e determinística de índice i"""
+    sorteio = random.Random(i)
+    identificador = f"PAC-{i:06d}"
+    dados = {
+        "NOME": f"Paciente {identificador} {sorteio.choice(['Silva', 'Souza', 'Conceição', 'Müller'])}",
+        "EMAIL": f"{identificador.lower()}@exemplo.com",
+        "CPF": f"{i % 1000:03d}.{sorteio.randrange(1000):03d}.{sorteio.randrange(1000):03d}-{i % 100:02d}",
+        "ENDERECO": f"{LOGRADOUROS[i % len(LOGRADOUROS)]}, {i} ({identificador})",
+        "CEP": f"{sorteio.randrange(100000):05d}-{sorteio.randrange(1000):03d}",
+        "TELEFONE": f"({sorteio.randrange(11, 99)}) 9{sorteio.randrange(10000):04d}-{i % 10000:04d}",
+        "VALOR": f"R$ {sorteio.randrange(100, 100000):,},{i % 100:02d}".replace(",", "."),
+        "PARCELAS": str(i % 24 + 1),
+        "FORMA_PAGAMENTO": FORMAS_PAGAMENTO[i % len(FORMAS_PAGAMENTO)],
+        "DATA": f"{i % 28 + 1:02d}/{i % 12 + 1:02d}/2026",
+        "HORA": f"{i % 24:02d}:{i % 60:02d}:00"
+    }
+    # Parte das entradas chega sem campos opcionais (placeholders sem valor)
+    if i % 7 == 0:
+        del dados["TELEFONE"]
+    if i % 11 == 0:
+        dados["EMAIL"] = ""
+    return dados
+
+
+def identificadores(conteudo):
+    """Números de entrada (PAC-nnnnnn) presentes no texto das partes XML do documento"""
+    encontrados = set()
+    with zipfile.ZipFile(io.BytesIO(conteudo)) as pacote:
+        for nome in pacote.namelist():
+            if nome.endswith(".xml"):
+                texto = PADRAO_TAG.sub("", pacote.read(nome).decode("utf-8", "replace"))
+                encontrados.update(int(numero) for numero in PADRAO_IDENTIFICADOR.findall(texto))
+    return encontrados
+
+
+def verificar(i, conteudo, referencia=None):
+    """Descrição do problema do documento da entrada i, ou None"""
+    if referencia is not None and conteudo != referencia:
+        problema = f"entrada {i}: difere da referência ({len(conteudo)} x {len(referencia)} bytes)"
+    else:
+        problema = None
+    try:
+        encontrados = identificadores(conteudo)
+    except zipfile.BadZipFile:
+        return f"entrada {i}: documento não é um zip válido"
+    if i not in encontrados:
+        return f"entrada {i}: não contém os próprios dados"
+    estranhos = encontrados - {i}
+    if estranhos:
+        return f"entrada {i}: contém dados de {sorted(estranhos)[:5]}"
+    return problema
+
+
+def renderizar_referencia(renderizar, caminho_modelo, entradas):
+    """Renders numa thread só, na ordem; devolve (documentos, docs/s, problemas)"""
+    documentos = []
+    problemas = []
+    inicio = time.perf_counter()
+    for i, dados in enumerate(entradas):
+        conteudo = renderizar(caminho_modelo, dados)
+        documentos.append(conteudo)
+        problema = verificar(i, conteudo)
+        if problema:
+            problemas.append(problema)
+    return documentos, len(entradas) / (time.perf_counter() - inicio), problemas
+
+
+def estressar(renderizar, caminho_modelo, entradas, referencias, concorrencia):
+    """Renders concorrentes em ordem embaralhada; devolve (docs/s, p50 ms, p95 ms, problemas)"""
+    ordem = list(range(len(entradas)))
+    random.Random(concorrencia).shuffle(ordem)
+    latencias = []
+
+    def uma(i):
+        inicio = time.perf_counter()
+        try:
+            conteudo = renderizar(caminho_modelo, entradas[i])
+        except Exception as e:
+            return f"entrada {i}: erro no render: {e}"
+        finally:
+            latencias.append(time.perf_counter() - inicio)
+        return verificar(i, conteudo, referencias[i])
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(concorrencia) as executor:
+        problemas = [problema for problema in executor.map(uma, ordem) if problema]
+    duracao = time.perf_counter() - inicio
+
+    return len(entradas) / duracao, percentil(latencias, 50) * 1000, percentil(latencias, 95) * 1000, problemas
+
+
+def executar(args):
+    caminho_modelo = args.modelo or modelo_compilado.encontrar_modelo()
+    if not caminho_modelo:
+        raise SystemExit("❌ Nenhum modelo encontrado (template.docx / modelo.docx)")
+    modelo_compilado.obter_modelo(caminho_modelo)
+
+    entradas = [gerar_dados(i) for i in range(args.entradas)]
+    concorrencias = [int(c) for c in args.concorrencias.split(",")]
+    cenarios = args.cenarios.split(",")
+
+    print(f"🧪 {args.entradas} entrada(s) distinta(s), concorrências {concorrencias}, "
+          f"{args.workers} processo(s) no pool, modelo {caminho_modelo}")
+    print(f"{'cenário':<24} {'conc.':>6} {'docs/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'problemas':>10}")
+
+    total_problemas = 0
+
+    def relatar(nome, concorrencia, vazao, p50, p95, problemas):
+        nonlocal total_problemas
+        total_problemas += len(problemas)
+        p50_texto = f"{p50:>8.1f}" if p50 is not None else f"{'-':>8}"
+        p95_texto = f"{p95:>8.1f}" if p95 is not None else f"{'-':>8}"
+        print(f"{nome:<24} {concorrencia:>6} {vazao:>8.1f} {p50_texto} {p95_texto} {len(problemas):>10}")
+        for problema in problemas[:EXEMPLOS]:
+            print(f"    ❌ {problema}")
+
+    referencias = {}
+
+    def referencia(motor):
+        """Render de referência por motor, feito uma vez e reaproveitado pelos cenários"""
+        if motor not in referencias:
+            documentos, vazao, problemas = renderizar_referencia(motor_direto(motor), caminho_modelo, entradas)
+            relatar(f"referência {motor}", 1, vazao, None, None, problemas)
+            referencias[motor] = documentos
+        return referencias[motor]
+
+    def rodar(nome, motor, renderizar):
+        documentos = referencia(motor)
+        for concorrencia in concorrencias:
+            relatar(nome, concorrencia, *estressar(renderizar, caminho_modelo, entradas, documentos, concorrencia))
+
+    for motor in ("docx", "zip"):
+        if motor in cenarios:
+            rodar(motor, motor, motor_direto(motor))
+
+    if "pool" in cenarios:
+        pool = PoolRender(args.workers, args.motor_pool)
+        try:
+            rodar(f"pool {args.motor_pool}", args.motor_pool, pool.renderizar)
+        finally:
+            pool.encerrar()
+
+    if "microlote" in cenarios:
+        pool = PoolRender(args.workers, args.motor_pool)
+        pool.microlote = MicroLote(pool.enviar_lote, janela_ms=args.janela_ms, tamanho_maximo=args.lote_max)
+        try:
+            rodar(f"microlote {args.motor_pool}", args.motor_pool, pool.renderizar)
+        finally:
+            pool.encerrar()
+
+    if total_problemas:
+        print(f"❌ {total_problemas} problema(s) encontrado(s)")
+        return 1
+    print("✅ Todos os documentos iguais à referência, sem vazamento entre entradas")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Estresse e corretude dos motores de render concorrentes")
+    parser.add_argument("--entradas", type=int, default=2000, help="entradas distintas renderizadas por nível")
+    parser.add_argument("--concorrencias", default="1,8,32", help="níveis de concorrência, separados por vírgula")
+    parser.add_argument("--cenarios", default="docx,zip,pool,microlote")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="processos do pool")
+    parser.add_argument("--motor-pool", choices=("zip", "docx"), default="zip")
+    parser.add_argument("--janela-ms", type=float, default=5)
+    parser.add_argument("--lote-max", type=int, default=16)
+    parser.add_argument("--modelo", default=None)
+    args = parser.parse_args(argv)
+
+    # Os avisos de placeholder sem dado são esperados (entradas sem TELEFONE);
+    # falhas de render aparecem como problemas do cenário
+    logging.basicConfig(level=logging.WARNING)
+    logging.disable(logging.ERROR)
+    return executar(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Testes do controle de admissão (admissao.py): 429 com Retry-After quando os
+renders em andamento e a fila de espera estão cheios
+"""
+
+import asyncio
+import json
+
+from admissao import ControleAdmissao, MiddlewareAdmissao
+
+
+async def chamar(app, caminho, metodo="POST"):
+    """Executa uma requisição ASGI; devolve (status, cabeçalhos, corpo)"""
+    mensagens = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(mensagem):
+        mensagens.append(mensagem)
+
+    scope = {"type": "http", "method": metodo, "path": caminho, "headers": []}
+    await app(scope, receive, send)
+    inicio = mensagens[0]
+    corpo = b"".join(m.get("body", b"") for m in mensagens[1:])
+    return inicio["status"], dict(inicio["headers"]), corpo
+
+
+def test_recusa_com_retry_after():
+    """Com 1 render e 1 na fila ocupados, o terceiro POST recebe 429; GET e /health passam"""
+    async def cenario():
+        liberar = asyncio.Event()
+
+        async def app_lento(scope, receive, send):
+            if scope["path"] != "/health" and scope["method"] == "POST":
+                await liberar.wait()
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            await send({"type": "http.response.body", "body": b"ok"})
+
+        controle = ControleAdmissao(max_em_andamento=1, max_fila=1)
+        app = MiddlewareAdmissao(app_lento, controle)
+
+        primeiro = asyncio.create_task(chamar(app, "/gerar-documento"))
+        segundo = asyncio.create_task(chamar(app, "/gerar-documento/base64"))
+        await asyncio.sleep(0.05)
+        assert (controle.em_andamento, controle.aguardando) == (1, 1)
+
+        recusado = await chamar(app, "/jobs")
+        fora_do_controle = await chamar(app, "/health", metodo="POST")
+        leitura = await chamar(app, "/gerar-documento", metodo="GET")
+
+        liberar.set()
+        return recusado, fora_do_controle, leitura, await primeiro, await segundo, controle
+
+    recusado, fora_do_controle, leitura, primeiro, segundo, controle = asyncio.run(cenario())
+
+    status, cabecalhos, corpo = recusado
+    assert status == 429
+    assert int(cabecalhos[b"retry-after"]) >= 1
+    assert json.loads(corpo)["retry_after"] == int(cabecalhos[b"retry-after"])
+
+    assert fora_do_controle[0] == 200
+    assert leitura[0] == 200
+    assert primeiro[0] == segundo[0] == 200
+    assert (controle.admitidas, controle.recusadas, controle.em_andamento) == (2, 1, 0)
+
+
+def test_retry_after_segue_a_vazao():
+    """Retry-After ~ pendentes / vazão observada, entre 1 e 120 segundos"""
+    controle = ControleAdmissao(max_em_andamento=1, max_fila=1)
+    assert controle.calcular_retry_after() == 1
+
+    for _ in range(10):
+        controle.estimador.registrar()
+    # 10 conclusões no último segundo: 30 pendentes levam ~3s
+    controle.aguardando = 29
+    assert controle.calcular_retry_after() == 3
+    controle.aguardando = 100000
+    assert controle.calcular_retry_after() == 120
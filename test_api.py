@@ -5,7 +5,10 @@ Script para testar a API de processamento de mensagens
 
 import requests
 import json
+import threading
+import time
 from datetime import datetime
+from http.server import BaseHTTPRequestHandler, HTTPServer
 
 # Configuração
 API_BASE_URL = "http://localhost:8000"
@@ -189,6 +192,205 @@ Forma de pagamento: Boleto"""
         print(f"❌ Erro no teste de documento: {e}")
         return False
 
+class ReceptorCallback(BaseHTTPRequestHandler):
+    """Receptor local que faz o papel do N8N no modo callback"""
+    
+    recebidos = []
+    falhas_restantes = 0
+    
+    def do_POST(self):
+        corpo = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        # Simula indisponibilidade temporária para exercitar as retentativas
+        if ReceptorCallback.falhas_restantes > 0:
+            ReceptorCallback.falhas_restantes -= 1
+            self.send_response(503)
+            self.end_headers()
+            return
+        ReceptorCallback.recebidos.append({"headers": dict(self.headers), "corpo": corpo})
+        self.send_response(200)
+        self.end_headers()
+    
+    def log_message(self, *args):
+        pass
+
+def test_webhook_callback():
+    """Testa o modo callback do webhook com um receptor local"""
+    print("\n📤 Testando webhook com callback...")
+    
+    servidor = HTTPServer(("127.0.0.1", 0), ReceptorCallback)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    ReceptorCallback.recebidos = []
+    ReceptorCallback.falhas_restantes = 1
+    callback_url = f"http://127.0.0.1:{servidor.server_address[1]}/callback"
+    
+    try:
+        response = requests.post(
+            f"{API_BASE_URL}/webhook/processar",
+            json={
+                "mensagem": "Nome: Ana Callback\nEmail: ana@callback.com\nCPF: 999.888.777-66",
+                "callback_url": callback_url,
+                "formato": "zapi"
+            }
+        )
+        if response.status_code != 202:
+            print(f"❌ Esperado 202, recebido {response.status_code}: {response.text}")
+            return False
+        entrega_id = response.json().get("entrega_id")
+        print(f"✅ Aceito (202), entrega {entrega_id}")
+        
+        # Aguarda a entrega (inclui uma retentativa após o 503 simulado)
+        limite = time.time() + 30
+        while not ReceptorCallback.recebidos and time.time() < limite:
+            time.sleep(0.2)
+        
+        if not ReceptorCallback.recebidos:
+            print("❌ Callback não recebido")
+            return False
+        
+        recebido = ReceptorCallback.recebidos[0]
+        data = json.loads(recebido["corpo"])
+        print(f"   Entrega: {recebido['headers'].get('X-Entrega-Id')}")
+        print(f"   Arquivo: {data.get('filename')} ({data.get('size')} bytes)")
+        return data.get("success") is True and recebido["headers"].get("X-Entrega-Id") == entrega_id
+        
+    except Exception as e:
+        print(f"❌ Erro no teste de callback: {e}")
+        return False
+    finally:
+        servidor.shutdown()
+
+# Porta do servidor Z-API falso: rode a API com
+# ZAPI_URL=http://127.0.0.1:8765/instances/teste/token/teste ENTREGA_TAXA_DESTINO=5
+ZAPI_FALSA_PORTA = 8765
+
+class ZApiFalsa(BaseHTTPRequestHandler):
+    """Servidor local compatível com o send-document da Z-API"""
+    
+    recebidos = []
+    falhas_restantes = 0
+    
+    def do_POST(self):
+        corpo = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        if ZApiFalsa.falhas_restantes > 0:
+            ZApiFalsa.falhas_restantes -= 1
+            self.send_response(429)
+            self.send_header("Retry-After", "1")
+            self.end_headers()
+            return
+        ZApiFalsa.recebidos.append({"path": self.path, "instante": time.time(), "corpo": corpo})
+        resposta = json.dumps({"zaapId": "teste", "messageId": f"msg{len(ZApiFalsa.recebidos)}"}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(resposta)))
+        self.end_headers()
+        self.wfile.write(resposta)
+    
+    def log_message(self, *args):
+        pass
+
+def test_zapi_envio_direto():
+    """Testa o envio direto à Z-API contra um servidor falso local"""
+    print("\n📲 Testando envio direto Z-API...")
+    
+    servidor = HTTPServer(("127.0.0.1", ZAPI_FALSA_PORTA), ZApiFalsa)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    ZApiFalsa.recebidos = []
+    ZApiFalsa.falhas_restantes = 1
+    
+    try:
+        response = requests.post(
+            f"{API_BASE_URL}/gerar-documento-zapi",
+            json={
+                "mensagem": "Nome: Bruno Zapi\nEmail: bruno@zapi.com\nTelefone: (11) 98888-7777",
+                "enviar_para": "(11) 98888-7777"
+            }
+        )
+        data = response.json()
+        if response.status_code == 400 and "ZAPI_URL" in data.get("error", ""):
+            print(f"⚠️ Envio direto não configurado: rode a API com ZAPI_URL=http://127.0.0.1:{ZAPI_FALSA_PORTA}/instances/teste/token/teste")
+            return False
+        if response.status_code != 200 or not data.get("enviado"):
+            print(f"❌ Erro no envio direto: {response.status_code} {response.text[:200]}")
+            return False
+        
+        recebido = ZApiFalsa.recebidos[0]
+        print(f"✅ Enviado para {data.get('phone')}: {data.get('zapi')}")
+        print(f"   Caminho: {recebido['path']}")
+        print(f"   Base64 fora da resposta: {'base64' not in data}")
+        return (
+            recebido["path"].endswith("/send-document/docx")
+            and recebido["corpo"]["phone"] == "5511988887777"
+            and recebido["corpo"]["document"].startswith("data:")
+            and "base64" not in data
+        )
+        
+    except Exception as e:
+        print(f"❌ Erro no teste Z-API: {e}")
+        return False
+    finally:
+        servidor.shutdown()
+        servidor.server_close()
+
+def test_tabela_parcelas():
+    """Testa a linha repetida de parcelas e o cronograma derivado de VALOR/PARCELAS (sem a API)
+    
+    Roda também no pytest: as verificações são assert e a falha propaga.
+    """
+    print("\n🧾 Testando tabela de parcelas...")
+    
+    import os
+    import tempfile
+    from decimal import Decimal
+    from docx import Document
+    from io import BytesIO
+    from render_docx import renderizar_com_motor_zip, renderizar_com_python_docx
+    from repeticao import gerar_parcelas, valor_para_decimal
+    
+    # Arredondamento: 360 parcelas de R$ 1.000,00 diferem no máximo 1 centavo e somam o total
+    parcelas = gerar_parcelas(Decimal("1000.00"), 360, datetime(2026, 1, 31).date())
+    valores = [valor_para_decimal(parcela["VALOR"]) for parcela in parcelas]
+    assert len(parcelas) == 360, f"{len(parcelas)} parcelas"
+    assert max(valores) - min(valores) <= Decimal("0.01"), f"parcelas de {min(valores)} a {max(valores)}"
+    assert sum(valores) == Decimal("1000.00"), f"soma {sum(valores)}"
+    assert parcelas[-1]["SALDO"] == "R$ 0,00", parcelas[-1]["SALDO"]
+    
+    # Modelo pequeno com cabeçalho e uma linha repetida
+    modelo = Document()
+    modelo.add_paragraph("Contrato de {{NOME}}")
+    tabela = modelo.add_table(rows=2, cols=3)
+    for celula, texto in zip(tabela.rows[0].cells, ["Parcela", "Vencimento", "Valor"]):
+        celula.text = texto
+    for celula, texto in zip(tabela.rows[1].cells, ["{{PARCELA.NUMERO}}/{{PARCELA.TOTAL}}", "{{PARCELA.VENCIMENTO}}", "{{PARCELA.VALOR}}"]):
+        celula.text = texto
+    
+    dados = {"NOME": "Carlos Parcelas", "VALOR": "R$ 1.000,00", "PARCELAS": "12", "DATA": "31/01/2026"}
+    esperados = ["28/02/2026", "31/03/2026", "30/04/2026", "31/05/2026", "30/06/2026", "31/07/2026",
+                 "31/08/2026", "30/09/2026", "31/10/2026", "30/11/2026", "31/12/2026", "31/01/2027"]
+    
+    with tempfile.TemporaryDirectory() as pasta:
+        caminho = os.path.join(pasta, "modelo_parcelas.docx")
+        modelo.save(caminho)
+        for motor, renderizar in (("docx", renderizar_com_python_docx), ("zip", renderizar_com_motor_zip)):
+            linhas = Document(BytesIO(renderizar(caminho, dados))).tables[0].rows
+            celulas = [[celula.text for celula in linha.cells] for linha in linhas[1:]]
+            assert len(linhas) == 13, f"{motor}: {len(linhas)} linhas"
+            assert [linha[0] for linha in celulas] == [f"{n}/12" for n in range(1, 13)], f"{motor}: numeração"
+            assert [linha[1] for linha in celulas] == esperados, f"{motor}: vencimentos {[linha[1] for linha in celulas]}"
+            soma = sum(valor_para_decimal(linha[2]) for linha in celulas)
+            assert soma == Decimal("1000.00"), f"{motor}: soma {soma}"
+            print(f"   Motor {motor}: {len(celulas)} parcelas, soma R$ {soma}")
+    
+    print("✅ Tabela de parcelas OK")
+
+def executar_tabela_parcelas():
+    """test_tabela_parcelas no formato do resumo do script (True/False)"""
+    try:
+        test_tabela_parcelas()
+        return True
+    except Exception as e:
+        print(f"❌ Erro no teste da tabela de parcelas: {e!r}")
+        return False
+
 def main():
     """Executa todos os testes"""
     print("🧪 INICIANDO TESTES DA API")
@@ -201,7 +403,10 @@ def main():
     resultados.append(("Processar Mensagem", test_processar_mensagem()))
     resultados.append(("Processar JSON", test_processar_json()))
     resultados.append(("Webhook", test_webhook()))
+    resultados.append(("Webhook Callback", test_webhook_callback()))
+    resultados.append(("Z-API Envio Direto", test_zapi_envio_direto()))
     resultados.append(("Gerar Documento", test_gerar_documento()))
+    resultados.append(("Tabela de Parcelas", executar_tabela_parcelas()))
     
     # Resumo
     print("\n" + "=" * 50)
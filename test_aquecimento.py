@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Testes do aquecimento e da separação entre /health (liveness) e /ready (readiness)
+"""
+
+from fastapi.testclient import TestClient
+
+import main
+
+
+def test_ready_so_depois_do_aquecimento(monkeypatch):
+    """Durante o aquecimento /health responde 200 e /ready 503; depois os dois 200"""
+    # Aquecido antes: o startup não dispara outro aquecimento em segundo plano
+    main.aquecer()
+    with TestClient(main.app) as cliente:
+        monkeypatch.setitem(main.estado_aquecimento, "pronto", False)
+        monkeypatch.setitem(main.estado_aquecimento, "em_andamento", True)
+        assert cliente.get("/health").status_code == 200
+        resposta = cliente.get("/ready")
+        assert resposta.status_code == 503
+        assert resposta.json()["status"] == "warming_up"
+
+        monkeypatch.setitem(main.estado_aquecimento, "pronto", True)
+        monkeypatch.setitem(main.estado_aquecimento, "em_andamento", False)
+        resposta = cliente.get("/ready")
+        assert resposta.status_code == 200
+        assert resposta.json()["status"] == "ready"
+
+
+def test_aquecimento_renderiza_todos_os_formatos(monkeypatch):
+    """aquecer() compila os modelos, gera um documento por formato e marca o processo como pronto"""
+    for campo, valor in (("pronto", False), ("em_andamento", False), ("erro", None), ("duracao_s", None)):
+        monkeypatch.setitem(main.estado_aquecimento, campo, valor)
+
+    estado = main.aquecer()
+    assert estado["pronto"] is True
+    assert estado["erro"] is None
+    assert estado["duracao_s"] is not None
+
+    # Uma segunda chamada não repete o trabalho
+    concluido_em = estado["concluido_em"]
+    assert main.aquecer()["concluido_em"] == concluido_em
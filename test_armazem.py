@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Testes do armazém de documentos (armazem.py) e do download_url assinado
+"""
+
+import os
+import time
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import main
+from armazem import ArmazemDocumentos
+from resposta_arquivo import RespostaArquivo
+
+MENSAGEM = """Nome: Bruno Lima
+Email: bruno@exemplo.com
+CPF: 111.222.333-44
+Valor: 950,00
+Quantidade de Parcelas: 2
+Forma de pagamento: PIX"""
+
+
+@pytest.fixture
+def armazem(tmp_path, monkeypatch):
+    """Armazém ativo no app e no pipeline durante o teste"""
+    armazem = ArmazemDocumentos(str(tmp_path), ttl=3600, ttl_url=900, segredo="segredo de teste")
+    monkeypatch.setattr(main, "armazem", armazem)
+    monkeypatch.setattr(main.pipeline, "armazem", armazem)
+    return armazem
+
+
+def test_download_url_no_lugar_do_base64(armazem):
+    """A resposta JSON leva download_url sem base64; o link baixa o mesmo documento do binário"""
+    corpo = {"mensagem": MENSAGEM, "data_referencia": "2026-10-19T10:00:00"}
+    with TestClient(main.app) as cliente:
+        resposta = cliente.post("/gerar-documento-base64", json=corpo, headers={"Accept-Encoding": "identity"})
+        assert resposta.status_code == 200
+        dados = resposta.json()
+        assert dados["base64_content"] is None
+        url = dados["download_url"]
+
+        download = cliente.get(url)
+        assert download.status_code == 200
+        assert download.headers["etag"] == f'"{urlsplit(url).path.rsplit("/", 1)[1]}"'
+        assert download.content == cliente.post("/gerar-documento", json=corpo).content
+        assert download.content[:2] == b"PK"
+
+
+def test_link_adulterado_ou_expirado_responde_403(armazem):
+    """Assinatura, nome ou expiração alterados invalidam o link"""
+    url = armazem.publicar(b"PK" + bytes(2000), "contrato.docx")
+    caminho = urlsplit(url).path
+    parametros = {chave: valores[0] for chave, valores in parse_qs(urlsplit(url).query).items()}
+    hash_documento = caminho.rsplit("/", 1)[1]
+
+    expirado = int(time.time()) - 1
+    adulterados = [
+        dict(parametros, assinatura="0" * 32),
+        dict(parametros, nome="outro.docx"),
+        dict(parametros, expira=str(int(parametros["expira"]) + 3600)),
+        dict(parametros, expira=str(expirado),
+             assinatura=armazem._assinatura(hash_documento, expirado, parametros["nome"]))
+    ]
+    with TestClient(main.app) as cliente:
+        assert cliente.get(caminho, params=parametros).status_code == 200
+        for adulterado in adulterados:
+            assert cliente.get(caminho, params=adulterado).status_code == 403
+
+        # Link válido, mas o arquivo já saiu do armazém pelo TTL
+        armazem.ttl = 0
+        os.utime(armazem.caminho(hash_documento), (time.time() - 10, time.time() - 10))
+        assert armazem.limpar_expirados() == 1
+        assert cliente.get(caminho, params=parametros).status_code == 404
+
+
+def test_arquivo_removido_antes_do_envio_responde_404(tmp_path):
+    """Arquivo apagado entre a criação da resposta e o envio vira 404, não erro 500"""
+    caminho = tmp_path / "documento.docx"
+    caminho.write_bytes(b"PK" + bytes(100))
+
+    app = FastAPI()
+
+    @app.get("/arquivo")
+    def arquivo():
+        resposta = RespostaArquivo(str(caminho), media_type="application/octet-stream")
+        os.remove(caminho)
+        return resposta
+
+    with TestClient(app) as cliente:
+        resposta = cliente.get("/arquivo")
+    assert resposta.status_code == 404
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Testes do cache de render em disco (cache_render.py)
+"""
+
+import os
+import subprocess
+import sys
+
+import modelo_compilado
+from cache_render import CacheRender, chave_render
+
+DIRETORIO = os.path.dirname(os.path.abspath(__file__))
+
+DADOS = {
+    "NOME": "Maria da Conceição",
+    "CPF": "123.456.789-00",
+    "EMAIL": "maria@exemplo.com",
+    "VALOR": "R$ 1.500,00",
+    "PARCELAS": "3",
+    "DATA": "19/10/2026",
+    "HORA": "10:00:00"
+}
+
+
+def modelo():
+    return modelo_compilado.obter_modelo(os.path.join(DIRETORIO, "template.docx"))
+
+
+def test_chave_ignora_campos_fora_do_modelo():
+    """HORA e DATA não estão no modelo: mudar os dois não muda a chave"""
+    compilado = modelo()
+    assert "HORA" not in compilado.todos_placeholders
+    chave = chave_render(compilado, DADOS)
+    assert chave == chave_render(compilado, dict(DADOS, HORA="23:59:59", DATA="01/01/2030"))
+    assert chave != chave_render(compilado, dict(DADOS, NOME="Outra Pessoa"))
+    assert chave != chave_render(compilado, DADOS, variante="zip")
+
+
+def test_cache_compartilhado_entre_processos(tmp_path):
+    """Um documento gravado por outro processo é lido daqui"""
+    script = (
+        "import sys; from cache_render import CacheRender; "
+        "CacheRender(sys.argv[1], 1 << 20).guardar('chave', b'documento de outro processo')"
+    )
+    subprocess.run([sys.executable, "-c", script, str(tmp_path)], cwd=DIRETORIO, check=True)
+
+    cache = CacheRender(str(tmp_path), 1 << 20)
+    assert cache.obter("chave") == b"documento de outro processo"
+    assert cache.obter("inexistente") is None
+    assert cache.estatisticas()["acertos"] == 1
+    assert cache.estatisticas()["falhas"] == 1
+
+
+def test_cache_remove_os_menos_acessados(tmp_path):
+    """Passando do limite, sai o documento acessado há mais tempo"""
+    cache = CacheRender(str(tmp_path), 2500)
+    cache.guardar("a", b"a" * 1000)
+    cache.guardar("b", b"b" * 1000)
+    assert cache.obter("a") is not None
+    cache.guardar("c", b"c" * 1000)
+
+    assert cache.obter("b") is None
+    assert cache.obter("a") == b"a" * 1000
+    assert cache.obter("c") == b"c" * 1000
+    assert cache.estatisticas()["bytes"] <= 2500
+
+
+if __name__ == "__main__":
+    import tempfile
+    test_chave_ignora_campos_fora_do_modelo()
+    with tempfile.TemporaryDirectory() as pasta:
+        test_cache_compartilhado_entre_processos(pasta)
+    with tempfile.TemporaryDirectory() as pasta:
+        test_cache_remove_os_menos_acessados(pasta)
+    print("✅ Cache de render OK")
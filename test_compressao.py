@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Testes da compressão negociada das respostas JSON (compressao.py)
+"""
+
+import gzip
+import zlib
+
+import pytest
+from fastapi.testclient import TestClient
+
+import cache_render
+import compressao
+import main
+from cache_render import CacheRender
+from compressao import TrechoGzip
+
+MENSAGEM = """Nome: Helena Duarte
+Email: helena@exemplo.com
+CPF: 321.654.987-00
+Valor: 2.400,00
+Quantidade de Parcelas: 8
+Forma de pagamento: Boleto"""
+
+
+@pytest.fixture
+def sem_brotli(monkeypatch):
+    monkeypatch.setattr(compressao, "brotli", None)
+
+
+def test_negociar(sem_brotli, monkeypatch):
+    assert compressao.negociar("gzip, deflate") == "gzip"
+    assert compressao.negociar("GZIP;q=0.5") == "gzip"
+    assert compressao.negociar("*") == "gzip"
+    assert compressao.negociar("gzip;q=0") is None
+    assert compressao.negociar("*;q=0") is None
+    assert compressao.negociar("gzip;q=abc") is None
+    assert compressao.negociar("identity") is None
+    assert compressao.negociar("") is None
+    assert compressao.negociar(None) is None
+
+    monkeypatch.setattr(compressao, "ATIVA", False)
+    assert compressao.negociar("gzip") is None
+
+
+def test_negociar_prefere_gzip_no_empate(monkeypatch):
+    monkeypatch.setattr(compressao, "brotli", object())
+    assert compressao.negociar("br, gzip") == "gzip"
+    assert compressao.negociar("br;q=1, gzip;q=0.8") == "br"
+    assert compressao.negociar("br") == "br"
+
+
+def test_combinar_crc():
+    primeira, segunda = b"contrato de prestacao " * 50, b"de servicos" * 7
+    combinado = compressao.combinar_crc(zlib.crc32(primeira), zlib.crc32(segunda), len(segunda))
+    assert combinado == zlib.crc32(primeira + segunda)
+    assert compressao.combinar_crc(zlib.crc32(primeira), zlib.crc32(b""), 0) == zlib.crc32(primeira)
+
+
+def test_gzip_emendado():
+    """Bytes soltos e trechos prontos (inclusive repetidos) viram um único gzip válido"""
+    base64 = b"UEsDBBQAAAAIAA" * 500
+    trecho = TrechoGzip.comprimir(base64, zlib.Z_HUFFMAN_ONLY)
+    partes = [b'{"a": "', trecho, b'", "b": "', trecho, b'"}']
+    esperado = b'{"a": "' + base64 + b'", "b": "' + base64 + b'"}'
+    assert gzip.decompress(compressao.gzip_emendado(partes)) == esperado
+    assert gzip.decompress(compressao.gzip_emendado([])) == b""
+
+
+def test_trecho_serializado():
+    trecho = TrechoGzip.comprimir(b"documento " * 100)
+    carregado = TrechoGzip.carregar(trecho.serializar())
+    assert (carregado.dados, carregado.crc, carregado.tamanho) == (trecho.dados, trecho.crc, trecho.tamanho)
+
+
+def sem_horario(resposta):
+    """Corpo JSON sem os campos que mudam a cada segundo (timestamp e nome do arquivo)"""
+    corpo = resposta.json()
+    corpo.pop("timestamp")
+    corpo.pop("filename")
+    return corpo
+
+
+def test_endpoint_base64_comprimido(sem_brotli):
+    """Com gzip aceito o corpo vem comprimido e, descomprimido, é o mesmo JSON de identity"""
+    corpo = {"mensagem": MENSAGEM, "data_referencia": "2026-10-19T10:00:00"}
+    with TestClient(main.app) as cliente:
+        simples = cliente.post("/gerar-documento-base64", json=corpo, headers={"Accept-Encoding": "identity"})
+        comprimida = cliente.post("/gerar-documento-base64", json=corpo, headers={"Accept-Encoding": "gzip"})
+
+    assert simples.status_code == comprimida.status_code == 200
+    assert "content-encoding" not in simples.headers
+    assert simples.headers["vary"] == comprimida.headers["vary"] == "Accept-Encoding"
+    assert comprimida.headers["content-encoding"] == "gzip"
+    # O httpx descomprime o corpo: se o stream emendado estivesse quebrado, falharia aqui
+    assert sem_horario(comprimida) == sem_horario(simples)
+    assert int(comprimida.headers["content-length"]) < len(simples.content)
+
+    economia = compressao.exportar()["base64"]
+    assert economia["comprimidas"] >= 1
+    assert economia["bytes_enviados"] < economia["bytes_originais"]
+
+
+def test_trecho_do_cache(sem_brotli, tmp_path, monkeypatch):
+    """Com o cache de render, a repetição do contrato reaproveita o trecho gzip do base64"""
+    monkeypatch.setattr(cache_render, "_cache", CacheRender(str(tmp_path), 1 << 26))
+    monkeypatch.setattr(cache_render, "_cache_configurado", True)
+    corpo = {"mensagem": MENSAGEM.replace("Helena", "Heloísa"), "data_referencia": "2026-10-19T10:00:00"}
+    with TestClient(main.app) as cliente:
+        antes = compressao.exportar().get("base64", {}).get("trechos_do_cache", 0)
+        primeira = cliente.post("/gerar-documento-base64", json=corpo, headers={"Accept-Encoding": "gzip"})
+        segunda = cliente.post("/gerar-documento-base64", json=corpo, headers={"Accept-Encoding": "gzip"})
+
+    assert primeira.headers["content-encoding"] == segunda.headers["content-encoding"] == "gzip"
+    assert sem_horario(primeira) == sem_horario(segunda)
+    assert compressao.exportar()["base64"]["trechos_do_cache"] == antes + 1
+
+
+def test_corpo_pequeno_sem_base64_vai_sem_compressao():
+    class Documento:
+        codificacao = "gzip"
+        marcador_base64 = None
+        tamanho = 0
+
+    resposta = compressao.resposta_json({"download_url": "/downloads/x"}, Documento(), "teste_pequeno")
+    assert "content-encoding" not in resposta.headers
+    assert resposta.headers["vary"] == "Accept-Encoding"
+    assert compressao.exportar()["teste_pequeno"]["comprimidas"] == 0
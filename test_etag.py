@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Testes da saída determinística com ETag forte e If-None-Match (pipeline.py)
+"""
+
+from fastapi.testclient import TestClient
+
+import main
+import metricas
+import modelo_compilado
+
+MENSAGEM = """Nome: Paulo Reis
+Email: paulo@exemplo.com
+CPF: 555.666.777-88
+Valor: 3.000,00
+Quantidade de Parcelas: 10
+Forma de pagamento: Cartão de crédito"""
+
+
+def contador(nome):
+    return metricas.exportar()["contadores"].get(nome, 0)
+
+
+def test_mesmo_contrato_mesmos_bytes_e_304():
+    """Mesmo contrato: mesmos bytes e ETag; If-None-Match igual responde 304 sem renderizar"""
+    corpo = {"mensagem": MENSAGEM, "data_referencia": "2026-10-19T10:00:00"}
+    # Aquecido antes: os renders do aquecimento não entram nos contadores abaixo
+    main.aquecer()
+    with TestClient(main.app) as cliente:
+        primeira = cliente.post("/gerar-documento", json=corpo)
+        # Outro instante: DATA e HORA mudam, mas o modelo não usa esses campos
+        segunda = cliente.post("/gerar-documento", json=dict(corpo, data_referencia="2026-10-20T18:30:00"))
+        assert primeira.status_code == segunda.status_code == 200
+        assert primeira.content == segunda.content
+        etag = primeira.headers["etag"]
+        assert etag == segunda.headers["etag"]
+        assert etag.startswith('"') and etag.endswith('"')
+
+        antes = contador("documentos_304")
+        renders_antes = contador("documentos_origem_modelo") + contador("documentos_origem_cache")
+        inalterado = cliente.post("/gerar-documento", json=corpo, headers={"If-None-Match": f'"outro", {etag}'})
+        assert inalterado.status_code == 304
+        assert inalterado.content == b""
+        assert inalterado.headers["etag"] == etag
+        assert contador("documentos_304") == antes + 1
+        assert contador("documentos_origem_modelo") + contador("documentos_origem_cache") == renders_antes
+
+        # ETag de outro contrato não vale
+        outro = cliente.post("/gerar-documento", json=dict(corpo, mensagem=MENSAGEM.replace("Paulo", "Pedro")),
+                             headers={"If-None-Match": etag})
+        assert outro.status_code == 200
+        assert outro.headers["etag"] != etag
+
+
+def test_etag_depende_do_formato_e_do_nivel(monkeypatch):
+    """A ETag muda com o formato e com o nível de compressão; sem chave (fallback) não há ETag"""
+    chave = "0" * 64
+    binario = main.pipeline.etag(chave, "binario")
+    assert binario == main.pipeline.etag(chave, "binario")
+    assert binario != main.pipeline.etag(chave, "pdf")
+    monkeypatch.setattr(modelo_compilado, "NIVEL_DEFLATE", 0)
+    assert binario != main.pipeline.etag(chave, "binario")
+    assert main.pipeline.etag(None, "binario") is None
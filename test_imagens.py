@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Testes das imagens nos modelos ({{IMG:NOME}}, imagens.py)
+"""
+
+import base64
+import io
+import zipfile
+
+import pytest
+from docx import Document
+from fastapi.testclient import TestClient
+
+import imagens
+import main
+import motor_zip
+from cache_render import chave_render
+from imagens import ImagemInvalida
+from modelo_compilado import ModeloCompilado
+
+PIL = pytest.importorskip("PIL.Image")
+
+
+def png(largura=40, altura=20, cor=(200, 30, 30)):
+    saida = io.BytesIO()
+    PIL.new("RGB", (largura, altura), cor).save(saida, "PNG")
+    return saida.getvalue()
+
+
+def base64_png(**kwargs):
+    return base64.b64encode(png(**kwargs)).decode("ascii")
+
+
+@pytest.fixture(autouse=True)
+def cache_em_tmp(tmp_path, monkeypatch):
+    monkeypatch.setenv("IMAGENS_CACHE_DIR", str(tmp_path / "imagens"))
+
+
+@pytest.fixture
+def modelo(tmp_path):
+    """Modelo com a assinatura no meio de um parágrafo e o logo em largura fixa"""
+    documento = Document()
+    documento.add_paragraph("Paciente: {{NOME}}")
+    documento.add_paragraph("Assinatura: {{IMG:ASSINATURA}} em São Paulo")
+    documento.add_paragraph("{{IMG:LOGO:3}}")
+    caminho = str(tmp_path / "modelo_imagens.docx")
+    documento.save(caminho)
+    with open(caminho, "rb") as f:
+        return ModeloCompilado(caminho, f.read())
+
+
+def test_registrar_referencia_por_conteudo():
+    referencias = imagens.registrar({"assinatura": base64_png(), "logo": f"data:image/png;base64,{base64_png()}"})
+    assert set(referencias) == {"IMG:ASSINATURA", "IMG:LOGO"}
+    # Mesmo conteúdo, mesma referência (data URI ou base64 puro)
+    assert referencias["IMG:ASSINATURA"] == referencias["IMG:LOGO"]
+    assert referencias["IMG:LOGO"].startswith("sha256:")
+    assert imagens.registrar({"X": ""}) == {}
+
+
+@pytest.mark.parametrize("recebidas", [
+    {"LOGO": "não é base64!"},
+    {"LOGO": base64.b64encode(b"texto qualquer").decode()},
+    {"LOGO": 123},
+    ["LOGO"],
+    "LOGO",
+])
+def test_registrar_recusa_imagem_invalida(recebidas):
+    with pytest.raises(ImagemInvalida):
+        imagens.registrar(recebidas)
+
+
+def test_imagem_grande_reduzida():
+    referencias = imagens.registrar({"FOTO": base64_png(largura=imagens.MAX_PX * 2, altura=100)})
+    imagem = imagens.resolver("FOTO", referencias)
+    with PIL.open(io.BytesIO(imagem.dados)) as reduzida:
+        assert reduzida.size == (imagens.MAX_PX, 50)
+
+
+def test_render_com_imagens(modelo):
+    dados = {"NOME": "Ana"}
+    dados.update(imagens.registrar({"ASSINATURA": base64_png(), "LOGO": base64_png(cor=(0, 0, 255))}))
+    conteudo = motor_zip.renderizar(modelo, dados)
+
+    with zipfile.ZipFile(io.BytesIO(conteudo)) as pacote:
+        assert pacote.testzip() is None
+        midias = [nome for nome in pacote.namelist() if nome.startswith("word/media/img_")]
+        xml = pacote.read("word/document.xml").decode("utf-8")
+        tipos = pacote.read("[Content_Types].xml").decode("utf-8")
+    assert len(midias) == 2
+    assert "{{IMG" not in xml
+    assert xml.count("<pic:pic") == 2
+    assert "image/png" in tipos
+
+    documento = Document(io.BytesIO(conteudo))
+    textos = [paragrafo.text for paragrafo in documento.paragraphs]
+    assert textos[:2] == ["Paciente: Ana", "Assinatura:  em São Paulo"]
+    assert len(documento.inline_shapes) == 2
+    # {{IMG:LOGO:3}}: 3 cm de largura
+    assert round(documento.inline_shapes[1].width.cm, 1) == 3.0
+
+
+def test_chave_muda_com_a_imagem(modelo):
+    vermelha = imagens.registrar({"ASSINATURA": base64_png()})
+    azul = imagens.registrar({"ASSINATURA": base64_png(cor=(0, 0, 255))})
+    dados = {"NOME": "Ana"}
+    assert chave_render(modelo, dict(dados, **vermelha)) == chave_render(modelo, dict(dados, **vermelha))
+    assert chave_render(modelo, dict(dados, **vermelha)) != chave_render(modelo, dict(dados, **azul))
+
+
+def test_imagem_invalida_responde_422():
+    with TestClient(main.app) as cliente:
+        gerar = cliente.post("/gerar-documento", json={"mensagem": "Nome: Ana", "imagens": {"LOGO": "???"}})
+        assert gerar.status_code == 422
+
+        webhook = cliente.post("/webhook/processar", json={"mensagem": "Nome: Ana", "imagens": {"LOGO": "???"}})
+        assert webhook.status_code == 422
+        webhook = cliente.post("/webhook/processar", json={"mensagem": "Nome: Ana", "imagens": ["LOGO"]})
+        assert webhook.status_code == 422
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Testes do modo assíncrono de geração (fila_jobs.py e rotas /jobs)
+"""
+
+import asyncio
+import os
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from fila_jobs import STATUS_CONCLUIDO, STATUS_ERRO, FilaCheia, FilaJobs
+
+MENSAGEM = """Nome: Eduardo Silva
+Email: eduardo.silva@gmail.com
+CPF: 123.456.789-00
+Valor: 1.500,00
+Quantidade de Parcelas: 12
+Forma de pagamento: Cartão de Crédito"""
+
+
+def esperar_job(cliente, job_id, prazo=60):
+    limite = time.monotonic() + prazo
+    while time.monotonic() < limite:
+        status = cliente.get(f"/jobs/{job_id}").json()
+        if status["status"] in (STATUS_CONCLUIDO, STATUS_ERRO):
+            return status
+        time.sleep(0.1)
+    raise AssertionError(f"job {job_id} não terminou em {prazo}s")
+
+
+def test_job_gera_documento():
+    """POST /jobs devolve 202 na hora; o documento sai em /jobs/{id}/resultado"""
+    with TestClient(main.app) as cliente:
+        resposta = cliente.post("/jobs", json={"mensagem": MENSAGEM})
+        assert resposta.status_code == 202
+        job_id = resposta.json()["job_id"]
+
+        status = esperar_job(cliente, job_id)
+        assert status["status"] == STATUS_CONCLUIDO
+        assert status["result_url"] == f"/jobs/{job_id}/resultado"
+
+        documento = cliente.get(status["result_url"])
+        assert documento.status_code == 200
+        assert documento.content[:2] == b"PK"
+        assert status["filename"] in documento.headers["content-disposition"]
+
+        assert cliente.get("/jobs/naoexiste").status_code == 404
+        assert cliente.get("/jobs/naoexiste/resultado").status_code == 404
+
+
+def test_fila_cheia_e_erro(tmp_path):
+    """Fila cheia levanta FilaCheia com retry_after; erro do render vira status "erro" """
+    def renderizar(request, pasta):
+        raise ValueError("modelo quebrado")
+
+    async def cenario():
+        fila = FilaJobs(renderizar, diretorio=str(tmp_path), tamanho_maximo=1, workers=1)
+        await fila.iniciar()
+        try:
+            primeiro = fila.enviar("pedido 1")["job_id"]
+            with pytest.raises(FilaCheia) as erro:
+                fila.enviar("pedido 2")
+            assert erro.value.retry_after >= 1
+            assert fila.recusados == 1
+            await fila.fila.join()
+            return fila.obter_status(primeiro)
+        finally:
+            await fila.parar()
+
+    status = asyncio.run(cenario())
+    assert status["status"] == STATUS_ERRO
+    assert status["erro"] == "modelo quebrado"
+
+
+def test_jobs_expiram(tmp_path):
+    """Passado o TTL, o status some e limpar_expirados apaga a pasta do job"""
+    async def cenario():
+        fila = FilaJobs(lambda request, pasta: {}, diretorio=str(tmp_path), ttl=60)
+        await fila.iniciar()
+        try:
+            return fila, fila.enviar("pedido")["job_id"]
+        finally:
+            await fila.parar()
+
+    fila, job_id = asyncio.run(cenario())
+    pasta = tmp_path / job_id
+    assert fila.obter_status(job_id) is not None
+    assert fila.limpar_expirados() == 0
+
+    antigo = time.time() - 120
+    fila._gravar_status(job_id, criado_em=antigo)
+    os.utime(pasta, (antigo, antigo))
+    assert fila.obter_status(job_id) is None
+    assert fila.limpar_expirados() == 1
+    assert not pasta.exists()
+    assert fila.obter_status(job_id) is None
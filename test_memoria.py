@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Testes da medição de picos de memória (metricas.medir_memoria) e do orçamento
+de memória das gerações (memoria.py)
+"""
+
+import threading
+import time
+import tracemalloc
+
+import pytest
+
+import metricas
+from memoria import MB, MemoriaEsgotada, OrcamentoMemoria
+from pipeline import PipelineRender
+
+
+@pytest.fixture
+def rastreando():
+    ja_rastreava = tracemalloc.is_tracing()
+    if not ja_rastreava:
+        tracemalloc.start(1)
+    yield
+    if not ja_rastreava:
+        tracemalloc.stop()
+
+
+def alocar(tamanho, espera=0.0):
+    bloco = bytearray(tamanho)
+    time.sleep(espera)
+    del bloco
+
+
+def test_pico_isolado_e_aninhado(rastreando):
+    with metricas.medir_memoria("teste_externo") as externo:
+        alocar(20 * MB)
+        with metricas.medir_memoria("teste_interno") as interno:
+            alocar(5 * MB)
+
+    assert interno["isolada"] and externo["isolada"]
+    assert 4 * MB < interno["pico"] < 10 * MB
+    # O reset do bloco interno não apaga o pico anterior do externo
+    assert 19 * MB < externo["pico"] < 30 * MB
+    assert metricas.exportar()["memoria"]["teste_externo"]["max_mb"] > 19
+
+
+def test_medicoes_sobrepostas_nao_entram_nas_estatisticas(rastreando):
+    """Uma thread não apaga o pico da outra e picos sobrepostos só contam em "sobrepostas" """
+    medidas = {}
+
+    def medir(nome, tamanho, espera):
+        with metricas.medir_memoria("teste_sobreposta") as medida:
+            alocar(tamanho, espera)
+        medidas[nome] = medida
+
+    longa = threading.Thread(target=medir, args=("longa", 30 * MB, 0.3))
+    longa.start()
+    time.sleep(0.05)
+    curta = threading.Thread(target=medir, args=("curta", 5 * MB, 0.01))
+    curta.start()
+    longa.join()
+    curta.join()
+
+    assert not medidas["longa"]["isolada"] and not medidas["curta"]["isolada"]
+    # Sem reset no meio, o pico da longa continua lá
+    assert medidas["longa"]["pico"] > 29 * MB
+    estatistica = metricas.exportar()["memoria"]["teste_sobreposta"]
+    assert estatistica["sobrepostas"] == 2
+    assert estatistica["quantidade"] == 0
+
+
+def test_orcamento_espera_e_recusa():
+    orcamento = OrcamentoMemoria(limite=100 * MB, espera=0.2)
+
+    # Uma geração sozinha é sempre admitida, mesmo acima do limite
+    with orcamento.reservar(150 * MB):
+        assert orcamento.em_andamento == 1
+        with pytest.raises(MemoriaEsgotada) as erro:
+            with orcamento.reservar(10 * MB):
+                pass
+        assert erro.value.retry_after >= 1
+    assert orcamento.recusadas == 1
+
+    # A espera termina quando outra geração libera a reserva
+    liberar = threading.Event()
+
+    def ocupar():
+        with orcamento.reservar(80 * MB):
+            liberar.wait()
+
+    ocupante = threading.Thread(target=ocupar)
+    ocupante.start()
+    while orcamento.em_andamento == 0:
+        time.sleep(0.01)
+    orcamento.espera = 5
+    threading.Timer(0.1, liberar.set).start()
+    with orcamento.reservar(50 * MB):
+        assert orcamento.reservado == 50 * MB
+    ocupante.join()
+    assert (orcamento.reservado, orcamento.em_andamento, orcamento.recusadas) == (0, 0, 1)
+
+
+def test_estimativa_aprende_so_com_picos_isolados(rastreando):
+    orcamento = OrcamentoMemoria(limite=1024 * MB, fator_modelo=8)
+    assert orcamento.estimar("modelo_binario", MB) == 8 * MB
+    orcamento.aprender("modelo_binario", 20 * MB)
+    assert orcamento.estimar("modelo_binario", MB) == 20 * MB
+    # Desce devagar
+    orcamento.aprender("modelo_binario", 10 * MB)
+    assert orcamento.estimar("modelo_binario", MB) == 19 * MB
+
+    pipeline = PipelineRender(None, {}, None, orcamento=orcamento)
+    with pipeline.memoria_da_geracao((None, None, None), "binario"):
+        alocar(3 * MB)
+    assert 2 * MB < orcamento.estimar("fallback_binario", 0) < 6 * MB
+
+    # Com outra medição aberta em paralelo, o pico não ensina nada
+    parar = threading.Event()
+
+    def paralela():
+        with metricas.medir_memoria("teste_paralela"):
+            parar.wait()
+
+    outra = threading.Thread(target=paralela)
+    outra.start()
+    time.sleep(0.05)
+    with pipeline.memoria_da_geracao((None, None, None), "pdf"):
+        alocar(3 * MB)
+    parar.set()
+    outra.join()
+    assert "fallback_pdf" not in orcamento.exportar()["estimativas_mb"]
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Testes do micro-batching (microlote.py) na frente do pool de render (pool_render.py)
+"""
+
+import os
+import sys
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import pytest
+
+import modelo_compilado
+import motor_zip
+from microlote import MicroLote
+from pool_render import PoolRender
+
+MODELO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "template.docx")
+
+
+def modulo_main_carregado():
+    """Roda dentro de um processo do pool"""
+    return "main" in sys.modules
+
+
+def test_lotes_devolvem_cada_resultado_ao_seu_dono():
+    """Itens simultâneos saem em lotes e cada chamador recebe o próprio resultado"""
+    lotes = []
+    trava = threading.Lock()
+
+    def enviar_lote(itens):
+        with trava:
+            lotes.append(list(itens))
+        futuro = Future()
+        futuro.set_result([item * 10 for item in itens])
+        return futuro
+
+    microlote = MicroLote(enviar_lote, janela_ms=50, tamanho_maximo=8)
+    barreira = threading.Barrier(16)
+
+    def um(item):
+        barreira.wait()
+        return microlote.executar(item)
+
+    with ThreadPoolExecutor(16) as executor:
+        resultados = list(executor.map(um, range(16)))
+
+    assert resultados == [item * 10 for item in range(16)]
+    assert sorted(item for lote in lotes for item in lote) == list(range(16))
+    assert all(len(lote) <= 8 for lote in lotes)
+    assert len(lotes) < 16
+
+
+def test_erro_do_lote_chega_a_todos():
+    """Falha no envio do lote vira exceção em cada Future do lote"""
+    def enviar_lote(itens):
+        raise RuntimeError("pool indisponível")
+
+    microlote = MicroLote(enviar_lote, janela_ms=1, tamanho_maximo=4)
+    with pytest.raises(RuntimeError, match="pool indisponível"):
+        microlote.executar("item")
+
+
+def test_pool_com_microlote_renderiza_igual_ao_motor_direto():
+    """Renders concorrentes agrupados no pool são idênticos ao motor_zip na thread, sem importar main"""
+    modelo = modelo_compilado.obter_modelo(MODELO)
+    entradas = [{"NOME": f"Pessoa {i}", "CPF": f"{i:03d}.000.000-00", "VALOR": f"R$ {i},00"} for i in range(12)]
+
+    pool = PoolRender(1, "zip")
+    pool.microlote = MicroLote(pool.enviar_lote, janela_ms=20, tamanho_maximo=6)
+    try:
+        with ThreadPoolExecutor(12) as executor:
+            documentos = list(executor.map(lambda dados: pool.renderizar(MODELO, dados), entradas))
+        (processo,) = pool._processos
+        assert processo.executor.submit(modulo_main_carregado).result(timeout=60) is False
+    finally:
+        pool.encerrar()
+
+    assert documentos == [motor_zip.renderizar(modelo, dados) for dados in entradas]
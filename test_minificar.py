@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Testes da minificação de modelos (minificar.py): o modelo minificado precisa
+ter o mesmo texto, os mesmos placeholders e renderizar o mesmo conteúdo
+"""
+
+import io
+import os
+
+import lxml.etree
+from docx import Document
+
+import motor_zip
+from minificar import W, mesclar_runs, minificar_pacote, podar_estilos, remover_ruido
+from modelo_compilado import ModeloCompilado
+
+MODELO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "template.docx")
+NS = f'xmlns:w="{W}"'
+
+DADOS = {"NOME": "Ana & <Beto>", "CPF": "123.456.789-00", "VALOR": "R$ 1.000,00", "EMAIL": "ana@exemplo.com"}
+
+
+def xml(texto):
+    return lxml.etree.fromstring(texto)
+
+
+def textos(conteudo):
+    """Texto de cada parágrafo do corpo e das tabelas"""
+    documento = Document(io.BytesIO(conteudo))
+    paragrafos = [p.text for p in documento.paragraphs]
+    for tabela in documento.tables:
+        for linha in tabela.rows:
+            paragrafos.extend(celula.text for celula in linha.cells)
+    return paragrafos
+
+
+def test_remove_ruido_sem_perder_conteudo():
+    corpo = xml(
+        f'<w:document {NS}><w:body><w:p w:rsidR="00A1" w:rsidRDefault="00B2">'
+        '<w:r w:rsidRPr="00C3"><w:rPr><w:lang w:val="pt-BR"/></w:rPr><w:t>Olá</w:t></w:r>'
+        '<w:proofErr w:type="spellStart"/><w:r><w:lastRenderedPageBreak/><w:t>mundo</w:t></w:r>'
+        '</w:p></w:body></w:document>'
+    )
+    assert remover_ruido(corpo, "word/document.xml") == 6
+    serializado = lxml.etree.tostring(corpo).decode()
+    assert "rsid" not in serializado
+    assert "proofErr" not in serializado and "lang" not in serializado and "rPr" not in serializado
+    assert [t.text for t in corpo.iter(f"{{{W}}}t")] == ["Olá", "mundo"]
+
+    # Em styles.xml o w:lang define o idioma padrão e fica
+    estilos = xml(f'<w:styles {NS}><w:docDefaults><w:rPrDefault><w:rPr><w:lang w:val="pt-BR"/></w:rPr>'
+                  '</w:rPrDefault></w:docDefaults></w:styles>')
+    assert remover_ruido(estilos, "word/styles.xml") == 0
+
+
+def test_mescla_runs_de_mesma_formatacao():
+    """Placeholder fragmentado pelo Word volta a ser um texto só; formatação diferente não mescla"""
+    paragrafo = xml(
+        f'<w:p {NS}>'
+        '<w:r><w:t>{{NO</w:t></w:r><w:r><w:t>ME}} </w:t></w:r>'
+        '<w:r><w:rPr><w:b/></w:rPr><w:t>negrito</w:t></w:r>'
+        '<w:r><w:tab/></w:r><w:r><w:t>fim</w:t></w:r>'
+        '</w:p>'
+    )
+    assert mesclar_runs(paragrafo) == 1
+    assert [t.text for t in paragrafo.iter(f"{{{W}}}t")] == ["{{NOME}} ", "negrito", "fim"]
+    primeiro = next(paragrafo.iter(f"{{{W}}}t"))
+    assert primeiro.get("{http://www.w3.org/XML/1998/namespace}space") == "preserve"
+
+
+def test_poda_so_estilos_sem_uso():
+    """Estilos usados, suas bases e os padrões ficam; o resto sai"""
+    estilos = xml(
+        f'<w:styles {NS}>'
+        '<w:style w:styleId="Normal" w:default="1"/>'
+        '<w:style w:styleId="Base"/>'
+        '<w:style w:styleId="Titulo"><w:basedOn w:val="Base"/><w:next w:val="Corpo"/></w:style>'
+        '<w:style w:styleId="Corpo"/>'
+        '<w:style w:styleId="SemUso"/>'
+        '</w:styles>'
+    )
+    documento = xml(f'<w:document {NS}><w:body><w:p><w:pPr><w:pStyle w:val="Titulo"/></w:pPr></w:p></w:body></w:document>')
+    assert podar_estilos(estilos, [documento]) == 1
+    assert [e.get(f"{{{W}}}styleId") for e in estilos] == ["Normal", "Base", "Titulo", "Corpo"]
+
+
+def test_modelo_minificado_equivale_ao_original():
+    """Mesmo texto e placeholders, pacote menor e render com o mesmo conteúdo"""
+    with open(MODELO, "rb") as f:
+        conteudo = f.read()
+
+    minificado, relatorio = minificar_pacote(conteudo)
+    assert relatorio["xml_depois"] <= relatorio["xml_antes"]
+    assert textos(minificado) == textos(conteudo)
+
+    original = ModeloCompilado(MODELO, conteudo)
+    compacto = ModeloCompilado(MODELO, conteudo, minificar=True)
+    assert compacto.minificacao is not None
+    assert compacto.todos_placeholders == original.todos_placeholders
+    renderizado = textos(motor_zip.renderizar(compacto, DADOS))
+    assert renderizado == textos(motor_zip.renderizar(original, DADOS))
+    assert any(DADOS["NOME"] in texto for texto in renderizado)
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Testes do artefato persistido de modelos compilados (modelo_compilado.py)
+"""
+
+import os
+import shutil
+
+import pytest
+
+import modelo_compilado
+import motor_zip
+
+DIRETORIO = os.path.dirname(os.path.abspath(__file__))
+
+DADOS = {"NOME": "Ana Müller", "CPF": "123.456.789-00", "VALOR": "R$ 10,00", "ENDERECO": "Av. A & B"}
+
+
+@pytest.fixture
+def modelo(tmp_path, monkeypatch):
+    """Cópia do template.docx e diretório de artefatos privado (0700) para o teste"""
+    artefatos = tmp_path / "artefatos"
+    monkeypatch.setenv("MODELOS_CACHE_DIR", str(artefatos))
+    monkeypatch.delenv("MODELOS_MINIFICAR", raising=False)
+    caminho = str(tmp_path / "template.docx")
+    shutil.copyfile(os.path.join(DIRETORIO, "template.docx"), caminho)
+    yield caminho
+    modelo_compilado._modelos.pop(caminho, None)
+
+
+def test_artefato_reproduz_a_compilacao(modelo, monkeypatch):
+    """O modelo carregado do artefato é igual ao compilado e renderiza os mesmos bytes"""
+    compilado = modelo_compilado.compilar_modelo(modelo)
+    artefatos = os.environ["MODELOS_CACHE_DIR"]
+    assert os.stat(artefatos).st_mode & 0o777 == 0o700
+    (nome,) = os.listdir(artefatos)
+    assert nome == f"{compilado.hash_original}.artefato"
+    with open(os.path.join(artefatos, nome), "rb") as f:
+        assert f.read(4) == modelo_compilado.ASSINATURA_ARTEFATO
+
+    # Sem o artefato a compilação rodaria de novo: aqui ela não pode acontecer
+    monkeypatch.setattr(modelo_compilado, "comprimir_membro", None)
+    carregado = modelo_compilado.compilar_modelo(modelo)
+    assert carregado is not compilado
+    assert carregado.hash == compilado.hash
+    assert carregado.partes == compilado.partes
+    assert carregado.placeholders == compilado.placeholders
+    assert carregado.membros == compilado.membros
+    assert motor_zip.renderizar(carregado, DADOS) == motor_zip.renderizar(compilado, DADOS)
+
+
+def test_artefato_ignorado_em_diretorio_compartilhado(modelo):
+    """Artefato num diretório gravável por outros usuários não é carregado"""
+    compilado = modelo_compilado.compilar_modelo(modelo)
+    artefatos = os.environ["MODELOS_CACHE_DIR"]
+    with open(modelo, "rb") as f:
+        conteudo = f.read()
+    assert modelo_compilado.carregar_artefato(modelo, conteudo, compilado.mtime) is not None
+
+    os.chmod(artefatos, 0o777)
+    assert not modelo_compilado.diretorio_confiavel(artefatos)
+    assert modelo_compilado.carregar_artefato(modelo, conteudo, compilado.mtime) is None
+
+
+def test_artefato_corrompido_recompila(modelo):
+    """Artefato truncado ou com outra assinatura é descartado e o modelo é recompilado"""
+    compilado = modelo_compilado.compilar_modelo(modelo)
+    caminho = os.path.join(os.environ["MODELOS_CACHE_DIR"], f"{compilado.hash_original}.artefato")
+    with open(modelo, "rb") as f:
+        conteudo = f.read()
+
+    with open(caminho, "r+b") as f:
+        f.truncate(os.path.getsize(caminho) // 2)
+    assert modelo_compilado.carregar_artefato(modelo, conteudo, compilado.mtime) is None
+
+    with open(caminho, "wb") as f:
+        f.write(b"\x80\x04\x95" + bytes(100))
+    assert modelo_compilado.carregar_artefato(modelo, conteudo, compilado.mtime) is None
+
+    recompilado = modelo_compilado.compilar_modelo(modelo)
+    assert recompilado.membros == compilado.membros
+    assert modelo_compilado.carregar_artefato(modelo, conteudo, compilado.mtime) is not None
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Testes do motor_zip: nível de compressão configurável e membros já comprimidos
+copiados sem recompressão
+"""
+
+import io
+import os
+import zipfile
+import zlib
+
+import modelo_compilado
+import motor_zip
+from modelo_compilado import comprimir_membro
+
+MODELO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "template.docx")
+DADOS = {"NOME": "Rita Alves", "CPF": "321.654.987-00", "VALOR": "R$ 42,00"}
+
+
+def membros_brutos(conteudo):
+    """nome -> (método, bytes comprimidos) de cada membro do zip"""
+    brutos = {}
+    with zipfile.ZipFile(io.BytesIO(conteudo)) as pacote:
+        assert pacote.testzip() is None
+        for info in pacote.infolist():
+            # Cabeçalho local: 30 bytes fixos + nome + extra
+            inicio = info.header_offset + 30 + len(info.filename.encode("utf-8")) + len(info.extra)
+            brutos[info.filename] = (info.compress_type, conteudo[inicio:inicio + info.compress_size])
+    return brutos
+
+
+def test_comprimir_membro():
+    xml = b"<w:t>" + b"texto repetido " * 500 + b"</w:t>"
+    for nivel in (1, 6, 9):
+        membro = comprimir_membro("word/document.xml", xml, nivel)
+        assert membro.metodo == zipfile.ZIP_DEFLATED
+        assert zlib.decompress(membro.dados, -15) == xml
+        assert membro.crc == zlib.crc32(xml)
+        assert (membro.tamanho, membro.tamanho_comprimido) == (len(xml), len(membro.dados))
+
+    armazenado = comprimir_membro("word/document.xml", xml, 0)
+    assert armazenado.metodo == zipfile.ZIP_STORED and armazenado.dados == xml
+
+    # Mídia já comprimida nunca passa pelo deflate
+    imagem = os.urandom(2000)
+    assert comprimir_membro("word/media/image1.PNG", imagem, 9).metodo == zipfile.ZIP_STORED
+
+
+def test_nivel_configuravel(monkeypatch):
+    """RENDER_NIVEL_DEFLATE=0 grava as partes com placeholders sem compressão"""
+    modelo = modelo_compilado.obter_modelo(MODELO)
+    padrao = motor_zip.renderizar(modelo, DADOS)
+    monkeypatch.setattr(modelo_compilado, "NIVEL_DEFLATE", 0)
+    sem_compressao = motor_zip.renderizar(modelo, DADOS)
+
+    assert len(sem_compressao) > len(padrao)
+    brutos = membros_brutos(sem_compressao)
+    for nome in modelo.placeholders:
+        assert brutos[nome][0] == zipfile.ZIP_STORED
+    with zipfile.ZipFile(io.BytesIO(padrao)) as a, zipfile.ZipFile(io.BytesIO(sem_compressao)) as b:
+        assert {n: a.read(n) for n in a.namelist()} == {n: b.read(n) for n in b.namelist()}
+
+
+def test_membros_estaticos_copiados_do_modelo():
+    """Partes sem placeholder saem com os bytes comprimidos na compilação, nos dois motores"""
+    modelo = modelo_compilado.obter_modelo(MODELO)
+    compilados = {membro.nome: (membro.metodo, membro.dados) for membro in modelo.membros}
+    estaticos = [nome for nome in compilados if nome not in modelo.placeholders]
+    assert estaticos
+
+    brutos = membros_brutos(motor_zip.renderizar(modelo, DADOS))
+    for nome in estaticos:
+        assert brutos[nome] == compilados[nome]
+
+    # python-docx: salvar_pacote reaproveita o que não mudou e é estável byte a byte
+    documento = modelo.abrir()
+    salvo = motor_zip.salvar_pacote(documento, modelo)
+    assert salvo == motor_zip.salvar_pacote(documento, modelo)
+    brutos = membros_brutos(salvo)
+    fontes = [nome for nome in estaticos if nome.startswith("word/fonts/")]
+    assert fontes
+    for nome in fontes:
+        assert brutos[nome] == compilados[nome]
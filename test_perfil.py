@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Testes do profiling sob demanda (perfil.py)
+"""
+
+import pstats
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from perfil import MiddlewarePerfil, Perfilador
+
+TOKEN = "token-de-perfil"
+
+MENSAGEM = """Nome: Lucas Prado
+CPF: 222.333.444-55
+Valor: 700,00
+Quantidade de Parcelas: 7
+Forma de pagamento: PIX"""
+
+
+@pytest.fixture
+def perfilador(tmp_path, monkeypatch):
+    perfilador = Perfilador(TOKEN, str(tmp_path))
+    monkeypatch.setattr(main, "perfilador", perfilador)
+    return perfilador
+
+
+def test_autorizado(perfilador):
+    assert perfilador.autorizado(TOKEN)
+    assert perfilador.autorizado(TOKEN.encode("ascii"))
+    assert not perfilador.autorizado("outro-token")
+    assert not perfilador.autorizado("")
+    assert not perfilador.autorizado(None)
+    # Fora do ASCII: recusado, sem TypeError do compare_digest
+    assert not perfilador.autorizado("tökén-de-perfil")
+    assert not perfilador.autorizado(TOKEN + "\udcff")
+
+
+def test_requisicao_perfilada(perfilador):
+    """Com X-Perfil a resposta aponta para o perfil gravado; sem o token, nada é perfilado"""
+    main.aquecer()
+    with TestClient(MiddlewarePerfil(main.app, perfilador)) as cliente:
+        comum = cliente.post("/gerar-documento", json={"mensagem": MENSAGEM})
+        assert comum.status_code == 200
+        assert "x-perfil-id" not in comum.headers
+        assert perfilador.gerados == 0
+
+        errado = cliente.post("/gerar-documento", json={"mensagem": MENSAGEM}, headers={"X-Perfil": "errado"})
+        assert "x-perfil-id" not in errado.headers
+
+        perfilada = cliente.post("/gerar-documento", json={"mensagem": MENSAGEM}, headers={"X-Perfil": TOKEN})
+        assert perfilada.status_code == 200
+        assert perfilada.content == comum.content
+        url = perfilada.headers["x-perfil-url"]
+        assert url == f"/debug/perfis/{perfilada.headers['x-perfil-id']}"
+        assert perfilador.gerados == 1
+
+        resumo = cliente.get(url, headers={"X-Perfil": TOKEN})
+        assert resumo.status_code == 200
+        assert "Por componente" in resumo.text
+        assert "renderizar" in resumo.text
+
+        prof = cliente.get(url, params={"formato": "prof", "perfil": TOKEN})
+        assert prof.status_code == 200
+        caminho = perfilador.caminho(perfilada.headers["x-perfil-id"], "prof")
+        assert pstats.Stats(caminho).total_tt > 0
+
+        assert cliente.get(url).status_code == 404
+        assert cliente.get(url, headers={"X-Perfil": "errado"}).status_code == 404
+        assert cliente.get("/debug/perfis/..%2Fetc", headers={"X-Perfil": TOKEN}).status_code == 404
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Testes do pipeline único de geração (pipeline.py) e dos codificadores de saída
+"""
+
+import base64
+import os
+
+import pytest
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+
+import main
+import pipeline
+from extracao import extrair_dados_da_mensagem
+from pipeline import ORIGEM_FALLBACK, ORIGEM_MODELO, Codificador, PipelineRender, registrar_codificador
+from render_docx import renderizar_com_motor_zip, renderizar_fallback
+
+DIRETORIO = os.path.dirname(os.path.abspath(__file__))
+DATA = "2026-10-19T10:00:00"
+
+MENSAGEM = """Nome: Carla Souza
+Email: carla@exemplo.com
+CPF: 987.654.321-00
+Valor: 800,00
+Quantidade de Parcelas: 4
+Forma de pagamento: Boleto"""
+
+
+class CodificadorTamanho(Codificador):
+    """Formato de teste: só o tamanho e a origem do documento"""
+
+    nome = "teste_tamanho"
+
+    def codificar(self, documento, filename):
+        return JSONResponse({"filename": filename, "tamanho": documento.tamanho, "origem": documento.origem})
+
+
+@pytest.fixture
+def formato_de_teste():
+    registrar_codificador(CodificadorTamanho)
+    yield CodificadorTamanho.nome
+    pipeline._codificadores.pop(CodificadorTamanho.nome, None)
+
+
+def test_formato_registrado_sem_mexer_no_pipeline(formato_de_teste):
+    """Um codificador registrado vira formato do endpoint genérico; formato desconhecido é 404"""
+    corpo = {"mensagem": MENSAGEM, "data_referencia": DATA}
+    with TestClient(main.app) as cliente:
+        binario = cliente.post("/gerar-documento", json=corpo)
+        generico = cliente.post("/gerar-documento/binario", json=corpo)
+        base64_ = cliente.post("/gerar-documento/base64", json=corpo, headers={"Accept-Encoding": "identity"})
+        teste = cliente.post(f"/gerar-documento/{formato_de_teste}", json=corpo)
+        desconhecido = cliente.post("/gerar-documento/nao_existe", json=corpo)
+
+    assert binario.status_code == generico.status_code == 200
+    assert binario.content == generico.content
+    assert base64.b64decode(base64_.json()["base64_content"]) == binario.content
+    assert teste.status_code == 200
+    assert teste.json()["tamanho"] == len(binario.content)
+    assert teste.json()["filename"].startswith("documento_Carla_Souza_")
+    assert desconhecido.status_code == 404
+
+
+def test_falha_do_motor_cai_no_fallback():
+    """Erro no motor de render gera o documento padrão em vez de falhar a requisição"""
+    def motor_quebrado(caminho, dados):
+        raise RuntimeError("motor quebrado")
+
+    modelos = [os.path.join(DIRETORIO, "template.docx")]
+    dados = extrair_dados_da_mensagem(MENSAGEM)
+
+    normal = PipelineRender(extrair_dados_da_mensagem, {"zip": renderizar_com_motor_zip}, renderizar_fallback,
+                            motor="zip", modelos=modelos)
+    quebrado = PipelineRender(extrair_dados_da_mensagem, {"zip": motor_quebrado}, renderizar_fallback,
+                              motor="zip", modelos=modelos)
+
+    documento = normal.renderizar(dados)
+    assert documento.origem == ORIGEM_MODELO
+    assert documento.chave is not None
+    normal.validar(documento)
+
+    documento = quebrado.renderizar(dados)
+    assert documento.origem == ORIGEM_FALLBACK
+    quebrado.validar(documento)
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Testes do tamanho adaptativo do pool de render (pool_render.PoolRender.avaliar)
+"""
+
+import os
+import time
+from concurrent.futures import Future
+
+import pytest
+
+import pool_render
+from pool_render import ErroRender, PoolRender
+
+MODELO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "template.docx")
+
+
+class ProcessoFalso:
+    """Processo do pool sem subprocesso: pronto na hora (ou aquecendo)"""
+
+    def __init__(self, motor, pronto=True):
+        self.aquecimento = Future()
+        if pronto:
+            self.aquecimento.set_result(0)
+        self.pendentes = 0
+        self.ocioso_desde = time.monotonic()
+        self.encerrado = False
+
+    @property
+    def pronto(self):
+        return self.aquecimento.done()
+
+    def encerrar(self, esperar=False):
+        self.encerrado = True
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(pool_render, "ProcessoRender", ProcessoFalso)
+    monkeypatch.setattr(pool_render, "carga_por_nucleo", lambda: 0.2)
+    pool = PoolRender(1, minimo=1, maximo=3, espera_alvo_ms=50, ocioso_s=60)
+    # Sem a thread de controle: as decisões são tomadas pelo teste
+    pool._pid = os.getpid()
+    pool._processos = [ProcessoFalso("zip")]
+    return pool
+
+
+def esperas(pool, segundos, quantidade=20):
+    pool._esperas.extend([segundos] * quantidade)
+
+
+def test_cresce_com_fila_lenta_e_cpu_livre(pool, monkeypatch):
+    esperas(pool, 0.2)
+    assert pool.avaliar() == "cresceu"
+    assert len(pool._processos) == 2
+
+    # Processo novo ainda aquecendo: não cresce de novo
+    pool._processos[-1].aquecimento = Future()
+    esperas(pool, 0.2)
+    assert pool.avaliar() is None
+    pool._processos[-1].aquecimento.set_result(0)
+
+    # Sem CPU livre, crescer não adianta
+    monkeypatch.setattr(pool_render, "carga_por_nucleo", lambda: 1.5)
+    esperas(pool, 0.2)
+    assert pool.avaliar() is None
+    monkeypatch.setattr(pool_render, "carga_por_nucleo", lambda: 0.2)
+
+    esperas(pool, 0.2)
+    assert pool.avaliar() == "cresceu"
+    # No máximo
+    esperas(pool, 0.2)
+    assert pool.avaliar() is None
+    assert len(pool._processos) == 3
+    assert [decisao["acao"] for decisao in pool.exportar()["decisoes"]] == ["cresceu", "cresceu"]
+
+
+def test_fila_rapida_nao_cresce(pool):
+    esperas(pool, 0.01)
+    assert pool.avaliar() is None
+    assert pool.avaliar() is None
+    assert len(pool._processos) == 1
+
+
+def test_encolhe_processo_ocioso_ate_o_minimo(pool):
+    esperas(pool, 0.2)
+    pool.avaliar()
+    novo = pool._processos[-1]
+
+    # Ocupado ou ocioso há pouco tempo: fica
+    assert pool.avaliar() is None
+    novo.ocioso_desde -= 120
+    novo.pendentes = 1
+    assert pool.avaliar() is None
+
+    novo.pendentes = 0
+    assert pool.avaliar() == "encolheu"
+    assert novo.encerrado
+    assert len(pool._processos) == 1
+
+    pool._processos[0].ocioso_desde -= 120
+    assert pool.avaliar() is None
+    assert len(pool._processos) == pool.minimo
+
+
+def test_do_ambiente(monkeypatch):
+    for nome in ("RENDER_POOL_WORKERS", "RENDER_POOL_MIN", "RENDER_POOL_MAX"):
+        monkeypatch.delenv(nome, raising=False)
+    assert PoolRender.do_ambiente("zip") is None
+
+    monkeypatch.setenv("RENDER_POOL_MAX", "4")
+    pool = PoolRender.do_ambiente("zip")
+    assert (pool.minimo, pool.maximo, pool.adaptativo) == (1, 4, True)
+
+    monkeypatch.setenv("RENDER_POOL_WORKERS", "2")
+    monkeypatch.delenv("RENDER_POOL_MAX")
+    pool = PoolRender.do_ambiente("zip")
+    assert (pool.minimo, pool.maximo, pool.adaptativo) == (2, 2, False)
+
+
+def test_erro_de_render_no_processo():
+    """Falha de um item volta como ErroRender sem derrubar o processo do pool"""
+    pool = PoolRender(1, "zip")
+    try:
+        with pytest.raises(ErroRender):
+            pool.renderizar("/nao/existe.docx", {"NOME": "x"})
+        assert pool.renderizar(MODELO, {"NOME": "x"})[:2] == b"PK"
+        assert pool.exportar()["tamanho"] == 1
+    finally:
+        pool.encerrar()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Testes das respostas binárias sem cópia (resposta_arquivo.py)
+"""
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from resposta_arquivo import TAMANHO_BLOCO, RespostaArquivo, RespostaMemoria, intervalo_pedido
+
+CONTEUDO = bytes(range(256)) * ((TAMANHO_BLOCO * 2 + 100) // 256 + 1)
+ETAG = '"abc123"'
+
+
+@pytest.fixture
+def cliente(tmp_path):
+    caminho = str(tmp_path / "documento.docx")
+    with open(caminho, "wb") as f:
+        f.write(CONTEUDO)
+
+    app = FastAPI()
+
+    @app.api_route("/arquivo", methods=["GET", "HEAD", "POST"])
+    def arquivo():
+        return RespostaArquivo(caminho, media_type="application/octet-stream", filename="documento.docx", etag=ETAG)
+
+    @app.get("/nginx")
+    def nginx():
+        return RespostaArquivo(caminho, media_type="application/octet-stream", etag=ETAG, x_accel="/_armazem/ab/abc")
+
+    @app.get("/memoria")
+    def memoria():
+        return RespostaMemoria(CONTEUDO, "application/octet-stream", headers={"X-File-Size": str(len(CONTEUDO))})
+
+    with TestClient(app) as cliente:
+        yield cliente
+
+
+def test_intervalo_pedido():
+    assert intervalo_pedido(None, 100) is None
+    assert intervalo_pedido("bytes=0-9", 100) == (0, 9)
+    assert intervalo_pedido("bytes=90-", 100) == (90, 99)
+    assert intervalo_pedido("bytes=-5", 100) == (95, 99)
+    assert intervalo_pedido("bytes=50-500", 100) == (50, 99)
+    assert intervalo_pedido("bytes=100-", 100) is False
+    assert intervalo_pedido("bytes=9-0", 100) is False
+    assert intervalo_pedido("bytes=-0", 100) is False
+    # Vários intervalos não são atendidos: arquivo inteiro
+    assert intervalo_pedido("bytes=0-1,5-6", 100) is None
+
+
+def test_arquivo_inteiro_e_head(cliente):
+    resposta = cliente.get("/arquivo")
+    assert resposta.status_code == 200
+    assert resposta.content == CONTEUDO
+    assert resposta.headers["content-length"] == str(len(CONTEUDO))
+    assert resposta.headers["accept-ranges"] == "bytes"
+    assert resposta.headers["etag"] == ETAG
+    assert resposta.headers["content-disposition"] == "attachment; filename=documento.docx"
+
+    resposta = cliente.head("/arquivo")
+    assert resposta.status_code == 200
+    assert resposta.content == b""
+    assert resposta.headers["content-length"] == str(len(CONTEUDO))
+
+
+def test_range(cliente):
+    """bytes=0-9 responde 206 com Content-Range; fora do arquivo, 416"""
+    tamanho = len(CONTEUDO)
+    resposta = cliente.get("/arquivo", headers={"Range": "bytes=0-9"})
+    assert resposta.status_code == 206
+    assert resposta.headers["content-range"] == f"bytes 0-9/{tamanho}"
+    assert resposta.content == CONTEUDO[:10]
+
+    # Intervalo que atravessa blocos de leitura
+    inicio, fim = TAMANHO_BLOCO - 5, TAMANHO_BLOCO * 2 + 5
+    resposta = cliente.get("/arquivo", headers={"Range": f"bytes={inicio}-{fim}"})
+    assert resposta.status_code == 206
+    assert resposta.content == CONTEUDO[inicio:fim + 1]
+
+    resposta = cliente.get("/arquivo", headers={"Range": "bytes=-5"})
+    assert resposta.headers["content-range"] == f"bytes {tamanho - 5}-{tamanho - 1}/{tamanho}"
+    assert resposta.content == CONTEUDO[-5:]
+
+    resposta = cliente.get("/arquivo", headers={"Range": f"bytes={tamanho}-"})
+    assert resposta.status_code == 416
+    assert resposta.headers["content-range"] == f"bytes */{tamanho}"
+
+
+def test_range_ignorado(cliente):
+    """If-Range com outro ETag e POST recebem o arquivo inteiro"""
+    resposta = cliente.get("/arquivo", headers={"Range": "bytes=0-9", "If-Range": '"outro"'})
+    assert resposta.status_code == 200
+    assert resposta.content == CONTEUDO
+
+    resposta = cliente.get("/arquivo", headers={"Range": "bytes=0-9", "If-Range": ETAG})
+    assert resposta.status_code == 206
+
+    resposta = cliente.post("/arquivo", headers={"Range": "bytes=0-9"})
+    assert resposta.status_code == 200
+    assert resposta.content == CONTEUDO
+
+
+def test_x_accel(cliente):
+    """Com x_accel o corpo fica vazio e o nginx recebe o caminho interno"""
+    resposta = cliente.get("/nginx")
+    assert resposta.status_code == 200
+    assert resposta.headers["x-accel-redirect"] == "/_armazem/ab/abc"
+    assert resposta.content == b""
+
+
+def test_memoria_em_fatias(cliente):
+    resposta = cliente.get("/memoria")
+    assert resposta.status_code == 200
+    assert resposta.content == CONTEUDO
+    assert resposta.headers["content-length"] == str(len(CONTEUDO))
+    assert resposta.headers["x-file-size"] == str(len(CONTEUDO))
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Testes da serialização JSON rápida (resposta_json.py)
+"""
+
+import base64
+import json
+
+from fastapi.testclient import TestClient
+
+import main
+import resposta_json
+from resposta_json import RespostaJSONRapida, serializar_json
+
+MENSAGEM = """Nome: João Conceição
+Email: joao@exemplo.com
+CPF: 123.456.789-00
+Valor: 2.300,00
+Quantidade de Parcelas: 6
+Forma de pagamento: PIX"""
+
+CONTEUDO = {
+    "texto": "Conceição & \"aspas\" <tag> 📄",
+    "numeros": [1, 2.5, -3],
+    "vazio": None,
+    "logico": True,
+    "aninhado": {"base64": "QUJD" * 1000}
+}
+
+
+def test_serializacao_com_e_sem_orjson(monkeypatch):
+    """orjson e o json da biblioteca padrão produzem o mesmo documento, em UTF-8 sem escapes"""
+    rapido = serializar_json(CONTEUDO)
+    monkeypatch.setattr(resposta_json, "orjson", None)
+    padrao = serializar_json(CONTEUDO)
+
+    assert json.loads(rapido) == json.loads(padrao) == CONTEUDO
+    assert "Conceição".encode("utf-8") in padrao
+    assert b"\\u" not in padrao
+    assert RespostaJSONRapida(CONTEUDO).body == padrao
+
+
+def test_gerar_documento_base64():
+    """A resposta do endpoint base64 é JSON válido com o documento inteiro"""
+    with TestClient(main.app) as cliente:
+        resposta = cliente.post(
+            "/gerar-documento-base64",
+            json={"mensagem": MENSAGEM},
+            headers={"Accept-Encoding": "identity"}
+        )
+    assert resposta.status_code == 200
+    assert resposta.headers["content-type"] == "application/json"
+    corpo = resposta.json()
+    documento = base64.b64decode(corpo["base64_content"])
+    assert documento[:2] == b"PK"
+    assert corpo["file_size"] == len(documento)
+    assert corpo["dados_extraidos"]["NOME"] == "João Conceição"
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Testes do servidor pré-fork (servidor.py): sobe o mestre num subprocesso, numa
+porta livre, e conversa com os workers por HTTP
+"""
+
+import asyncio
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+import requests
+
+from servidor import AppReciclavel, LimitesReciclagem
+
+DIRETORIO = os.path.dirname(os.path.abspath(__file__))
+
+
+def porta_livre():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def iniciar_servidor(**ambiente):
+    """Sobe servidor.py e espera o /health responder; devolve (processo, url)"""
+    porta = porta_livre()
+    env = dict(os.environ, HOST="127.0.0.1", PORT=str(porta), **ambiente)
+    processo = subprocess.Popen(
+        [sys.executable, "servidor.py"], cwd=DIRETORIO, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    url = f"http://127.0.0.1:{porta}"
+    prazo = time.monotonic() + 60
+    while time.monotonic() < prazo:
+        assert processo.poll() is None, "o servidor terminou durante a subida"
+        try:
+            if requests.get(f"{url}/health", timeout=1).status_code == 200:
+                return processo, url
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    encerrar_servidor(processo)
+    raise AssertionError("o servidor não respondeu ao /health em 60s")
+
+
+def encerrar_servidor(processo):
+    """SIGTERM no mestre (drena os workers); devolve o código de saída"""
+    processo.send_signal(signal.SIGTERM)
+    try:
+        return processo.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        processo.kill()
+        processo.wait()
+        raise
+
+
+def pid_do_worker(url):
+    """pid do worker que atendeu a requisição (campo "pid" de /metrics)"""
+    return requests.get(f"{url}/metrics", timeout=10).json()["pid"]
+
+
+def test_workers_prefork():
+    """Os workers são filhos do mestre, atendem no mesmo socket e o SIGTERM encerra tudo"""
+    processo, url = iniciar_servidor(WORKERS="2")
+    try:
+        pids = {pid_do_worker(url) for _ in range(40)}
+        assert processo.pid not in pids
+        assert 1 <= len(pids) <= 2
+        for pid in pids:
+            with open(f"/proc/{pid}/stat") as arquivo:
+                assert int(arquivo.read().rsplit(")", 1)[1].split()[1]) == processo.pid
+        assert requests.get(f"{url}/ready", timeout=10).status_code == 200
+    finally:
+        codigo = encerrar_servidor(processo)
+    assert codigo == 0
+
+
+def test_app_reciclavel_avisa_o_mestre():
+    """Fim do startup vira "pronto"; passado o limite de requisições, um único "reciclar" """
+    async def app(scope, receive, send):
+        if scope["type"] == "lifespan":
+            await send({"type": "lifespan.startup.complete"})
+
+    async def receive():
+        return {}
+
+    async def send(mensagem):
+        pass
+
+    leitura, escrita = os.pipe()
+    try:
+        reciclavel = AppReciclavel(app, escrita, LimitesReciclagem(max_requisicoes=3))
+
+        async def cenario():
+            await reciclavel({"type": "lifespan"}, receive, send)
+            for _ in range(5):
+                await reciclavel({"type": "http"}, receive, send)
+
+        asyncio.run(cenario())
+        avisos = os.read(leitura, 4096).decode("ascii").splitlines()
+    finally:
+        os.close(leitura)
+        os.close(escrita)
+
+    assert avisos == [f"pronto {os.getpid()}", f"reciclar {os.getpid()}"]
+    assert reciclavel.reciclagem_pedida
+    assert reciclavel.requisicoes == 3
+
+
+def test_reciclagem_por_requisicoes():
+    """Com WORKER_MAX_REQUISICOES o worker é trocado sem nenhuma requisição falhar"""
+    processo, url = iniciar_servidor(WORKERS="1", WORKER_MAX_REQUISICOES="3")
+    try:
+        pids = []
+        for _ in range(15):
+            pids.append(pid_do_worker(url))
+            time.sleep(0.2)
+        trocas = sum(1 for anterior, atual in zip(pids, pids[1:]) if atual != anterior)
+        assert trocas >= 2
+        # Todas as 15 requisições foram atendidas, sempre por um worker (nunca pelo mestre)
+        assert len(pids) == 15
+        assert processo.pid not in pids
+    finally:
+        codigo = encerrar_servidor(processo)
+    assert codigo == 0
+
+
+if __name__ == "__main__":
+    test_workers_prefork()
+    test_app_reciclavel_avisa_o_mestre()
+    test_reciclagem_por_requisicoes()
+    print("✅ Servidor pré-fork OK")